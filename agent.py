@@ -0,0 +1,133 @@
+"""Conversational agent that answers questions from an index.
+
+langchain is imported when the first agent is built, not when this module is imported, and
+only the tools that are enabled are constructed: the search tool needs a SerpAPI key and
+the calculator its own LLM chain.
+
+Each call of the agent's own LLM, i.e. each step of its reasoning, is traced as an "agent"
+span (see tracing.py); the index queries it makes are traced as "query" spans.
+"""
+
+INDEX_TOOL = "index"
+SEARCH_TOOL = "search"
+CALCULATOR_TOOL = "calculator"
+DEFAULT_TOOLS = (INDEX_TOOL,)
+
+
+def make_index_tool(query_fn):
+    from langchain.agents import Tool
+
+    return Tool(
+        name="PDF of Gap financials and earnings",
+        func=query_fn,
+        description="PDF of financials and earnings from the company Gap filed to the SEC. If you have any question about Gap, use this tool. The input to this should be a natural language question. Always use this tool.",
+        return_direct=True
+    )
+
+
+def make_search_tool(query_fn):
+    from langchain import SerpAPIWrapper
+    from langchain.agents import Tool
+
+    return Tool(
+        name="Search",
+        func=SerpAPIWrapper().run,
+        description="Look up something not in the Gap financials PDF."
+    )
+
+
+def make_calculator_tool(query_fn):
+    from langchain import LLMMathChain
+    from langchain.agents import Tool
+    from langchain.llms import OpenAI
+
+    return Tool(
+        name="Calculator",
+        func=LLMMathChain(llm=OpenAI(temperature=0), verbose=True).run,
+        description="useful for when you need to answer questions about math"
+    )
+
+
+TOOL_FACTORIES = {
+    INDEX_TOOL: make_index_tool,
+    SEARCH_TOOL: make_search_tool,
+    CALCULATOR_TOOL: make_calculator_tool,
+}
+
+
+def make_tracing_handler():
+    """langchain callback handler that traces each LLM call as an "agent" span."""
+    from langchain.callbacks.base import BaseCallbackHandler
+
+    import tracing
+
+    class TracingHandler(BaseCallbackHandler):
+        def __init__(self):
+            self.spans = []
+
+        @property
+        def always_verbose(self):
+            return True
+
+        def on_llm_start(self, serialized, prompts, **kwargs):
+            self.spans.append(tracing.span("agent", llm=serialized.get("name")))
+
+        def on_llm_end(self, response, **kwargs):
+            span = self.spans.pop()
+            usage = (response.llm_output or {}).get("token_usage", {})
+            span.set(tokens_in=usage.get("prompt_tokens", 0),
+                     tokens_out=usage.get("completion_tokens", 0))
+            span.finish()
+
+        def on_llm_error(self, error, **kwargs):
+            span = self.spans.pop()
+            span.set(error=type(error).__name__)
+            span.finish()
+
+        def on_chain_start(self, serialized, inputs, **kwargs):
+            pass
+
+        def on_chain_end(self, outputs, **kwargs):
+            pass
+
+        def on_chain_error(self, error, **kwargs):
+            pass
+
+        def on_tool_start(self, serialized, action, **kwargs):
+            pass
+
+        def on_tool_end(self, output, **kwargs):
+            pass
+
+        def on_tool_error(self, error, **kwargs):
+            pass
+
+        def on_text(self, text, **kwargs):
+            pass
+
+        def on_agent_finish(self, finish, **kwargs):
+            pass
+
+    return TracingHandler()
+
+
+def build_agent(query_fn, tools=DEFAULT_TOOLS):
+    """A conversational agent with its own memory, using the named tools.
+
+    query_fn answers a question from the index and returns the answer as a string.
+    """
+    from langchain.agents import initialize_agent
+    from langchain.callbacks.base import CallbackManager
+    from langchain.chains.conversation.memory import ConversationBufferMemory
+    from langchain.llms import OpenAI
+
+    memory = ConversationBufferMemory(memory_key="chat_history")
+    # Verbose output comes from the chains, so the LLM only needs to report to the tracer.
+    llm = OpenAI(temperature=0, callback_manager=CallbackManager([make_tracing_handler()]))
+    return initialize_agent(
+        [TOOL_FACTORIES[name](query_fn) for name in tools],
+        llm,
+        agent="conversational-react-description",
+        memory=memory,
+        verbose=True,
+    )
@@ -0,0 +1,157 @@
+"""Approximate nearest-neighbour search for large vector indexes.
+
+IVFIndex is an inverted-file index: a spherical k-means coarse quantizer splits the
+embeddings into n_lists clusters, and a query is only scored exactly against the rows of the
+nprobe clusters whose centroids are closest to it. More lists make each probe cheaper; more
+probes raise recall at the cost of latency.
+
+The index is saved next to the vector index it was built from, as index_<name>.ivf.npz,
+and only stores centroids and row numbers: scoring uses the index's own embedding matrix.
+
+Usage:
+    python ann.py build indexes/index_www-paulgraham-com.json [n_lists]
+"""
+import json
+import os
+import sys
+
+import numpy as np
+
+ANN_EXT = ".ivf.npz"
+# Rows processed at a time while clustering, to bound memory on large matrices.
+CHUNK_SIZE = 65536
+
+
+def get_ann_path(index_path):
+    """indexes/index_bible.json -> indexes/index_bible.ivf.npz"""
+    return os.path.splitext(index_path)[0] + ANN_EXT
+
+
+def _normalize(matrix):
+    matrix = np.asarray(matrix, dtype=np.float32)
+    return matrix / np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+
+
+def _assign(embeddings, centroids):
+    """Nearest centroid of every row."""
+    labels = np.empty(len(embeddings), dtype=np.int64)
+    for start in range(0, len(embeddings), CHUNK_SIZE):
+        chunk = _normalize(embeddings[start:start + CHUNK_SIZE])
+        labels[start:start + CHUNK_SIZE] = np.argmax(chunk @ centroids.T, axis=1)
+    return labels
+
+
+def kmeans(embeddings, n_lists, n_iter=20, seed=0):
+    """Spherical k-means: centroids are unit vectors, rows are assigned by cosine similarity."""
+    rng = np.random.RandomState(seed)
+    n_lists = max(1, min(n_lists, len(embeddings)))
+    seeds = np.sort(rng.choice(len(embeddings), n_lists, replace=False))
+    centroids = _normalize(embeddings[seeds])
+    for _ in range(n_iter):
+        labels = _assign(embeddings, centroids)
+        sums = np.zeros_like(centroids)
+        for start in range(0, len(embeddings), CHUNK_SIZE):
+            chunk = _normalize(embeddings[start:start + CHUNK_SIZE])
+            np.add.at(sums, labels[start:start + CHUNK_SIZE], chunk)
+        counts = np.bincount(labels, minlength=n_lists)
+        # Re-seed empty clusters with random rows.
+        for empty in np.flatnonzero(counts == 0):
+            sums[empty] = _normalize(embeddings[rng.randint(len(embeddings))][None])[0]
+        new_centroids = _normalize(sums)
+        if np.allclose(new_centroids, centroids, atol=1e-6):
+            break
+        centroids = new_centroids
+    return centroids, _assign(embeddings, centroids)
+
+
+class IVFIndex:
+    """Coarse quantizer and inverted lists over the rows of an embedding matrix.
+
+    The rows of list i are list_rows[list_offsets[i]:list_offsets[i + 1]].
+    text_ids records which node each row was built from, so a stale index can be detected.
+    """
+
+    def __init__(self, centroids, list_offsets, list_rows, text_ids):
+        self.centroids = centroids
+        self.list_offsets = list_offsets
+        self.list_rows = list_rows
+        self.text_ids = list(text_ids)
+
+    @classmethod
+    def build(cls, embeddings, text_ids, n_lists=None, n_iter=20, seed=0):
+        """Cluster the rows of embeddings. n_lists defaults to about sqrt(count), and is at
+        most count: an index with no rows has no lists, and finds nothing."""
+        if len(embeddings) == 0:
+            embeddings = np.asarray(embeddings, dtype=np.float32)
+            dim = embeddings.shape[1] if embeddings.ndim == 2 else 0
+            return cls(np.zeros((0, dim), dtype=np.float32), np.zeros(1, dtype=np.int64),
+                       np.zeros(0, dtype=np.int64), text_ids)
+        if n_lists is None:
+            n_lists = int(round(np.sqrt(len(embeddings))))
+        n_lists = min(n_lists, len(embeddings))
+        centroids, labels = kmeans(embeddings, n_lists, n_iter, seed)
+        list_rows = np.argsort(labels, kind="stable").astype(np.int64)
+        list_offsets = np.zeros(len(centroids) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(labels, minlength=len(centroids)), out=list_offsets[1:])
+        return cls(centroids, list_offsets, list_rows, text_ids)
+
+    @property
+    def n_lists(self):
+        return len(self.centroids)
+
+    def probe(self, query, nprobe):
+        """Row numbers in the nprobe lists closest to a normalized query."""
+        if not self.n_lists:
+            return np.zeros(0, dtype=np.int64)
+        nprobe = min(nprobe, self.n_lists)
+        centroid_scores = self.centroids @ query
+        if nprobe < self.n_lists:
+            lists = np.argpartition(-centroid_scores, nprobe - 1)[:nprobe]
+        else:
+            lists = np.arange(self.n_lists)
+        return np.concatenate(
+            [self.list_rows[self.list_offsets[i]:self.list_offsets[i + 1]] for i in lists]
+        )
+
+    def save(self, path):
+        with open(path + ".tmp", "wb") as f:
+            np.savez(f, centroids=self.centroids, list_offsets=self.list_offsets,
+                     list_rows=self.list_rows, text_ids=np.asarray(self.text_ids, dtype=str))
+        os.replace(path + ".tmp", path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(data["centroids"], data["list_offsets"], data["list_rows"],
+                       data["text_ids"].tolist())
+
+
+def build_for_index_struct(index_struct, index_path, n_lists=None):
+    """Build and save the IVF index of a SimpleIndexDict that is saved at index_path."""
+    return _build_and_save(index_struct.embedding_dict, index_path, n_lists)
+
+
+def build_for_index_path(index_path, n_lists=None):
+    """Build and save the IVF index of a GPTSimpleVectorIndex JSON file."""
+    with open(index_path) as f:
+        index_struct = json.load(f)["index_struct"]
+    if "embedding_dict" not in index_struct:
+        raise ValueError(f"{index_path} is not a vector index: it has no embeddings.")
+    return _build_and_save(index_struct["embedding_dict"], index_path, n_lists)
+
+
+def _build_and_save(embedding_dict, index_path, n_lists):
+    text_ids = list(embedding_dict.keys())
+    embeddings = np.asarray([embedding_dict[t] for t in text_ids], dtype=np.float32)
+    ann = IVFIndex.build(embeddings, text_ids, n_lists)
+    ann.save(get_ann_path(index_path))
+    return ann
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3 or sys.argv[1] != "build":
+        print(__doc__)
+        sys.exit(1)
+    n_lists = int(sys.argv[3]) if len(sys.argv) > 3 else None
+    ann = build_for_index_path(sys.argv[2], n_lists)
+    print(f"built {get_ann_path(sys.argv[2])}: {ann.n_lists} lists over {len(ann.text_ids)} rows")
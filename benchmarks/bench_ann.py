@@ -0,0 +1,97 @@
+"""Recall@k and latency of the IVF index (ann.py) against exact search (retrieval.py).
+
+Runs on every vector index in indexes/, using noisy copies of node embeddings as queries,
+and on a synthetic clustered corpus large enough for the coarse quantizer to matter.
+
+Usage: python benchmarks/bench_ann.py [--k 10] [--synthetic-rows 50000] [--dim 256]
+"""
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+REPO_DIR = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+sys.path.append(REPO_DIR)
+import ann
+from retrieval import VectorRetriever
+
+NPROBES = [1, 2, 4, 8, 16, 32]
+
+
+def load_embeddings(index_path):
+    with open(index_path) as f:
+        index_struct = json.load(f)["index_struct"]
+    if "embedding_dict" not in index_struct:
+        return None
+    return np.asarray(list(index_struct["embedding_dict"].values()), dtype=np.float32)
+
+
+def synthetic_embeddings(rows, dim, n_clusters=200, seed=0):
+    rng = np.random.RandomState(seed)
+    centers = rng.randn(n_clusters, dim).astype(np.float32)
+    labels = rng.randint(n_clusters, size=rows)
+    return centers[labels] + 1.5 * rng.randn(rows, dim).astype(np.float32)
+
+
+def make_queries(embeddings, n_queries, seed=1):
+    rng = np.random.RandomState(seed)
+    picked = embeddings[rng.randint(len(embeddings), size=n_queries)]
+    return picked + 0.1 * np.std(embeddings) * rng.randn(*picked.shape).astype(np.float32)
+
+
+def per_query_ms(retriever, queries, k):
+    start = time.perf_counter()
+    for query in queries:
+        retriever.top_k_batch([query], k)
+    return 1000 * (time.perf_counter() - start) / len(queries)
+
+
+def evaluate(embeddings, k, n_queries=200, n_lists=None):
+    ids = list(range(len(embeddings)))
+    retriever = VectorRetriever(embeddings, ids, get_nodes=None)
+    queries = make_queries(embeddings, n_queries)
+    _, exact_rows = retriever.top_k_batch(queries, k)
+    result = {"rows": len(embeddings), "exact_ms": round(per_query_ms(retriever, queries, k), 3)}
+
+    start = time.perf_counter()
+    retriever.set_ann(ann.IVFIndex.build(embeddings, ids, n_lists))
+    result["build_s"] = round(time.perf_counter() - start, 2)
+    result["n_lists"] = retriever.ann.n_lists
+    result["nprobe"] = {}
+    for nprobe in NPROBES:
+        if nprobe > retriever.ann.n_lists:
+            break
+        retriever.nprobe = nprobe
+        _, ann_rows = retriever.top_k_batch(queries, k)
+        k_found = exact_rows.shape[1]
+        recall = np.mean([len(set(a) & set(e)) / k_found for a, e in zip(ann_rows, exact_rows)])
+        result["nprobe"][nprobe] = {
+            "recall": round(float(recall), 4),
+            "ms": round(per_query_ms(retriever, queries, k), 3),
+        }
+    return result
+
+
+def run(k, synthetic_rows, dim):
+    results = {}
+    for path in sorted(glob.glob(os.path.join(REPO_DIR, "indexes", "index_*.json"))):
+        embeddings = load_embeddings(path)
+        if embeddings is not None and len(embeddings) > 1:
+            results[os.path.basename(path)] = evaluate(embeddings, k)
+    if synthetic_rows:
+        results[f"synthetic_{synthetic_rows}x{dim}"] = evaluate(
+            synthetic_embeddings(synthetic_rows, dim), k)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--synthetic-rows", type=int, default=50000)
+    parser.add_argument("--dim", type=int, default=256)
+    args = parser.parse_args()
+    print(json.dumps(run(args.k, args.synthetic_rows, args.dim), indent=2))
@@ -0,0 +1,127 @@
+"""Latency and size of BM25 keyword retrieval (bm25.py) against vector retrieval (retrieval.py).
+
+Runs on every vector index in indexes/. Queries are the README questions plus questions made
+of words drawn from random nodes. Vector retrieval is timed from the query embedding on, i.e.
+the matrix product and top-k; the embedding request it needs first (one API call per
+question, typically 100ms or more) is counted but not timed. Keyword retrieval makes no API
+call at all.
+
+Usage: python benchmarks/bench_bm25.py [--k 2] [--queries 200]
+"""
+import argparse
+import glob
+import json
+import os
+import re
+import sys
+import time
+
+import numpy as np
+
+REPO_DIR = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+sys.path.append(REPO_DIR)
+import bm25
+from llm_scheduler import FakeBackend
+from retrieval import VectorRetriever
+
+README_QUESTIONS = [
+    "What is Gap's earnings per share?",
+    "How many net sales did Gap have in quarter 3?",
+    "What is Gap's profit?",
+    "What are the main takeaways from the report?",
+    "What are some risks that Gap might have?",
+]
+
+
+def sample_questions(texts, n, seed=0):
+    """Questions of 3-6 words taken from random nodes."""
+    rng = np.random.RandomState(seed)
+    questions = []
+    for _ in range(n):
+        words = re.findall(r"[A-Za-z]{3,}", texts[rng.randint(len(texts))]) or ["nothing"]
+        questions.append(" ".join(rng.choice(words, size=rng.randint(3, 7))))
+    return questions
+
+
+def percentiles_ms(seconds):
+    ms = 1000 * np.asarray(seconds)
+    return {"p50": round(float(np.percentile(ms, 50)), 4),
+            "p95": round(float(np.percentile(ms, 95)), 4)}
+
+
+def evaluate(index_path, k, n_queries):
+    with open(index_path) as f:
+        index_struct = json.load(f)["index_struct"]
+    if "embedding_dict" not in index_struct:
+        return None
+    text_ids, texts = bm25.node_texts(index_struct)
+    embeddings = np.asarray([index_struct["embedding_dict"][t] for t in text_ids],
+                            dtype=np.float32)
+    retriever = VectorRetriever(embeddings, text_ids, get_nodes=None)
+
+    start = time.perf_counter()
+    keywords = bm25.BM25Index.build(texts, text_ids)
+    build_s = time.perf_counter() - start
+    path = bm25.get_bm25_path(index_path) + ".bench"
+    keywords.save(path)
+    npz_bytes = os.path.getsize(path)
+    start = time.perf_counter()
+    bm25.BM25Index.load(path)
+    load_s = time.perf_counter() - start
+    os.remove(path)
+
+    questions = README_QUESTIONS + sample_questions(texts, n_queries)
+    # Stand-in query embeddings: vector retrieval cost does not depend on their values.
+    fake = FakeBackend(dim=embeddings.shape[1])
+    query_embeddings = [fake.embedding(q) for q in questions]
+
+    keyword_times, vector_times, hits = [], [], 0
+    for question, query_embedding in zip(questions, query_embeddings):
+        start = time.perf_counter()
+        scores, rows = keywords.top_k(question, k)
+        keyword_times.append(time.perf_counter() - start)
+        hits += len(rows) > 0
+        start = time.perf_counter()
+        retriever.top_k_batch([query_embedding], k)
+        vector_times.append(time.perf_counter() - start)
+
+    readme = {}
+    for question in README_QUESTIONS:
+        scores, rows = keywords.top_k(question, 1)
+        readme[question] = (
+            {"score": round(float(scores[0]), 3),
+             "text": " ".join(texts[rows[0]].split())[:100]} if len(rows) else None)
+
+    return {
+        "nodes": len(texts),
+        "terms": len(keywords.terms),
+        "postings": len(keywords.postings_rows),
+        "bm25_bytes": npz_bytes,
+        "embedding_bytes": embeddings.nbytes,
+        "json_bytes": os.path.getsize(index_path),
+        "bm25_build_s": round(build_s, 3),
+        "bm25_load_s": round(load_s, 4),
+        "queries": len(questions),
+        "queries_with_keyword_hits": hits,
+        "keyword_ms": percentiles_ms(keyword_times),
+        "vector_scan_ms": percentiles_ms(vector_times),
+        "embedding_calls": {"keyword": 0, "vector": len(questions)},
+        "readme_top_keyword_hit": readme,
+    }
+
+
+def run(k=2, n_queries=200):
+    results = {}
+    for index_path in sorted(glob.glob(os.path.join(REPO_DIR, "indexes", "*.json"))):
+        result = evaluate(index_path, k, n_queries)
+        if result is not None:
+            results[os.path.basename(index_path)] = result
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--k", type=int, default=2)
+    parser.add_argument("--queries", type=int, default=200)
+    args = parser.parse_args()
+    print(json.dumps(run(args.k, args.queries), indent=2))
@@ -0,0 +1,86 @@
+"""Benchmark chunker.Chunker against the splitters it replaced.
+
+The input is the Jefferson Bible source (the documents of indexes/index_bible.json), repeated
+--scale times, so throughput at growing sizes shows whether splitting stays linear.
+Compared with gpt_index's TokenTextSplitter, which chunked documents when building indexes,
+and the 200-character line loop create_training_data used.
+
+Usage: python benchmarks/bench_chunker.py [--scales 1,4,16] [--max-tokens 1024] [--overlap 128]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from gpt_index.langchain_helpers.text_splitter import TokenTextSplitter
+
+from chunker import DEFAULT_ENCODING, Chunker
+
+REPO_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+BIBLE_INDEX = os.path.join(REPO_DIR, "indexes", "index_bible.json")
+
+
+def load_text():
+    with open(BIBLE_INDEX) as f:
+        docs = json.load(f)["docstore"]["docs"]
+    return "\n\n".join(doc["text"] for doc in docs.values() if doc.get("text"))
+
+
+def old_qa_chunks(text):
+    """What create_training_data did before: add lines until a chunk passes 200 characters."""
+    chunks = []
+    chunk = ""
+    for line in text.splitlines(keepends=True):
+        chunk += line
+        if len(chunk) > 200:
+            chunks.append(chunk)
+            chunk = ""
+    return chunks
+
+
+def time_it(fn, text):
+    start = time.perf_counter()
+    chunks = fn(text)
+    return time.perf_counter() - start, chunks
+
+
+def run(scales=(1, 4, 16), max_tokens=1024, overlap=128, encoding=DEFAULT_ENCODING):
+    source = load_text()
+    chunker = Chunker(max_tokens, overlap, encoding)
+    splitters = {
+        "chunker": chunker.split_text,
+        "gpt_index_token_splitter":
+            TokenTextSplitter(chunk_size=max_tokens, chunk_overlap=overlap).split_text,
+        "old_qa_loop": old_qa_chunks,
+    }
+    results = {"max_tokens": max_tokens, "overlap_tokens": overlap, "encoding": encoding,
+               "runs": []}
+    for scale in scales:
+        text = source * scale
+        megabytes = len(text.encode("utf-8")) / 1e6
+        run_results = {"scale": scale, "megabytes": round(megabytes, 3)}
+        for name, split in splitters.items():
+            seconds, chunks = time_it(split, text)
+            run_results[name] = {
+                "seconds": round(seconds, 4),
+                "mb_per_s": round(megabytes / seconds, 2),
+                "chunks": len(chunks),
+            }
+        # Largest chunk, re-counted on the joined text.
+        run_results["chunker"]["max_chunk_tokens"] = max(
+            chunker.count_tokens(chunk) for chunk in chunker.split_text(text))
+        results["runs"].append(run_results)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scales", default="1,4,16")
+    parser.add_argument("--max-tokens", type=int, default=1024)
+    parser.add_argument("--overlap", type=int, default=128)
+    parser.add_argument("--encoding", default=DEFAULT_ENCODING)
+    args = parser.parse_args()
+    scales = [int(s) for s in args.scales.split(",")]
+    print(json.dumps(run(scales, args.max_tokens, args.overlap, args.encoding), indent=2))
@@ -0,0 +1,91 @@
+"""Benchmark html_text.extract against the old BeautifulSoup html.parser path.
+
+The saved pages under webpages/ are already plain text, so each one is wrapped back into an
+HTML page (paragraphs, a nav bar of links, inline script and style) before timing.
+Pass --html-dir to time real .html files instead.
+
+Usage: python benchmarks/bench_extract.py [--html-dir DIR] [--repeat N]
+"""
+import argparse
+import html
+import json
+import os
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from bs4 import BeautifulSoup
+
+import html_text
+
+REPO_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+PAGE_DIRS = ["webpages", "docu_fine/webpages"]
+
+
+def wrap_as_html(text, n_links=200):
+    """Build an HTML page around a saved text page."""
+    nav = "".join('<li><a href="/page-%d.html">Page %d</a></li>' % (i, i) for i in range(n_links))
+    paragraphs = "".join("<p>%s</p>\n" % html.escape(p) for p in text.split("\n\n") if p.strip())
+    return (
+        "<html><head><title>Saved page</title>"
+        "<style>body { font-family: sans-serif; } .nav li { display: inline; }</style>"
+        "<script>window.dataLayer = window.dataLayer || []; function gtag(){}</script>"
+        "</head><body><ul class=\"nav\">%s</ul><div class=\"content\">%s</div>"
+        "<script>gtag('config', 'UA-0');</script></body></html>" % (nav, paragraphs)
+    )
+
+
+def load_pages(html_dir=None):
+    pages = []
+    if html_dir is not None:
+        for root, _, files in os.walk(html_dir):
+            for name in sorted(files):
+                if name.endswith((".html", ".htm")):
+                    with open(os.path.join(root, name), errors="ignore") as f:
+                        pages.append(f.read())
+        return pages
+    for page_dir in PAGE_DIRS:
+        for root, _, files in os.walk(os.path.join(REPO_DIR, page_dir)):
+            for name in sorted(files):
+                if name.endswith(".txt"):
+                    with open(os.path.join(root, name), errors="ignore") as f:
+                        pages.append(wrap_as_html(f.read()))
+    return pages
+
+
+def old_path(page):
+    """What crawler.py did before: one parse for the text, a second one for the links."""
+    text = BeautifulSoup(page, "html.parser").get_text().strip()
+    links = [link.get("href") for link in BeautifulSoup(page, "html.parser").find_all("a")]
+    return text, links
+
+
+def time_it(fn, pages, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for page in pages:
+            fn(page)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def run(html_dir=None, repeat=3):
+    pages = load_pages(html_dir)
+    total_mb = sum(len(p.encode("utf-8")) for p in pages) / 1e6
+    results = {"pages": len(pages), "megabytes": round(total_mb, 3)}
+    for name, fn in [("beautifulsoup", old_path), ("html_text", html_text.extract)]:
+        seconds = time_it(fn, pages, repeat)
+        results[name] = {"seconds": round(seconds, 4), "mb_per_s": round(total_mb / seconds, 2)}
+        # Characters of text we would later pay to embed.
+        results[name]["text_chars"] = sum(len(fn(p)[0]) for p in pages)
+    results["speedup"] = round(results["beautifulsoup"]["seconds"] / results["html_text"]["seconds"], 2)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--html-dir", default=None)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    print(json.dumps(run(args.html_dir, args.repeat), indent=2))
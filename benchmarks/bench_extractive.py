@@ -0,0 +1,108 @@
+"""LLM calls and latency saved by extractive answers on the README questions.
+
+Each question is asked of a vector index twice: as the apps used to ask it (vector
+retrieval, response_mode="tree_summarize"), and as they ask it now (hybrid retrieval and
+response_mode="extractive", which falls back to tree_summarize below the confidence
+threshold). Completions go through a FakeBackend that takes --llm-latency seconds per call,
+standing in for the API, so the saving is counted in calls and simulated seconds; with
+--backend openai the real API is used for embeddings and completions.
+
+Usage: python benchmarks/bench_extractive.py [--index indexes/index_gap_earnings.json]
+           [--llm-latency 2.0] [--threshold 0.75] [--backend fake|openai]
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+REPO_DIR = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+sys.path.append(REPO_DIR)
+os.environ.setdefault("OPENAI_API_KEY", "sk-bench")
+import index_catalog
+from embedding_cache import CachedOpenAIEmbedding, EmbeddingCache
+from llm_scheduler import FakeBackend, OpenAIBackend, ScheduledLLMPredictor, Scheduler
+from retrieval import FastVectorIndex
+
+README_QUESTIONS = [
+    "What is Gap's earnings per share?",
+    "How many net sales did Gap have in quarter 3?",
+    "What is Gap's profit?",
+    "What are the main takeaways from the report?",
+    "What are some risks that Gap might have?",
+]
+BEFORE = {"mode": "default", "response_mode": "tree_summarize"}
+
+
+def ask(index, predictor, scheduler, question, query_kwargs):
+    requests = scheduler.stats["requests"]
+    start = time.perf_counter()
+    response = index.query(question, llm_predictor=predictor, **query_kwargs)
+    return {
+        "seconds": round(time.perf_counter() - start, 3),
+        "llm_calls": scheduler.stats["requests"] - requests,
+        "extractive": bool((response.extra_info or {}).get("extractive")),
+        "confidence": round((response.extra_info or {}).get("confidence", 0.0), 3),
+        "answer": " ".join(str(response).split())[:160],
+    }
+
+
+def run(index_path, llm_latency=2.0, threshold=0.75, backend="fake"):
+    if backend == "fake":
+        # Only completions are slowed down: query embeddings are cached after the first
+        # question, so charging them latency would favour whichever mode runs second.
+        backend, embed_backend = FakeBackend(latency=llm_latency), FakeBackend()
+    else:
+        backend = embed_backend = OpenAIBackend()
+    completions = Scheduler(backend)
+    # Query embeddings come from their own scheduler, so only completions are counted.
+    embeddings = Scheduler(embed_backend)
+    with tempfile.TemporaryDirectory() as cache_dir:
+        embed_model = CachedOpenAIEmbedding(
+            cache=EmbeddingCache(os.path.join(cache_dir, "embeddings.sqlite")),
+            scheduler=embeddings)
+        index = FastVectorIndex.load_from_disk(index_path, embed_model=embed_model)
+        index.load_bm25(index_path)
+        predictor = ScheduledLLMPredictor(scheduler=completions)
+        after = dict(index_catalog.query_kwargs(index_path, extractive=True),
+                     extractive_threshold=threshold)
+
+        questions = {}
+        for question in README_QUESTIONS:
+            questions[question] = {
+                "before": ask(index, predictor, completions, question, BEFORE),
+                "after": ask(index, predictor, completions, question, after),
+            }
+
+    totals = {
+        when: {
+            "llm_calls": sum(q[when]["llm_calls"] for q in questions.values()),
+            "seconds": round(sum(q[when]["seconds"] for q in questions.values()), 3),
+        }
+        for when in ("before", "after")
+    }
+    return {
+        "index": os.path.relpath(index_path, REPO_DIR),
+        "llm_latency_s": llm_latency if isinstance(backend, FakeBackend) else None,
+        "threshold": threshold,
+        "after_query_kwargs": after,
+        "answered_extractively": sum(q["after"]["extractive"] for q in questions.values()),
+        "questions": questions,
+        "totals": totals,
+        "saved": {
+            "llm_calls": totals["before"]["llm_calls"] - totals["after"]["llm_calls"],
+            "seconds": round(totals["before"]["seconds"] - totals["after"]["seconds"], 3),
+        },
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--index", default=os.path.join(REPO_DIR, "indexes",
+                                                        "index_gap_earnings.json"))
+    parser.add_argument("--llm-latency", type=float, default=2.0)
+    parser.add_argument("--threshold", type=float, default=0.75)
+    parser.add_argument("--backend", choices=["fake", "openai"], default="fake")
+    args = parser.parse_args()
+    print(json.dumps(run(args.index, args.llm_latency, args.threshold, args.backend), indent=2))
@@ -0,0 +1,84 @@
+"""Cold start and peak RSS of loading each vector index: JSON vs index_store's mmap format.
+
+Each measurement runs in a fresh interpreter, so imports and caches do not carry over.
+The JSON path uses GPTSimpleVectorIndex.load_from_disk when gpt_index can be loaded offline,
+and falls back to json.load (a lower bound for it) otherwise.
+
+Usage: python benchmarks/bench_index_load.py [indexes/index_pmarchive-com.json ...]
+"""
+import glob
+import json
+import os
+import subprocess
+import sys
+
+REPO_DIR = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+sys.path.append(REPO_DIR)
+import index_store
+
+# Each snippet prints the load time in seconds and peak RSS in MB of its own process.
+PRELUDE = """
+import json, resource, sys, time
+sys.path.append(%r)
+import numpy as np
+start = time.perf_counter()
+"""
+REPORT = """
+seconds = time.perf_counter() - start
+print(json.dumps({"seconds": seconds, "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024}))
+"""
+LOAD_JSON = """
+try:
+    from gpt_index import GPTSimpleVectorIndex
+    index = GPTSimpleVectorIndex.load_from_disk(%(path)r)
+    loader = "GPTSimpleVectorIndex.load_from_disk"
+except Exception:
+    start = time.perf_counter()
+    with open(%(path)r) as f:
+        index = json.load(f)
+    loader = "json.load"
+"""
+LOAD_MMAP = """
+import index_store
+store = index_store.MmapVectorStore.from_index_path(%(path)r)
+# Touch what a query touches: score every row, then read the top 3 texts.
+scores = store.embeddings @ np.ones(store.dim, dtype=np.float32)
+texts = store.get_texts(np.argsort(-scores)[:3])
+loader = "MmapVectorStore"
+"""
+
+
+def measure(snippet, path):
+    code = PRELUDE % REPO_DIR + snippet % {"path": path} + REPORT + "print(json.dumps(loader))"
+    env = dict(os.environ)
+    env.setdefault("OPENAI_API_KEY", "offline-benchmark")
+    out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True,
+                         env=env, check=True).stdout.strip().splitlines()
+    result = json.loads(out[-2])
+    result["loader"] = json.loads(out[-1])
+    return result
+
+
+def run(paths):
+    results = {}
+    for path in paths:
+        if not index_store.has_store(path):
+            try:
+                index_store.convert(path)
+            except ValueError:
+                continue
+        json_result = measure(LOAD_JSON, path)
+        mmap_result = measure(LOAD_MMAP, path)
+        results[os.path.basename(path)] = {
+            "json_mb": round(os.path.getsize(path) / 1e6, 2),
+            "json": json_result,
+            "mmap": mmap_result,
+            "speedup": round(json_result["seconds"] / mmap_result["seconds"], 1),
+        }
+    return results
+
+
+if __name__ == "__main__":
+    paths = sys.argv[1:] or sorted(glob.glob(os.path.join(REPO_DIR, "indexes", "index_*.json")))
+    paths = [p for p in paths if not p.endswith((".manifest.json", index_store.META_EXT))]
+    print(json.dumps(run(paths), indent=2))
@@ -0,0 +1,119 @@
+"""Size, latency and recall@k of quantized embeddings (quantize.py) against exact search.
+
+Runs on every vector index in indexes/, using noisy copies of node embeddings as queries,
+and on a synthetic clustered corpus with the dimension of text-embedding-ada-002, large
+enough for scoring to dominate a query. For float16 and int8, with quantized scores alone
+(rescore 0) and with the best rescore * k candidates rescored at full precision, it reports
+the bytes of the quantized matrix against the float32 one (and the JSON index file), the
+latency of one query and of a batch, and recall@k against exact search.
+
+Usage: python benchmarks/bench_quantize.py [--k 10] [--synthetic-rows 20000] [--dim 1536]
+"""
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+REPO_DIR = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+sys.path.append(REPO_DIR)
+import quantize
+from retrieval import VectorRetriever
+
+RESCORES = [0, 1, 4]
+BATCH = 32
+
+
+def load_embeddings(index_path):
+    with open(index_path) as f:
+        index_struct = json.load(f)["index_struct"]
+    if "embedding_dict" not in index_struct:
+        return None
+    return np.asarray(list(index_struct["embedding_dict"].values()), dtype=np.float32)
+
+
+def synthetic_embeddings(rows, dim, n_clusters=200, seed=0):
+    rng = np.random.RandomState(seed)
+    centers = rng.randn(n_clusters, dim).astype(np.float32)
+    labels = rng.randint(n_clusters, size=rows)
+    return centers[labels] + 1.5 * rng.randn(rows, dim).astype(np.float32)
+
+
+def make_queries(embeddings, n_queries, seed=1):
+    rng = np.random.RandomState(seed)
+    picked = embeddings[rng.randint(len(embeddings), size=n_queries)]
+    return picked + 0.1 * np.std(embeddings) * rng.randn(*picked.shape).astype(np.float32)
+
+
+def per_query_ms(retriever, queries, k):
+    start = time.perf_counter()
+    for query in queries:
+        retriever.top_k_batch([query], k)
+    return 1000 * (time.perf_counter() - start) / len(queries)
+
+
+def batch_ms(retriever, queries, k):
+    start = time.perf_counter()
+    retriever.top_k_batch(queries[:BATCH], k)
+    return 1000 * (time.perf_counter() - start)
+
+
+def evaluate(embeddings, k, n_queries=100, file_bytes=None):
+    ids = list(range(len(embeddings)))
+    embeddings = embeddings / np.maximum(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12)
+    retriever = VectorRetriever(embeddings, ids, get_nodes=None, normalized=True)
+    queries = make_queries(embeddings, n_queries)
+    _, exact_rows = retriever.top_k_batch(queries, k)
+    result = {
+        "rows": len(embeddings),
+        "float32_bytes": embeddings.nbytes,
+        "exact_ms": round(per_query_ms(retriever, queries, k), 3),
+        "exact_batch_ms": round(batch_ms(retriever, queries, k), 3),
+    }
+    if file_bytes is not None:
+        result["json_bytes"] = file_bytes
+    for dtype in quantize.DTYPES:
+        quantized = quantize.QuantizedMatrix.build(embeddings, ids, dtype)
+        retriever.set_quantized(quantized)
+        result[dtype] = {
+            "bytes": quantized.nbytes,
+            "size_ratio": round(quantized.nbytes / embeddings.nbytes, 3),
+            "rescore": {},
+        }
+        for rescore in RESCORES:
+            retriever.rescore = rescore
+            _, rows = retriever.top_k_batch(queries, k)
+            k_found = exact_rows.shape[1]
+            recall = np.mean([len(set(a) & set(e)) / k_found for a, e in zip(rows, exact_rows)])
+            result[dtype]["rescore"][rescore] = {
+                "recall": round(float(recall), 4),
+                "ms": round(per_query_ms(retriever, queries, k), 3),
+                "batch_ms": round(batch_ms(retriever, queries, k), 3),
+            }
+        retriever.quantized = None
+    return result
+
+
+def run(k, synthetic_rows, dim):
+    results = {}
+    for path in sorted(glob.glob(os.path.join(REPO_DIR, "indexes", "index_*.json"))):
+        embeddings = load_embeddings(path)
+        if embeddings is not None and len(embeddings) > 1:
+            results[os.path.basename(path)] = evaluate(embeddings, k,
+                                                       file_bytes=os.path.getsize(path))
+    if synthetic_rows:
+        results[f"synthetic_{synthetic_rows}x{dim}"] = evaluate(
+            synthetic_embeddings(synthetic_rows, dim), k)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--synthetic-rows", type=int, default=20000)
+    parser.add_argument("--dim", type=int, default=1536)
+    args = parser.parse_args()
+    print(json.dumps(run(args.k, args.synthetic_rows, args.dim), indent=2))
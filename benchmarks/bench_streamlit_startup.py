@@ -0,0 +1,119 @@
+"""Benchmark the Streamlit app's cold start and per-question overhead.
+
+Cold start: a fresh interpreter imports what streamlit_main.py imported at the top before
+(gpt_index, langchain, SerpAPI, the crawler, ...) and what it imports now, before the first
+paint. Modules that are not installed (e.g. streamlit in a headless environment) are left
+out of both.
+
+Per question: the old app rebuilt SerpAPIWrapper, LLMMathChain, the OpenAI clients and the
+agent on every rerun; now the agent is built once per session and index (agent.py).
+
+Usage: python benchmarks/bench_streamlit_startup.py [--repeat N]
+"""
+import argparse
+import importlib.util
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+REPO_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.append(REPO_DIR)
+
+OLD_IMPORTS = [
+    "streamlit", "streamlit_chat", "gpt_index", "langchain.agents",
+    "langchain.chains.conversation.memory", "langchain.chains", "langchain.llms", "langchain",
+    "crawler", "data_loader", "embedding_cache", "index_store", "retrieval",
+]
+NEW_IMPORTS = ["streamlit", "streamlit_chat", "index_catalog", "index_manager"]
+
+
+def installed(module):
+    try:
+        return importlib.util.find_spec(module) is not None
+    except ModuleNotFoundError:
+        return False
+
+
+def import_seconds(modules):
+    """Seconds a fresh interpreter takes to import modules, after its own startup."""
+    code = (
+        "import time; start = time.perf_counter()\n"
+        + "".join(f"import {m}\n" for m in modules)
+        + "print(time.perf_counter() - start)"
+    )
+    env = dict(os.environ, OPENAI_API_KEY=os.getenv("OPENAI_API_KEY", "sk-bench"))
+    result = subprocess.run([sys.executable, "-c", code], cwd=REPO_DIR, env=env,
+                            capture_output=True, text=True, check=True)
+    return float(result.stdout.strip().splitlines()[-1])
+
+
+def old_load_chain(query_fn):
+    """What streamlit_main.load_chain built on every rerun."""
+    from langchain import LLMMathChain, SerpAPIWrapper
+    from langchain.agents import Tool, initialize_agent
+    from langchain.chains.conversation.memory import ConversationBufferMemory
+    from langchain.llms import OpenAI
+
+    search_error = None
+    try:
+        SerpAPIWrapper()
+    except Exception as e:  # The old app failed here without google-search-results.
+        search_error = str(e).splitlines()[-1]
+    llm = OpenAI(temperature=0)
+    LLMMathChain(llm=llm, verbose=True)
+    tools = [Tool(name="PDF of Gap financials and earnings", func=query_fn,
+                  description="PDF of Gap financials.", return_direct=True)]
+    memory = ConversationBufferMemory(memory_key="chat_history")
+    llm = OpenAI(temperature=0)
+    initialize_agent(tools, llm, agent="conversational-react-description", memory=memory,
+                     verbose=True)
+    return search_error
+
+
+def run(repeat=5):
+    os.environ.setdefault("OPENAI_API_KEY", "sk-bench")
+    old_modules = [m for m in OLD_IMPORTS if installed(m.split(".")[0])]
+    new_modules = [m for m in NEW_IMPORTS if installed(m)]
+    results = {
+        "skipped_modules": sorted({m.split(".")[0] for m in OLD_IMPORTS} - {
+            m.split(".")[0] for m in old_modules}),
+        "cold_import_seconds": {
+            "before": round(statistics.median(import_seconds(old_modules)
+                                              for _ in range(repeat)), 4),
+            "after": round(statistics.median(import_seconds(new_modules)
+                                             for _ in range(repeat)), 4),
+        },
+    }
+
+    import agent
+
+    old_times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        search_error = old_load_chain(str)
+        old_times.append(time.perf_counter() - start)
+    start = time.perf_counter()
+    chains = {"index": agent.build_agent(str)}
+    first = time.perf_counter() - start
+    start = time.perf_counter()
+    for _ in range(repeat):
+        chains.get("index")
+    cached = (time.perf_counter() - start) / repeat
+    results["per_question_setup_seconds"] = {
+        "before_every_question": round(statistics.median(old_times), 4),
+        "after_first_question": round(first, 4),
+        "after_later_questions": round(cached, 7),
+    }
+    if search_error:
+        results["before_search_tool_error"] = search_error
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    print(json.dumps(run(args.repeat), indent=2))
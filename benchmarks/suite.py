@@ -0,0 +1,495 @@
+"""Offline benchmark suite: loading indexes, answering questions, crawling, extracting text and
+building indexes, reported as one JSON document that can be compared run over run.
+
+Sections, each run in a fresh interpreter so that its peak RSS is its own and no import or
+cache carries over from another:
+
+    load_index      index_catalog.load_index of every index in indexes/
+    query           latency percentiles of questions to each index in indexes/, through the
+                    stream_query call that streamlit_main.query_index makes (query_index
+                    itself only runs inside `streamlit run`)
+    federated       federated.federated_query over every index in indexes/: retrieval wall
+                    time with one thread per index and with one thread for all, beside the
+                    slowest single index and the sum of them, for indexes loaded in process
+                    and served by an index server; and whole-query latency
+    crawl           pages/s of Crawler.crawl, a re-crawl with the HTTP cache, and
+                    Crawler.crawl_async, over a site generated and served on localhost
+    save_page       text extraction throughput (html_text.extract) and Crawler.save_page
+                    pages/s on the same site
+    create_index    data_loader.create_index build time: tree, incremental vector, and an
+                    incremental run with nothing changed
+
+Nothing goes over the network. Completions and embeddings come from llm_scheduler.FakeBackend
+(LLM_BACKEND=fake), which is deterministic; --llm-latency makes each of its requests take that
+long. The embedding and document caches start empty in a temporary folder. The chunker and
+gpt_index count tokens with chunker.WordEncoding instead of tiktoken, which would download its
+encodings (see chunker.use_offline_encoding). A section that fails reports its error, the
+others still run, and the suite exits with status 1.
+
+Every section reports seconds and peak_rss_mb. With --baseline, each number is also divided
+by the same number in an earlier report, under "vs_baseline".
+
+Usage: python benchmarks/suite.py
+           [--sections load_index,query,federated,crawl,save_page,create_index]
+           [--output report.json] [--baseline previous.json] [--queries 20] [--pages 200]
+           [--documents 40] [--llm-latency 0]
+"""
+import argparse
+import contextlib
+import functools
+import html
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+REPO_DIR = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+sys.path.append(REPO_DIR)
+
+INDEX_DIR = os.path.join(REPO_DIR, "indexes")
+# Source of the generated site and documents: the Jefferson Bible, as indexed.
+CORPUS_INDEX = os.path.join(INDEX_DIR, "index_bible.json")
+README_QUESTIONS = [
+    "What is Gap's earnings per share?",
+    "How many net sales did Gap have in quarter 3?",
+    "What is Gap's profit?",
+    "What are the main takeaways from the report?",
+    "What are some risks that Gap might have?",
+]
+QUESTIONS = README_QUESTIONS + [
+    "What is this about?",
+    "Who is the author?",
+    "What advice is given to founders?",
+    "Tell me about the parable of the loaves and fishes.",
+    "Summarize the main argument.",
+]
+
+
+def peak_rss_mb():
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+
+def percentiles_ms(seconds):
+    ms = 1000 * np.asarray(seconds)
+    return {"p50": round(float(np.percentile(ms, 50)), 3),
+            "p95": round(float(np.percentile(ms, 95)), 3),
+            "p99": round(float(np.percentile(ms, 99)), 3),
+            "max": round(float(ms.max()), 3)}
+
+
+def rate(count, seconds):
+    return round(count / max(seconds, 1e-9), 1)
+
+
+def corpus_lines():
+    with open(CORPUS_INDEX) as f:
+        docs = json.load(f)["docstore"]["docs"]
+    text = "\n".join(doc["text"] for doc in docs.values() if doc.get("text"))
+    return [" ".join(line.split()) for line in text.splitlines() if line.strip()]
+
+
+def chunks(lines, n, lines_per_chunk):
+    """n chunks of consecutive lines, wrapping around the corpus."""
+    return [[lines[(i * lines_per_chunk + j) % len(lines)] for j in range(lines_per_chunk)]
+            for i in range(n)]
+
+
+def backend_calls():
+    from llm_scheduler import get_shared_scheduler
+
+    return dict(get_shared_scheduler().backend.calls)
+
+
+# ---- load_index
+
+
+def bench_load_index(args):
+    import index_catalog
+    # Imported before timing, so the first index does not pay for them.
+    import gpt_index  # noqa: F401
+    import retrieval  # noqa: F401
+
+    results = {}
+    for name, path in sorted(index_catalog.gather_indexes(INDEX_DIR).items()):
+        start = time.perf_counter()
+        index = index_catalog.load_index(path)
+        seconds = time.perf_counter() - start
+        results[name] = {
+            "kind": "tree" if index_catalog.is_tree_index(path) else "vector",
+            "bytes": os.path.getsize(path),
+            "seconds": round(seconds, 4),
+        }
+        del index
+    return {"indexes": results}
+
+
+# ---- query
+
+
+def bench_query(args):
+    import index_catalog
+    from streaming import stream_query
+
+    results = {}
+    for name, path in sorted(index_catalog.gather_indexes(INDEX_DIR).items()):
+        index = index_catalog.load_index(path)
+        query_kwargs = index_catalog.query_kwargs(path)
+        calls = backend_calls()
+        totals, first_tokens, sources = [], [], []
+        for i in range(args.queries):
+            question = QUESTIONS[i % len(QUESTIONS)]
+            start = time.perf_counter()
+            first = []
+
+            def on_token(token, answer):
+                if not first:
+                    first.append(time.perf_counter() - start)
+
+            def on_sources(source_nodes):
+                sources.append(time.perf_counter() - start)
+
+            stream_query(index, question, on_token, on_sources, **dict(query_kwargs))
+            totals.append(time.perf_counter() - start)
+            first_tokens.extend(first)
+        after = backend_calls()
+        results[name] = {
+            "query_kwargs": query_kwargs,
+            "queries": args.queries,
+            "ms": percentiles_ms(totals),
+            "first_token_ms": percentiles_ms(first_tokens) if first_tokens else None,
+            "sources_ms": percentiles_ms(sources) if sources else None,
+            "completions": after.get("complete", 0) - calls.get("complete", 0),
+            "embedding_requests": after.get("embed", 0) - calls.get("embed", 0),
+        }
+        del index
+    return {"indexes": results}
+
+
+# ---- federated
+
+
+def bench_federated(args):
+    import federated
+    import index_catalog
+    import index_server
+
+    paths = index_catalog.gather_indexes(INDEX_DIR)
+    local = {name: index_catalog.load_index(path) for name, path in sorted(paths.items())}
+    # The same indexes behind an index server on localhost, asked over HTTP.
+    server = index_server.serve(port=0, indexes=index_server.IndexServer(paths), preload=False,
+                                reload_interval=0)
+    server.indexes.load_all()
+    client = index_server.IndexClient("http://127.0.0.1:%d" % server.server_address[1])
+    served = {name: client.get_index(name) for name in sorted(paths)}
+    weight = federated.keyword_weight()
+
+    results = {"indexes": len(local), "queries": args.queries}
+    for label, indexes in (("local", local), ("served", served)):
+        # The first question embeds the leaves of the tree indexes; time the ones after it.
+        federated.retrieve_all(indexes, QUESTIONS[0], keyword_weight=weight)
+        per_index = {name: [] for name in indexes}
+        serial, parallel = [], []
+        for i in range(args.queries):
+            question = QUESTIONS[i % len(QUESTIONS)]
+            embedding = local["bible"].embed_model.get_query_embedding(question)
+            for name, index in indexes.items():
+                start = time.perf_counter()
+                federated.retrieve(name, index, question, embedding, federated.DEFAULT_TOP_K,
+                                   weight)
+                per_index[name].append(time.perf_counter() - start)
+            for workers, times in ((1, serial), (None, parallel)):
+                start = time.perf_counter()
+                federated.retrieve_all(indexes, question, keyword_weight=weight,
+                                       max_workers=workers)
+                times.append(time.perf_counter() - start)
+        medians = [float(np.median(times)) for times in per_index.values()]
+        results[label] = {
+            "slowest_index_p50_ms": round(1000 * max(medians), 3),
+            "sum_of_indexes_p50_ms": round(1000 * sum(medians), 3),
+            "retrieve_serial_ms": percentiles_ms(serial),
+            "retrieve_parallel_ms": percentiles_ms(parallel),
+        }
+    server.shutdown()
+
+    totals = []
+    for i in range(args.queries):
+        start = time.perf_counter()
+        federated.federated_query(local, QUESTIONS[i % len(QUESTIONS)], keyword_weight=weight)
+        totals.append(time.perf_counter() - start)
+    results["query_ms"] = percentiles_ms(totals)
+    return results
+
+
+# ---- crawl and save_page
+
+
+def page_html(title, lines, links):
+    """A page like the ones crawled: nav links, paragraphs, inline script and style."""
+    nav = "".join('<li><a href="%s">%s</a></li>' % (link, link) for link in links)
+    paragraphs = "".join("<p>%s</p>\n" % html.escape(line) for line in lines)
+    return (
+        "<html><head><title>%s</title>"
+        "<style>body { font-family: sans-serif; } .nav li { display: inline; }</style>"
+        "<script>window.dataLayer = window.dataLayer || []; function gtag(){}</script>"
+        "</head><body><ul class=\"nav\">%s</ul><div class=\"content\">%s</div>"
+        "<script>gtag('config', 'UA-0');</script></body></html>" % (title, nav, paragraphs)
+    )
+
+
+def generate_site(directory, n_pages, lines_per_page=30, fanout=10):
+    """index.html links to every page; each page links to the next fanout pages and to an
+    external site, which the crawler drops."""
+    os.makedirs(directory)
+    for i, lines in enumerate(chunks(corpus_lines(), n_pages, lines_per_page)):
+        links = ["/page-%d.html" % ((i + j) % n_pages) for j in range(1, fanout + 1)]
+        links.append("https://example.com/elsewhere.html")
+        with open(os.path.join(directory, "page-%d.html" % i), "w") as f:
+            f.write(page_html("Page %d" % i, lines, links))
+    with open(os.path.join(directory, "index.html"), "w") as f:
+        f.write(page_html("Index", [], ["/page-%d.html" % i for i in range(n_pages)]))
+
+
+class QuietHandler(SimpleHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+@contextlib.contextmanager
+def local_site(directory, n_pages):
+    """Generate a site in directory and serve it on localhost; yields its base URL."""
+    generate_site(directory, n_pages)
+    server = ThreadingHTTPServer(("127.0.0.1", 0),
+                                 functools.partial(QuietHandler, directory=directory))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        yield "http://127.0.0.1:%d/" % server.server_address[1]
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def saved_pages(folder):
+    return sum(name.endswith(".txt") for name in os.listdir(folder))
+
+
+def bench_crawl(args):
+    from crawler import Crawler
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp, local_site(os.path.join(tmp, "site"),
+                                                          args.pages) as url:
+        runs = [
+            ("crawl", "sync", lambda c: c.crawl(resume=False)),
+            # Same folder, so every page is revalidated with a conditional GET and not rewritten.
+            ("recrawl", "sync", lambda c: c.crawl(resume=False)),
+            ("crawl_async", "async", lambda c: c.crawl_async(concurrency=8, resume=False)),
+        ]
+        for name, folder, run in runs:
+            crawler = Crawler(url + "index.html", os.path.join(tmp, folder),
+                              number_of_pages=args.pages + 1, max_depth=1)
+            start = time.perf_counter()
+            run(crawler)
+            seconds = time.perf_counter() - start
+            results[name] = {"pages": saved_pages(crawler.output_folder),
+                             "seconds": round(seconds, 3),
+                             "pages_per_s": rate(args.pages + 1, seconds)}
+    return results
+
+
+def bench_save_page(args):
+    import html_text
+    from crawler import Crawler
+
+    with tempfile.TemporaryDirectory() as tmp, local_site(os.path.join(tmp, "site"),
+                                                          args.pages) as url:
+        crawler = Crawler(url, os.path.join(tmp, "pages"), use_cache=False)
+        urls = [url + "page-%d.html" % i for i in range(args.pages)]
+        # Downloaded first, so extraction is timed apart from HTTP.
+        pages = [crawler.fetch_page(u) for u in urls]
+        html_mb = sum(len(page.content) for page in pages) / 1e6
+
+        start = time.perf_counter()
+        text_chars = sum(len(html_text.extract(page.text)[0]) for page in pages)
+        extract_s = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for u in urls:
+            crawler.save_page(u)
+        save_s = time.perf_counter() - start
+    return {
+        "pages": len(pages),
+        "html_mb": round(html_mb, 3),
+        "text_chars": text_chars,
+        "extract": {"seconds": round(extract_s, 4), "mb_per_s": rate(html_mb, extract_s),
+                    "pages_per_s": rate(len(pages), extract_s)},
+        "save_page": {"seconds": round(save_s, 3), "pages_per_s": rate(len(pages), save_s)},
+    }
+
+
+# ---- create_index
+
+
+def bench_create_index(args):
+    import data_loader
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        data_loader.DOCUMENT_CACHE_DIR = os.path.join(tmp, "documents")
+        folder = os.path.join(tmp, "bench-corpus")
+        os.makedirs(folder)
+        for i, lines in enumerate(chunks(corpus_lines(), args.documents, 60)):
+            with open(os.path.join(folder, "doc-%d.txt" % i), "w") as f:
+                f.write("\n".join(lines))
+
+        runs = [
+            ("tree", "tree", False),
+            ("vector", "vector", True),
+            # Every file is unchanged: only hashing, loading and saving the index.
+            ("vector_unchanged", "vector", True),
+        ]
+        for name, output, incremental in runs:
+            output_dir = os.path.join(tmp, output)
+            os.makedirs(output_dir, exist_ok=True)
+            calls = backend_calls()
+            start = time.perf_counter()
+            index = data_loader.create_index(folder, output_dir, incremental=incremental)
+            seconds = time.perf_counter() - start
+            after = backend_calls()
+            index_path = data_loader.get_index_path(folder, output_dir)
+            results[name] = {
+                "seconds": round(seconds, 3),
+                "nodes": len(index.docstore.docs),
+                "index_bytes": os.path.getsize(index_path),
+                "completions": after.get("complete", 0) - calls.get("complete", 0),
+                "embedded": after.get("embedded", 0) - calls.get("embedded", 0),
+            }
+    return dict(results, documents=args.documents)
+
+
+SECTIONS = {
+    "load_index": bench_load_index,
+    "query": bench_query,
+    "federated": bench_federated,
+    "crawl": bench_crawl,
+    "save_page": bench_save_page,
+    "create_index": bench_create_index,
+}
+
+
+def run_section(name, args):
+    """Run one section in this process and print its result as the last line of stdout."""
+    from chunker import use_offline_encoding
+
+    use_offline_encoding()
+    stdout = sys.stdout
+    # What the code under test prints goes to stderr, so stdout only holds the result.
+    with contextlib.redirect_stdout(sys.stderr):
+        start = time.perf_counter()
+        result = SECTIONS[name](args)
+        result["seconds"] = round(time.perf_counter() - start, 3)
+    result["peak_rss_mb"] = peak_rss_mb()
+    print(json.dumps(result), file=stdout)
+
+
+def spawn_section(name, args, argv, env):
+    """Run one section in a fresh interpreter and return its result, or its error."""
+    proc = subprocess.run([sys.executable, os.path.abspath(__file__), "--section", name] + argv,
+                          capture_output=True, text=True, env=env, cwd=REPO_DIR)
+    lines = proc.stdout.strip().splitlines()
+    if proc.returncode == 0 and lines:
+        return json.loads(lines[-1])
+    errors = proc.stderr.strip().splitlines()
+    return {"error": errors[-1] if errors else "exit code %d" % proc.returncode}
+
+
+def numbers(report, prefix=""):
+    """(dotted path, value) of every number in a report."""
+    for key, value in report.items():
+        path = prefix + str(key)
+        if isinstance(value, dict):
+            yield from numbers(value, path + ".")
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            yield path, value
+
+
+def compare(sections, baseline_sections):
+    """new / old for every number in both reports."""
+    old = dict(numbers(baseline_sections))
+    return {path: round(value / old[path], 3)
+            for path, value in numbers(sections) if old.get(path)}
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, cwd=REPO_DIR).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def run(args, argv):
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ, LLM_BACKEND="fake", LLM_FAKE_LATENCY=str(args.llm_latency),
+                   EMBEDDING_CACHE_PATH=os.path.join(tmp, "embeddings.sqlite"))
+        # openai refuses to build requests without a key, even for a local backend.
+        env.setdefault("OPENAI_API_KEY", "sk-bench")
+        sections = {}
+        for name in args.sections.split(","):
+            print("running %s..." % name, file=sys.stderr)
+            sections[name] = spawn_section(name, args, argv, env)
+            # Each section starts from an empty embedding cache.
+            if os.path.exists(env["EMBEDDING_CACHE_PATH"]):
+                os.remove(env["EMBEDDING_CACHE_PATH"])
+    report = {
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "settings": {"queries": args.queries, "pages": args.pages,
+                     "documents": args.documents, "llm_latency_s": args.llm_latency},
+        "sections": sections,
+    }
+    if args.baseline:
+        with open(args.baseline) as f:
+            report["vs_baseline"] = compare(sections, json.load(f)["sections"])
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sections", default=",".join(SECTIONS))
+    parser.add_argument("--section", choices=list(SECTIONS), help=argparse.SUPPRESS)
+    parser.add_argument("--output")
+    parser.add_argument("--baseline")
+    parser.add_argument("--queries", type=int, default=20)
+    parser.add_argument("--pages", type=int, default=200)
+    parser.add_argument("--documents", type=int, default=40)
+    parser.add_argument("--llm-latency", type=float, default=0.0)
+    args = parser.parse_args()
+    if args.section:
+        run_section(args.section, args)
+        sys.exit(0)
+
+    unknown = set(args.sections.split(",")) - set(SECTIONS)
+    if unknown:
+        parser.error("unknown sections: %s" % ", ".join(sorted(unknown)))
+    # Settings passed on to every section.
+    argv = ["--queries", str(args.queries), "--pages", str(args.pages),
+            "--documents", str(args.documents), "--llm-latency", str(args.llm_latency)]
+    report = run(args, argv)
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    print(text)
+    failed = [name for name, result in report["sections"].items() if "error" in result]
+    if failed:
+        print("failed sections: %s" % ", ".join(failed), file=sys.stderr)
+        sys.exit(1)
@@ -0,0 +1,225 @@
+"""BM25 keyword search over the nodes of a vector index, without any API call.
+
+Questions that share exact terms with the text that answers them ("What is Gap's earnings per
+share?") can be answered from a keyword match instead of embedding the query and scanning
+every vector. BM25Index is an inverted index over the node texts:
+
+    terms           sorted vocabulary; a term's id is its position. Saved as one UTF-8
+                    blob and offsets, and looked up through a dict once loaded
+    term_offsets    postings of term t are postings[term_offsets[t]:term_offsets[t + 1]]
+    postings_rows   row (node) of each posting, int32, ascending within a term
+    postings_tf     term frequency of each posting, uint16
+    row_lengths     length of each row in terms
+
+The postings are flat arrays rather than per-term lists, so the index is small on disk and
+loads without building Python objects per posting. Per-posting BM25 weights are computed once
+at load time; a query then adds up one slice of weights per query term.
+
+Rows are in the order of the index's VectorRetriever, and the index is saved next to the
+vector index as index_<name>.bm25.npz. text_ids records which node each row was built from,
+so a stale index can be detected.
+
+Usage:
+    python bm25.py build indexes/index_bible.json
+    python bm25.py search indexes/index_bible.json "loaves and fishes" [k]
+"""
+import json
+import os
+import re
+import sys
+from collections import Counter
+from typing import List, Sequence, Tuple
+
+import numpy as np
+
+BM25_EXT = ".bm25.npz"
+K1 = 1.2
+B = 0.75
+
+TOKEN = re.compile(r"[a-z0-9]+")
+# Too common to say anything about a node; leaving them out keeps the postings short.
+STOPWORDS = frozenset("""
+a an and are as at be but by for from had has have he her his i if in into is it its me my
+not of on or our she so that the their them then there these they this to was we were what
+when where which who whom why will with you your s t
+""".split())
+
+
+def get_bm25_path(index_path):
+    """indexes/index_bible.json -> indexes/index_bible.bm25.npz"""
+    return os.path.splitext(index_path)[0] + BM25_EXT
+
+
+def tokenize(text: str) -> List[str]:
+    return [token for token in TOKEN.findall(text.lower()) if token not in STOPWORDS]
+
+
+class BM25Index:
+    """Inverted index with BM25 scoring; see the module docstring for the layout."""
+
+    def __init__(self, terms, term_offsets, postings_rows, postings_tf, row_lengths, text_ids,
+                 k1=K1, b=B):
+        self.terms = list(terms)
+        self.term_ids = {term: i for i, term in enumerate(self.terms)}
+        self.term_offsets = term_offsets
+        self.postings_rows = postings_rows
+        self.postings_tf = postings_tf
+        self.row_lengths = row_lengths
+        self.text_ids = list(text_ids)
+        self.k1 = k1
+        self.b = b
+        df = np.diff(self.term_offsets).astype(np.float32)
+        self.idfs = np.log1p((len(self) - df + 0.5) / (df + 0.5))
+        self.weights = self._weights()
+
+    def idf(self, term: str) -> float:
+        """Inverse document frequency of a term; terms in no row get the highest value."""
+        term_id = self.term_ids.get(term)
+        if term_id is None:
+            return float(np.log1p((len(self) + 0.5) / 0.5))
+        return float(self.idfs[term_id])
+
+    def _weights(self):
+        """BM25 weight of each posting: idf(term) * saturated, length-normalized tf."""
+        if not len(self.postings_rows):
+            return np.zeros(0, dtype=np.float32)
+        tf = self.postings_tf.astype(np.float32)
+        lengths = self.row_lengths[self.postings_rows].astype(np.float32)
+        norm = self.k1 * (1 - self.b + self.b * lengths / max(self.row_lengths.mean(), 1e-9))
+        return (np.repeat(self.idfs, np.diff(self.term_offsets)) * tf * (self.k1 + 1)
+                / (tf + norm)).astype(np.float32)
+
+    @classmethod
+    def build(cls, texts: Sequence[str], text_ids: Sequence[str], k1=K1, b=B) -> "BM25Index":
+        vocabulary = {}
+        term_ids, rows, tfs = [], [], []
+        row_lengths = np.zeros(len(texts), dtype=np.int32)
+        for row, text in enumerate(texts):
+            tokens = tokenize(text)
+            row_lengths[row] = len(tokens)
+            for term, tf in Counter(tokens).items():
+                term_ids.append(vocabulary.setdefault(term, len(vocabulary)))
+                rows.append(row)
+                tfs.append(tf)
+
+        # Renumber terms in sorted order, so saved indexes do not depend on node order.
+        terms = sorted(vocabulary)
+        new_ids = np.empty(len(vocabulary), dtype=np.int64)
+        new_ids[[vocabulary[term] for term in terms]] = np.arange(len(vocabulary))
+        term_ids = new_ids[np.asarray(term_ids, dtype=np.int64)]
+        # Stable, so rows stay ascending within each term.
+        order = np.argsort(term_ids, kind="stable")
+        term_offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(term_ids, minlength=len(terms)), out=term_offsets[1:])
+        return cls(
+            terms,
+            term_offsets,
+            np.asarray(rows, dtype=np.int32)[order],
+            np.minimum(np.asarray(tfs, dtype=np.int64), np.iinfo(np.uint16).max)
+            .astype(np.uint16)[order],
+            row_lengths,
+            text_ids,
+            k1,
+            b,
+        )
+
+    def __len__(self):
+        return len(self.row_lengths)
+
+    def scores(self, query: str) -> np.ndarray:
+        """BM25 score of every row for a query; 0 for rows without any query term."""
+        scores = np.zeros(len(self), dtype=np.float32)
+        for term in set(tokenize(query)):
+            term_id = self.term_ids.get(term)
+            if term_id is None:
+                continue
+            start, end = self.term_offsets[term_id], self.term_offsets[term_id + 1]
+            # A term has at most one posting per row, so fancy-index addition is safe.
+            scores[self.postings_rows[start:end]] += self.weights[start:end]
+        return scores
+
+    def top_k(self, query: str, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """(scores, rows) of the best k rows that contain a query term, best first."""
+        return self.top_k_of_scores(self.scores(query), k)
+
+    @staticmethod
+    def top_k_of_scores(scores: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Same as top_k, for the scores() of a query already computed."""
+        candidates = np.flatnonzero(scores)
+        if len(candidates) > k:
+            candidates = candidates[np.argpartition(-scores[candidates], k - 1)[:k]]
+        candidates = candidates[np.argsort(-scores[candidates], kind="stable")]
+        return scores[candidates], candidates
+
+    def save(self, path):
+        encoded = [term.encode("utf-8") for term in self.terms]
+        terms_offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(term) for term in encoded], out=terms_offsets[1:])
+        with open(path + ".tmp", "wb") as f:
+            np.savez(f, terms_blob=np.frombuffer(b"".join(encoded), dtype=np.uint8),
+                     terms_offsets=terms_offsets, term_offsets=self.term_offsets,
+                     postings_rows=self.postings_rows, postings_tf=self.postings_tf,
+                     row_lengths=self.row_lengths,
+                     text_ids=np.asarray(self.text_ids, dtype=str),
+                     params=np.asarray([self.k1, self.b], dtype=np.float64))
+        os.replace(path + ".tmp", path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            k1, b = data["params"].tolist()
+            blob = data["terms_blob"].tobytes()
+            offsets = data["terms_offsets"].tolist()
+            terms = [blob[start:end].decode("utf-8") for start, end in zip(offsets, offsets[1:])]
+            return cls(terms, data["term_offsets"], data["postings_rows"],
+                       data["postings_tf"], data["row_lengths"], data["text_ids"].tolist(),
+                       k1, b)
+
+
+def node_texts(index_struct_json):
+    """(text_ids, texts) of a saved SimpleIndexDict, in the order of its embeddings."""
+    text_ids = list(index_struct_json["embedding_dict"].keys())
+    nodes = index_struct_json["nodes_dict"]
+    id_map = index_struct_json["id_map"]
+    return text_ids, [nodes[str(id_map[text_id])]["text"] for text_id in text_ids]
+
+
+def build_for_index_struct(index_struct, index_path):
+    """Build and save the BM25 index of a SimpleIndexDict that is saved at index_path."""
+    text_ids = list(index_struct.embedding_dict.keys())
+    texts = [node.get_text() for node in index_struct.get_nodes(text_ids)]
+    bm25 = BM25Index.build(texts, text_ids)
+    bm25.save(get_bm25_path(index_path))
+    return bm25
+
+
+def build_for_index_path(index_path):
+    """Build and save the BM25 index of a GPTSimpleVectorIndex JSON file."""
+    with open(index_path) as f:
+        index_struct = json.load(f)["index_struct"]
+    if "embedding_dict" not in index_struct:
+        raise ValueError(f"{index_path} is not a vector index.")
+    text_ids, texts = node_texts(index_struct)
+    bm25 = BM25Index.build(texts, text_ids)
+    bm25.save(get_bm25_path(index_path))
+    return bm25
+
+
+def main(argv):
+    if len(argv) < 3 or argv[1] not in ("build", "search"):
+        print(__doc__)
+        return 1
+    if argv[1] == "build":
+        bm25 = build_for_index_path(argv[2])
+        print(f"built {get_bm25_path(argv[2])}: {len(bm25.terms)} terms, "
+              f"{len(bm25.postings_rows)} postings over {len(bm25)} nodes")
+        return 0
+    bm25 = BM25Index.load(get_bm25_path(argv[2]))
+    scores, rows = bm25.top_k(argv[3], int(argv[4]) if len(argv) > 4 else 5)
+    for score, row in zip(scores, rows):
+        print(f"{score:8.3f}  {bm25.text_ids[row]}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,191 @@
+"""Token-aware text chunking, shared by index building and fine-tuning data generation.
+
+Chunker splits text into chunks of at most max_tokens tokens, as counted by a tiktoken
+encoding. Chunks end at paragraph boundaries where possible, then at sentence boundaries,
+then at line breaks; only a single run of text longer than max_tokens is cut between
+tokens. Consecutive chunks can share overlap_tokens tokens of whole sentences.
+
+Each sentence is encoded once and chunks are joined from lists, so splitting is linear in
+the size of the text. Chunk sizes are the sums of their sentences' token counts, which can
+differ from the count of the joined chunk by about a token per sentence.
+
+tiktoken downloads its encodings on first use. use_offline_encoding() counts tokens with
+WordEncoding instead, here and in gpt_index, for the benchmark suite and the tests, which run
+without network.
+"""
+import functools
+import re
+import threading
+from typing import List, NamedTuple, Optional
+
+import tiktoken
+
+# The encoding of text-davinci-003, which answers queries over the chunks.
+DEFAULT_ENCODING = "p50k_base"
+
+PARAGRAPH_BREAK = re.compile(r"\n\s*\n")
+SENTENCE_END = re.compile(r"(?<=[.!?])\s+|(?<=[.!?][\"')\]])\s+")
+LINE_BREAK = re.compile(r"\s*\n\s*")
+
+
+class WordEncoding:
+    """Deterministic encoding that needs no download: one token per word, punctuation mark or
+    run of whitespace, with ids given in order of first use. On English text it counts
+    somewhat more tokens than the GPT encodings do."""
+
+    TOKEN = re.compile(r"\s*\w+|\s*[^\w\s]|\s+")
+
+    def __init__(self):
+        self.ids = {}
+        self.tokens = []
+        self._lock = threading.Lock()
+
+    def encode(self, text: str, **kwargs) -> List[int]:
+        ids = []
+        for token in self.TOKEN.findall(text):
+            token_id = self.ids.get(token)
+            if token_id is None:
+                with self._lock:
+                    token_id = self.ids.setdefault(token, len(self.tokens))
+                    if token_id == len(self.tokens):
+                        self.tokens.append(token)
+            ids.append(token_id)
+        return ids
+
+    def decode(self, ids: List[int]) -> str:
+        return "".join(self.tokens[i] for i in ids)
+
+
+_offline_encoding: Optional[WordEncoding] = None
+
+
+def use_offline_encoding() -> WordEncoding:
+    """Count tokens with one WordEncoding instead of tiktoken: in every Chunker made from now
+    on, and in gpt_index (text splitting and prompt sizes)."""
+    from gpt_index.utils import globals_helper
+
+    global _offline_encoding
+    if _offline_encoding is None:
+        _offline_encoding = WordEncoding()
+        get_encoding.cache_clear()
+    globals_helper._tokenizer = _offline_encoding.encode
+    return _offline_encoding
+
+
+@functools.lru_cache(maxsize=None)
+def get_encoding(name: str):
+    if _offline_encoding is not None:
+        return _offline_encoding
+    return tiktoken.get_encoding(name)
+
+
+class _Unit(NamedTuple):
+    text: str
+    tokens: int
+    # Whether the unit starts a paragraph, i.e. is joined to the previous one by a blank line.
+    paragraph_start: bool
+
+
+class Chunker:
+    """Splits text into chunks of at most max_tokens tokens.
+
+    Args:
+        max_tokens: Largest chunk, in tokens.
+        overlap_tokens: Tokens of whole sentences repeated from the end of a chunk at the
+            start of the next one. Must be less than max_tokens.
+        encoding: tiktoken encoding name, or an object with encode and decode methods.
+    """
+
+    def __init__(self, max_tokens=512, overlap_tokens=0, encoding=DEFAULT_ENCODING):
+        if not 0 <= overlap_tokens < max_tokens:
+            raise ValueError("overlap_tokens must be at least 0 and less than max_tokens.")
+        self.max_tokens = max_tokens
+        self.overlap_tokens = overlap_tokens
+        self.encoding_name = encoding if isinstance(encoding, str) else type(encoding).__name__
+        self.encoding = get_encoding(encoding) if isinstance(encoding, str) else encoding
+
+    def settings(self):
+        """What determines the chunks, e.g. to tell whether saved chunks are stale."""
+        return {"max_tokens": self.max_tokens, "overlap_tokens": self.overlap_tokens,
+                "encoding": self.encoding_name}
+
+    def encode(self, text: str) -> List[int]:
+        # Text such as "<|endoftext|>" is ordinary text here, not a special token.
+        return self.encoding.encode(text, disallowed_special=())
+
+    def count_tokens(self, text: str) -> int:
+        return len(self.encode(text))
+
+    def _units(self, text):
+        """Sentences of text, each no longer than max_tokens, grouped by paragraph."""
+        for paragraph in PARAGRAPH_BREAK.split(text):
+            units = []
+            for sentence in SENTENCE_END.split(paragraph.strip()):
+                units.extend(self._split_long(sentence))
+            for i, (unit_text, tokens) in enumerate(units):
+                yield _Unit(unit_text, tokens, i == 0)
+
+    def _split_long(self, sentence):
+        """(text, tokens) pieces of a sentence: itself, its lines, or runs of tokens."""
+        tokens = self.encode(sentence)
+        if len(tokens) <= self.max_tokens:
+            return [(sentence, len(tokens))] if sentence else []
+        lines = LINE_BREAK.split(sentence)
+        if len(lines) > 1:
+            return [piece for line in lines for piece in self._split_long(line)]
+        return [
+            (self.encoding.decode(tokens[i:i + self.max_tokens]).strip(),
+             len(tokens[i:i + self.max_tokens]))
+            for i in range(0, len(tokens), self.max_tokens)
+        ]
+
+    def split_text(self, text: str) -> List[str]:
+        """Chunks of text, in order."""
+        units = list(self._units(text))
+        # Tokens from each unit to the end of its paragraph, to keep paragraphs together.
+        paragraph_rest = [0] * len(units)
+        rest = 0
+        for i in range(len(units) - 1, -1, -1):
+            rest = units[i].tokens + (0 if i + 1 < len(units) and units[i + 1].paragraph_start
+                                      else rest)
+            paragraph_rest[i] = rest
+
+        chunks = []
+        chunk, chunk_tokens, new_units = [], 0, 0
+        for i, unit in enumerate(units):
+            space = self.max_tokens - chunk_tokens
+            starts_paragraph_that_fits_alone = (
+                unit.paragraph_start and space < paragraph_rest[i] <= self.max_tokens
+            )
+            if chunk and new_units and (unit.tokens > space or starts_paragraph_that_fits_alone):
+                chunks.append(self._join(chunk))
+                chunk, chunk_tokens = self._overlap(chunk)
+                new_units = 0
+                # The overlap may not leave room for the unit.
+                while chunk and chunk_tokens + unit.tokens > self.max_tokens:
+                    chunk_tokens -= chunk.pop(0).tokens
+            chunk.append(unit)
+            chunk_tokens += unit.tokens
+            new_units += 1
+        if new_units:
+            chunks.append(self._join(chunk))
+        return chunks
+
+    def _overlap(self, chunk):
+        """The trailing units of a chunk that fit in overlap_tokens, and their tokens."""
+        overlap, tokens = [], 0
+        for unit in reversed(chunk):
+            if tokens + unit.tokens > self.overlap_tokens:
+                break
+            overlap.append(unit)
+            tokens += unit.tokens
+        overlap.reverse()
+        return overlap, tokens
+
+    @staticmethod
+    def _join(chunk):
+        parts = [chunk[0].text]
+        for unit in chunk[1:]:
+            parts.append("\n\n" if unit.paragraph_start else " ")
+            parts.append(unit.text)
+        return "".join(parts)
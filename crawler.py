@@ -1,13 +1,21 @@
+import asyncio
 import os
+import random
+import time
+from collections import namedtuple
 import requests
 from urllib.parse import urlparse
 from urllib.parse import urljoin
 
-from bs4 import BeautifulSoup
+import aiohttp
+
+import html_text
+from frontier import Frontier, normalize_url
+from http_cache import HttpCache
 
 """Given a webpage, gets the list of links from this webpage (that link to the same website),
 then crawls each one, extracts the text, and saves the text to a text file.
-Only uses 1 level of recursion."""
+Links are followed breadth-first up to max_depth levels (1 level by default)."""
 
 
 class Crawler:
@@ -15,37 +23,212 @@ class Crawler:
     url - internet url
     output_folder - folder name to store data
     number_of_pages - limit on number of pages to download
+    max_depth - number of link hops to follow from url
+    state_dir - folder to save the crawl frontier in, so an interrupted crawl can resume.
+                Defaults to a hidden folder inside output_folder.
+    checkpoint_every - save the frontier after this many pages
+    use_cache - send conditional requests, and skip pages that did not change since the last crawl
+    timeout - number of seconds crawl() and save_page() wait for a server before giving up on a page
     """
 
-    def __init__(self, url, output_folder="unnamed", number_of_pages=1000):
+    def __init__(self, url, output_folder="unnamed", number_of_pages=1000, max_depth=1,
+                 state_dir=None, checkpoint_every=50, use_cache=True, timeout=30):
         self.url = url
+        self.timeout = timeout
         if output_folder == "unnamed":
             output_folder = urlparse(url).netloc.replace(".", "-")
         self.output_folder = output_folder
         self.number_of_pages = number_of_pages
+        self.max_depth = max_depth
+        self.state_dir = state_dir or os.path.join(output_folder, ".crawl_state")
+        self.checkpoint_every = checkpoint_every
 
         # Creates a folder to store files
         if not os.path.exists(output_folder):
             os.makedirs(output_folder)
 
-    """Crawls the specificed website"""
+        self.cache = HttpCache(os.path.join(output_folder, HttpCache.FILE_NAME)) if use_cache else None
+
+    """
+    Returns the frontier to crawl from.
+    If resume is set and a previous crawl was interrupted, continues where it stopped.
+    Otherwise starts a new frontier from the seed url.
+    """
+
+    def load_frontier(self, resume=True):
+        frontier = Frontier.load(self.state_dir) if resume else None
+        if frontier is not None and frontier.seed != normalize_url(self.url):
+            print("Not resuming the crawl in %s: it started from %s, not %s"
+                  % (self.state_dir, frontier.seed, self.url))
+            frontier = None
+        if frontier is not None:
+            # Use this crawl's limits, so a finished crawl can be continued with a larger budget.
+            frontier.max_depth = self.max_depth
+            frontier.max_pages = self.number_of_pages
+        if frontier is not None and not frontier.finished():
+            print("Resuming crawl: %d pages done, %d queued" % (frontier.pages_done, len(frontier)))
+            return frontier
+        frontier = Frontier(self.max_depth, self.number_of_pages, self.state_dir, seed=self.url)
+        frontier.add(self.url, 0)
+        return frontier
+
+    """
+    Crawls the specificed website, and returns the number of pages saved.
+    A page that cannot be downloaded is reported and skipped, like crawl_async() does.
+    """
 
-    def crawl(self):
+    def crawl(self, resume=True):
         print("Crawling " + self.url)
-        url_list = self.extract_links(self.url)
+        frontier = self.load_frontier(resume)
+        saved = 0
 
-        # Crawl each link, and write to file.
-        # For performance, crawls only the first number_of_pages links
-        for url in url_list[:self.number_of_pages]:
-            self.save_page(url)
+        # Crawl breadth-first, and write each page to file.
+        # For performance, crawls only the first number_of_pages pages
+        try:
+            while frontier.has_next():
+                url, depth = frontier.pop()
+                page = self.fetch_page(url)
+                if page is not None:
+                    links = self.handle_page(url, page)
+                    if depth < self.max_depth:
+                        for link in links:
+                            frontier.add(link, depth + 1)
+                    saved += 1
+                frontier.mark_done(url)
+                if frontier.pages_done % self.checkpoint_every == 0:
+                    self.checkpoint(frontier)
+        finally:
+            self.checkpoint(frontier)
+        return saved
+
+    """Save the frontier and the HTTP cache, so an interrupted crawl can resume."""
+
+    def checkpoint(self, frontier):
+        frontier.save()
+        if self.cache is not None:
+            self.cache.save()
+
+    """
+    Crawls the specified website concurrently.
+    concurrency - maximum number of requests in flight at once
+    per_host_delay - minimum number of seconds between two requests to the same host
+    retries - number of extra attempts for a failed request, with exponential backoff
+    timeout - total number of seconds allowed for a single request
+    Files are written to the same output_folder layout as crawl().
+    """
+
+    def crawl_async(self, concurrency=8, per_host_delay=0.0, retries=3, timeout=30, resume=True):
+        return asyncio.run(self._crawl_async(concurrency, per_host_delay, retries, timeout, resume))
+
+    async def _crawl_async(self, concurrency, per_host_delay, retries, timeout, resume):
+        print("Crawling " + self.url)
+        start = time.monotonic()
+        frontier = self.load_frontier(resume)
+        saved = 0
+        # One pooled session for the whole crawl, so connections are kept alive and reused.
+        connector = aiohttp.TCPConnector(limit=concurrency)
+        client_timeout = aiohttp.ClientTimeout(total=timeout)
+        async with aiohttp.ClientSession(connector=connector, timeout=client_timeout) as session:
+            fetcher = _AsyncFetcher(session, concurrency, per_host_delay, retries)
+
+            async def crawl_one(url, depth):
+                page = await fetcher.fetch(url, self.conditional_headers(url))
+                if page is not None:
+                    links = self.handle_page(url, page)
+                    if depth < self.max_depth:
+                        for link in links:
+                            frontier.add(link, depth + 1)
+                frontier.mark_done(url)
+                return page is not None
+
+            # Keep up to concurrency pages in flight, refilling from the frontier as they finish.
+            pending = set()
+            try:
+                while True:
+                    while frontier.has_next() and len(pending) < concurrency:
+                        url, depth = frontier.pop()
+                        pending.add(asyncio.ensure_future(crawl_one(url, depth)))
+                    if not pending:
+                        break
+                    done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                    for task in done:
+                        saved += task.result()
+                        if frontier.pages_done % self.checkpoint_every == 0:
+                            self.checkpoint(frontier)
+            finally:
+                for task in pending:
+                    task.cancel()
+                self.checkpoint(frontier)
+
+        elapsed = time.monotonic() - start
+        print("Saved %d pages in %.2fs (%.1f pages/s)" % (saved, elapsed, saved / max(elapsed, 1e-9)))
+        return saved
 
     """Save this page to a new file in output_folder"""
 
     def save_page(self, url):
-        response = requests.get(url)
-        soup = BeautifulSoup(response.text, 'html.parser')
-        extracted_text = soup.get_text().strip()
+        page = self.fetch_page(url)
+        if page is not None:
+            self.handle_page(url, page)
+        if self.cache is not None:
+            self.cache.save()
+
+    """Request headers for this URL, including cache validators from the last crawl"""
+
+    def conditional_headers(self, url):
+        return self.cache.request_headers(url) if self.cache is not None else {}
+
+    """Download this URL with requests. Returns None if it could not be downloaded."""
+
+    def fetch_page(self, url):
+        try:
+            response = requests.get(url, headers=self.conditional_headers(url), timeout=self.timeout)
+        except requests.RequestException as e:
+            print("Failed %s: %r" % (url, e))
+            return None
+        if response.status_code >= 400:
+            print("Failed %s: HTTP %d" % (url, response.status_code))
+            return None
+        return Page(response.status_code, response.headers, response.content, response.text,
+                    response.url)
+
+    """
+    Write a downloaded page to output_folder, and return the links on it.
+    If the page did not change since the last crawl, skips extracting and writing it.
+    """
+
+    def handle_page(self, url, page):
+        if self.cache is not None and self.cache.is_unchanged(url, page.status, page.content, page.headers):
+            print("Unchanged " + url)
+            return self.cache.get_links(url)
+        # Text and links come from a single parse of the page.
+        extracted_text, hrefs = html_text.extract(page.text)
+        file_path = self.write_page(url, extracted_text)
+        # Relative links resolve against the URL that was served, after any redirect.
+        links = self.filter_links(page.url or url, hrefs)
+        if self.cache is not None:
+            self.cache.store(url, page.headers, page.content, file_path, links)
+        return links
+
+    """Extract the visible text of an HTML page"""
+
+    def extract_text(self, html):
+        return html_text.extract(html)[0]
 
+    """Write the extracted text of this page to a new file in output_folder"""
+
+    def write_page(self, url, extracted_text):
+        file_path = self.get_file_path(url)
+
+        # Create and write filename
+        with open(file_path, "w") as file:
+            file.write(extracted_text)
+            print("Created " + file_path)
+        return file_path
+
+    """Return the path of the text file for this URL inside output_folder"""
+
+    def get_file_path(self, url):
         # Use URL path suffix to create filename. Strip leading "/".
         # Example: "http://www.paulgraham.com/talk.html" ->  "/talk.html" -> "talk.html"
         url_path = urlparse(url).path[1:]
@@ -59,13 +242,9 @@ class Crawler:
         file_path = os.path.join(self.output_folder, filename)
 
         # Create the folder for this crawl if it does not exist.
-        if not os.path.exists(os.path.dirname(filename)):
-            os.mkdir(file_path)
-
-        # Create and write filename
-        with open(file_path, "w") as file:
-            file.write(extracted_text)
-            print("Created " + file_path)
+        if not os.path.exists(self.output_folder):
+            os.makedirs(self.output_folder)
+        return file_path
 
     """
     Given the URL, returns a list of all links. Only include internal-links to this website.
@@ -74,12 +253,21 @@ class Crawler:
     """
 
     def extract_links(self, url):
+        response = requests.get(url, timeout=self.timeout)
+        return self.parse_links(response.url, response.text)
+
+    """Same as extract_links, for a page that has already been downloaded."""
+
+    def parse_links(self, url, html):
+        return self.filter_links(url, html_text.extract(html)[1])
+
+    """Same as parse_links, for the href values already extracted from the page."""
+
+    def filter_links(self, url, hrefs):
         parsed_url = urlparse(url)
-        response = requests.get(url)
-        soup = BeautifulSoup(response.text, 'html.parser')
 
         # Get all links on this page. Include a self-link
-        all_links = [link.get('href') for link in soup.find_all('a')]
+        all_links = list(hrefs)
         all_links.append(url)
 
         # Filter known bad links
@@ -119,6 +307,70 @@ class Crawler:
         return parsed_url.netloc
 
 
+"""
+A downloaded page. text is None for a 304 Not Modified response.
+url is the URL that was served, after any redirect; links on the page are relative to it.
+"""
+Page = namedtuple("Page", ["status", "headers", "content", "text", "url"], defaults=[None])
+
+
+class _AsyncFetcher:
+    """
+    Fetches pages over a shared aiohttp session.
+    Bounds the number of requests in flight, spaces out requests to the same host,
+    and retries failed requests with exponential backoff.
+    """
+
+    RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+    def __init__(self, session, concurrency, per_host_delay, retries):
+        self.session = session
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.per_host_delay = per_host_delay
+        self.retries = retries
+        self.host_locks = {}
+        self.host_next_time = {}
+
+    async def wait_for_host(self, host):
+        if self.per_host_delay <= 0:
+            return
+        lock = self.host_locks.setdefault(host, asyncio.Lock())
+        async with lock:
+            now = time.monotonic()
+            next_time = self.host_next_time.get(host, now)
+            if next_time > now:
+                await asyncio.sleep(next_time - now)
+            self.host_next_time[host] = max(now, next_time) + self.per_host_delay
+
+    """Return this URL as a Page, or None if it could not be downloaded."""
+
+    async def fetch(self, url, headers=None):
+        host = urlparse(url).netloc
+        for attempt in range(self.retries + 1):
+            await self.wait_for_host(host)
+            try:
+                async with self.semaphore:
+                    async with self.session.get(url, headers=headers) as response:
+                        if response.status not in self.RETRY_STATUSES:
+                            if response.status >= 400:
+                                print("Failed %s: HTTP %d" % (url, response.status))
+                                return None
+                            content = await response.read()
+                            text = None
+                            if response.status != 304:
+                                text = content.decode(response.get_encoding(), errors="replace")
+                            return Page(response.status, response.headers, content, text,
+                                        str(response.url))
+                        error = "HTTP %d" % response.status
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                error = repr(e)
+            if attempt < self.retries:
+                # Exponential backoff with jitter: ~0.5s, 1s, 2s, ...
+                await asyncio.sleep(0.5 * 2 ** attempt * (0.5 + random.random()))
+        print("Failed %s after %d attempts: %s" % (url, self.retries + 1, error))
+        return None
+
+
 def main():
     DATA_FOLDER_NAME = "data"
     URL = "http://www.paulgraham.com/articles.html"
@@ -1,8 +1,16 @@
 """Simple reader that reads files of different formats from a directory."""
 
+import hashlib
+import importlib.util
+import json
 import logging
+import multiprocessing
+import os
+import pickle
+import sys
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
-from typing import Callable, Dict, List, Optional, Union
+from typing import Callable, Dict, Iterator, List, Optional, Tuple, Union
 
 from gpt_index import download_loader
 from gpt_index.readers.base import BaseReader
@@ -25,6 +33,68 @@ DEFAULT_FILE_EXTRACTOR: Dict[str, str] = {
     ".html": "UnstructuredReader",
 }
 
+# Reader instances of this process, by loader name, so each is only resolved once.
+_READERS: Dict[str, BaseReader] = {}
+
+
+def _get_reader(reader_name: str) -> BaseReader:
+    if reader_name not in _READERS:
+        _READERS[reader_name] = download_loader(reader_name)()
+    return _READERS[reader_name]
+
+
+def _load_file(
+    input_file: Path, reader_name: str, metadata: Optional[Dict]
+) -> List[Document]:
+    """Load one file with a named reader. Runs in worker processes."""
+    return _get_reader(reader_name).load_data(file=input_file, extra_info=metadata)
+
+
+def _module_name() -> str:
+    return "_simple_directory_reader_" + hashlib.md5(__file__.encode()).hexdigest()[:8]
+
+
+def _importable_module():
+    """This module, registered in sys.modules so worker processes can find _load_file.
+
+    download_loader executes this file without registering it as a module.
+    """
+    name = _module_name()
+    if name not in sys.modules:
+        spec = importlib.util.spec_from_file_location(name, __file__)
+        module = importlib.util.module_from_spec(spec)
+        sys.modules[name] = module
+        spec.loader.exec_module(module)  # type: ignore
+    return sys.modules[name]
+
+
+# Run by exec() in each worker process before its first task, to register this module under
+# the same name as in the parent, so that _load_file can be unpickled. exec is a builtin, so
+# it can be passed as an initializer where a function of this file could not.
+_WORKER_BOOTSTRAP = """
+import importlib.util, sys
+spec = importlib.util.spec_from_file_location(name, path)
+module = importlib.util.module_from_spec(spec)
+sys.modules[name] = module
+spec.loader.exec_module(module)
+"""
+
+
+def _new_pool(num_workers: int) -> ProcessPoolExecutor:
+    """Worker processes started from a clean interpreter, never forked.
+
+    By the time files are parsed, the parent usually runs threads (the embedding scheduler,
+    Streamlit), and a child forked while one of them holds a lock would wait for it forever.
+    """
+    methods = multiprocessing.get_all_start_methods()
+    context = multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+    return ProcessPoolExecutor(
+        num_workers,
+        mp_context=context,
+        initializer=exec,
+        initargs=(_WORKER_BOOTSTRAP, {"name": _module_name(), "path": __file__}),
+    )
+
 
 class SimpleDirectoryReader(BaseReader):
     """Simple directory reader.
@@ -49,6 +119,12 @@ class SimpleDirectoryReader(BaseReader):
         file_metadata (Optional[Callable[str, Dict]]): A function that takes
             in a filename and returns a Dict of metadata for the Document.
             Default is None.
+        num_workers (Optional[int]): Number of processes that parse files with a
+            file extractor (PDF, DOCX, ...) in parallel. Default is None, which
+            parses them in this process.
+        cache_dir (Optional[str]): Directory in which the documents parsed by a
+            file extractor are cached, keyed on the file's path, mtime and size, so
+            unchanged files are not parsed again. Default is None (no cache).
     """
 
     def __init__(
@@ -61,6 +137,8 @@ class SimpleDirectoryReader(BaseReader):
         file_extractor: Optional[Dict[str, Union[str, BaseReader]]] = None,
         num_files_limit: Optional[int] = None,
         file_metadata: Optional[Callable[[str], Dict]] = None,
+        num_workers: Optional[int] = None,
+        cache_dir: Optional[str] = None,
     ) -> None:
         """Initialize with parameters."""
         super().__init__()
@@ -75,6 +153,8 @@ class SimpleDirectoryReader(BaseReader):
         self.input_files = self._add_files(self.input_dir)
         self.file_extractor = file_extractor or DEFAULT_FILE_EXTRACTOR
         self.file_metadata = file_metadata
+        self.num_workers = num_workers
+        self.cache_dir = Path(cache_dir) if cache_dir is not None else None
 
     def _add_files(self, input_dir: Path) -> List[Path]:
         """Add files."""
@@ -123,27 +203,136 @@ class SimpleDirectoryReader(BaseReader):
         """
 
         documents = []
-        for input_file in self.input_files:
-            metadata = None
-            if self.file_metadata is not None:
-                metadata = self.file_metadata(str(input_file))
+        for file_documents in self.load_files(self.input_files):
+            documents.extend(file_documents)
 
-            if input_file.suffix in self.file_extractor:
-                reader = self.file_extractor[input_file.suffix]
+        return documents
 
-                if isinstance(reader, str):
-                    reader = download_loader(reader)()
+    def lazy_load_data(self, batch_size: Optional[int] = None) -> Iterator[Document]:
+        """Load data from the input directory lazily.
 
-                extracted_documents = reader.load_data(
-                    file=input_file, extra_info=metadata
-                )
-                documents.extend(extracted_documents)
-            else:
-                data = ""
-                # do standard read
-                with open(input_file, "r", errors=self.errors) as f:
-                    data = f.read()
-                document = Document(data, extra_info=metadata)
-                documents.append(document)
+        Files are parsed batch_size at a time, and the next batch only once the
+        documents of the previous one have been consumed, so memory use does not
+        grow with the number of files.
 
-        return documents
+        Args:
+            batch_size (Optional[int]): Number of files parsed together. Defaults
+                to four per worker, and at least 16.
+
+        Returns:
+            Iterator[Document]: The documents of each file, in order.
+
+        """
+        for _, documents in self.lazy_load_files(batch_size=batch_size):
+            yield from documents
+
+    def load_files(self, input_files: List[Path]) -> List[List[Document]]:
+        """Documents of each file, in order."""
+        return [
+            documents
+            for _, documents in self.lazy_load_files(input_files, len(input_files) or 1)
+        ]
+
+    def lazy_load_files(
+        self,
+        input_files: Optional[List[Path]] = None,
+        batch_size: Optional[int] = None,
+    ) -> Iterator[Tuple[Path, List[Document]]]:
+        """(file, documents) for each file, in order, parsed in batches.
+
+        Files with a named file extractor are parsed in worker processes when
+        num_workers is set; cached documents are used for files that did not change.
+        Defaults to all input files, see lazy_load_data for batch_size.
+        """
+        if input_files is None:
+            input_files = self.input_files
+        if batch_size is None:
+            batch_size = max(4 * (self.num_workers or 1), 16)
+
+        pool: Optional[ProcessPoolExecutor] = None
+        try:
+            for start in range(0, len(input_files), batch_size):
+                batch = input_files[start : start + batch_size]
+                results: List[Optional[List[Document]]] = [None] * len(batch)
+                pooled = []
+                for i, input_file in enumerate(batch):
+                    metadata = None
+                    if self.file_metadata is not None:
+                        metadata = self.file_metadata(str(input_file))
+                    reader = self.file_extractor.get(input_file.suffix)
+                    cache_path = self._get_cache_path(input_file, reader, metadata)
+                    if cache_path is not None and cache_path.exists():
+                        with open(cache_path, "rb") as f:
+                            results[i] = pickle.load(f)
+                    elif isinstance(reader, str) and self.num_workers:
+                        if pool is None:
+                            pool = _new_pool(self.num_workers)
+                        future = pool.submit(
+                            _importable_module()._load_file, input_file, reader, metadata
+                        )
+                        pooled.append((i, cache_path, future))
+                    else:
+                        results[i] = self._load_file(input_file, reader, metadata)
+                        self._store(cache_path, results[i])
+
+                for i, cache_path, future in pooled:
+                    results[i] = future.result()
+                    self._store(cache_path, results[i])
+                yield from zip(batch, results)  # type: ignore
+        finally:
+            if pool is not None:
+                pool.shutdown()
+
+    def _load_file(
+        self,
+        input_file: Path,
+        reader: Optional[Union[str, BaseReader]],
+        metadata: Optional[Dict],
+    ) -> List[Document]:
+        """Load one file in this process."""
+        if reader is None:
+            data = ""
+            # do standard read
+            with open(input_file, "r", errors=self.errors) as f:
+                data = f.read()
+            return [Document(data, extra_info=metadata)]
+
+        if isinstance(reader, str):
+            reader = _get_reader(reader)
+        return reader.load_data(file=input_file, extra_info=metadata)
+
+    def _get_cache_path(
+        self,
+        input_file: Path,
+        reader: Optional[Union[str, BaseReader]],
+        metadata: Optional[Dict],
+    ) -> Optional[Path]:
+        """Path of the cached documents of a file, or None if it is not cached.
+
+        Files without a file extractor are read as text, which is as fast as the cache.
+        """
+        if self.cache_dir is None or reader is None:
+            return None
+        stat = input_file.stat()
+        key = json.dumps(
+            [
+                str(input_file.resolve()),
+                stat.st_mtime_ns,
+                stat.st_size,
+                reader if isinstance(reader, str) else type(reader).__name__,
+                self.errors,
+                metadata,
+            ],
+            sort_keys=True,
+            default=str,
+        )
+        return self.cache_dir / (hashlib.sha256(key.encode("utf-8")).hexdigest() + ".pkl")
+
+    def _store(self, cache_path: Optional[Path], documents: List[Document]) -> None:
+        if cache_path is None:
+            return
+        cache_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = cache_path.with_suffix(".tmp")
+        with open(tmp_path, "wb") as f:
+            pickle.dump(documents, f)
+        os.replace(tmp_path, cache_path)
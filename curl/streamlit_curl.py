@@ -2,6 +2,8 @@
 import sys
 sys.path.append("..")
 import data_loader
+from http_cache import HttpCache
+import html_text
 import streamlit as st
 
 import os
@@ -9,8 +11,6 @@ import requests
 from urllib.parse import urlparse
 from urllib.parse import urljoin
 
-from bs4 import BeautifulSoup
-
 headers = {
     'User-Agent': 'betterbingbawt 1.0',
 }
@@ -20,16 +20,23 @@ st.set_page_config(page_title="Curl", page_icon=":robot:")
 Downloads the URL from output folder and saves it.
 """
 def save_page(url, output_folder="../webpages"):
-    response = requests.get(url, headers=headers)
-    soup = BeautifulSoup(response.text, 'html.parser')
-    extracted_text = soup.get_text().strip()
-
     # Create output folder. this will be named based on the url, ex: www-paulgraham-com
     output_folder_name = urlparse(url).netloc.replace(".","-")
     output_folder_path = os.path.abspath(os.path.join(output_folder, output_folder_name))
     if not os.path.exists(output_folder_path):
         os.makedirs(output_folder_path)
 
+    # Skip extracting and writing the page if it has not changed since the last download.
+    cache = HttpCache(os.path.join(output_folder_path, HttpCache.FILE_NAME))
+    response = requests.get(url, headers={**headers, **cache.request_headers(url)})
+    if cache.is_unchanged(url, response.status_code, response.content, response.headers):
+        st.write("Unchanged since last download: " + url)
+        st.session_state["output_folder_path"] = output_folder_path
+        st.session_state["file_path"] = cache.get(url)["file_path"]
+        return
+
+    extracted_text, _ = html_text.extract(response.text)
+
     # Use URL path suffix to create filename. Strip leading "/".
     # Example: "http://www.paulgraham.com/talk.html" ->  "/talk.html" -> "talk.html"
     url_path = urlparse(url).path[1:]
@@ -50,6 +57,8 @@ def save_page(url, output_folder="../webpages"):
         st.text_area(label="Website Contents:", value=extracted_text)
         st.session_state["output_folder_path"] = output_folder_path
         st.session_state["file_path"] = file_path
+    cache.store(url, response.headers, response.content, file_path)
+    cache.save()
 
 
 st.header("Input the url you would like to download")
@@ -1,24 +1,232 @@
+import hashlib
+import importlib.util
+import json
 import os
 
 """Library for generating the index."""
-from gpt_index import GPTSimpleVectorIndex, GPTTreeIndex, download_loader
+from gpt_index import GPTSimpleVectorIndex, GPTTreeIndex
+from gpt_index.readers.schema.base import Document
+
+import ann
+import bm25
+import index_catalog
+import index_store
+import quantize
+from chunker import Chunker
+from embedding_cache import CachedOpenAIEmbedding
+from llm_scheduler import ScheduledLLMPredictor
+
+# Chunk sizes, in tokens. Queries answer from the top chunk, so vector index chunks are
+# large; tree leaves must fit ten to a summary prompt.
+VECTOR_CHUNK_TOKENS, VECTOR_OVERLAP_TOKENS = 1024, 128
+TREE_CHUNK_TOKENS, TREE_OVERLAP_TOKENS = 256, 0
+# Number of chunks update_index embeds together.
+EMBED_GROUP_SIZE = 2048
+# Number of files update_index parses together, in parallel.
+LOAD_GROUP_SIZE = 64
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+# This repo's copy of the SimpleDirectoryReader loader, which parses files in parallel and
+# caches their documents. download_loader only finds it when run from curl/.
+READER_PATH = os.path.join(REPO_DIR, 'curl', '.modules', 'file.py')
+DOCUMENT_CACHE_DIR = os.path.join(REPO_DIR, '.cache', 'documents')
+
+def create_index(input_folder_path, output_dir='./indexes/', incremental=False,
+                 num_files_limit=None, build_ann=False, ann_lists=None,
+                 quantize_dtype=None) -> GPTSimpleVectorIndex:
+    """Load data and return the generated index.
+
+    With incremental=True, only files added or changed since the last run are loaded and
+    embedded, see update_index; files are then streamed in bounded batches, which suits large
+    folders. The tree index needs all of its documents at once.
+    num_files_limit (default: no limit) caps the number of files read.
+    With build_ann=True, an IVF index with ann_lists lists (default about sqrt(nodes)) is
+    saved next to the index, see ann.py. This needs a vector index, i.e. incremental=True.
+    With quantize_dtype="int8" or "float16", a quantized copy of the embeddings is saved
+    next to the index and queries score it first, see quantize.py. This needs a vector index
+    too.
+    """
+    if incremental:
+        return update_index(input_folder_path, output_dir, num_files_limit, build_ann, ann_lists,
+                            quantize_dtype)
+    if build_ann:
+        raise ValueError("build_ann needs a vector index: use incremental=True.")
+    if quantize_dtype:
+        raise ValueError("quantize_dtype needs a vector index: use incremental=True.")
 
-def create_index(input_folder_path, output_dir='./indexes/') -> GPTSimpleVectorIndex:
-    """Load data and return the generated index."""
-    SimpleDirectoryReader = download_loader("SimpleDirectoryReader")
     input_file_path = os.path.abspath(input_folder_path)
 
     print("input:" + input_file_path)
-    loader = SimpleDirectoryReader(
-        input_file_path, recursive=True, exclude_hidden=True, num_files_limit=25)
-    documents = loader.load_data()
-    index = GPTTreeIndex(documents)
+    loader = get_reader(input_file_path, num_files_limit)
+    documents = split_documents(loader.lazy_load_data(),
+                                Chunker(TREE_CHUNK_TOKENS, TREE_OVERLAP_TOKENS))
+    # Summaries are requested through the shared scheduler, within its rate limits.
+    index = GPTTreeIndex(documents, llm_predictor=ScheduledLLMPredictor(),
+                         embed_model=CachedOpenAIEmbedding())
     print(index)
 
-    file_name = os.path.basename(input_file_path).split('/')[-1]
-    output_path = os.path.abspath(os.path.join(output_dir, f'index_{file_name}.json'))
+    output_path = get_index_path(input_file_path, output_dir)
     print("output_path:" + output_path)
-    index.save_to_disk(output_path)
+    save_index(index, output_path)
 
     return index
 
+
+def update_index(input_folder_path, output_dir='./indexes/', num_files_limit=None,
+                 build_ann=False, ann_lists=None, quantize_dtype=None) -> GPTSimpleVectorIndex:
+    """Incrementally update the vector index of a folder, and return it.
+
+    A manifest next to the index maps each file (relative to the folder) to the hash of its
+    contents and the ids of the documents loaded from it. Documents of unchanged files keep
+    their nodes and embeddings; deleted files have their documents removed; only new and
+    changed files are loaded and embedded. The tree index cannot delete documents, so
+    incremental indexes are always GPTSimpleVectorIndex. Each document is one chunk of a file
+    (see chunker.py); the manifest also records the chunking, and every file is re-indexed
+    when it changes.
+
+    Embeddings go through the shared embedding cache (see embedding_cache.py), so a chunk
+    whose text was already embedded, in this index or any other, is not embedded again.
+
+    The manifest records the digest of the index file it was written with. The two files
+    cannot be replaced together, so if they do not match (the process stopped between the
+    two writes) the index is rebuilt from every file, from the embedding cache, rather than
+    trusted. A tree index saved by create_index at the same path is never overwritten.
+    """
+    input_file_path = os.path.abspath(input_folder_path)
+    output_path = get_index_path(input_file_path, output_dir)
+    manifest_path = get_manifest_path(output_path)
+    if os.path.exists(output_path) and index_catalog.is_tree_index(output_path):
+        raise ValueError(f"{output_path} is a tree index, which update_index would replace "
+                         "with a vector index: remove it, or use another output_dir.")
+    print("input:" + input_file_path)
+
+    loader = get_reader(input_file_path, num_files_limit)
+    input_files = {os.path.relpath(str(f), input_file_path): f for f in loader.input_files}
+    current = {path: file_hash(f) for path, f in input_files.items()}
+
+    # Only reuse an index that was written by update_index, i.e. that has a manifest.
+    chunker = Chunker(VECTOR_CHUNK_TOKENS, VECTOR_OVERLAP_TOKENS)
+    manifest = {}
+    index = None
+    embed_model = CachedOpenAIEmbedding()
+    if os.path.exists(manifest_path) and os.path.exists(output_path):
+        with open(manifest_path) as f:
+            saved = json.load(f)
+        if saved.get("index_digest") != file_hash(output_path):
+            print("index and manifest do not match, re-indexing every file")
+        else:
+            manifest = saved["files"]
+            index = GPTSimpleVectorIndex.load_from_disk(output_path, embed_model=embed_model)
+            if saved.get("chunker") != chunker.settings():
+                print("chunking changed, re-indexing every file")
+                manifest = {path: dict(entry, hash=None) for path, entry in manifest.items()}
+    if index is None:
+        index = GPTSimpleVectorIndex([], embed_model=embed_model)
+
+    removed = [path for path in manifest if path not in current]
+    changed = [path for path, digest in current.items()
+               if path not in manifest or manifest[path]["hash"] != digest]
+    print(f"unchanged: {len(current) - len(changed)}, changed or new: {len(changed)}, "
+          f"removed: {len(removed)}")
+
+    for path in removed + changed:
+        for doc_id in manifest.get(path, {}).get("doc_ids", []):
+            if index.docstore.document_exists(doc_id):
+                index.delete(doc_id)
+        manifest.pop(path, None)
+
+    # Files are parsed lazily, in parallel groups. Their chunks are inserted as they are read,
+    # with embeddings deferred, and the embeddings of a bounded number of chunks are requested
+    # together in batched requests before the next files are read.
+    changed_files = loader.lazy_load_files([input_files[path] for path in changed], LOAD_GROUP_SIZE)
+    with embed_model.deferred():
+        for path, (_, documents) in zip(changed, changed_files):
+            documents = split_documents(documents, chunker)
+            for i, document in enumerate(documents):
+                # Stable ids, so the documents of this file can be found again on the next run.
+                document.doc_id = f"{path}#{i}"
+                index.insert(document)
+            manifest[path] = {"hash": current[path], "doc_ids": [d.doc_id for d in documents]}
+            if embed_model.num_deferred >= EMBED_GROUP_SIZE:
+                embed_model.flush()
+
+    print(embed_model.cache.format_stats())
+    print(embed_model.scheduler.format_stats())
+    print("output_path:" + output_path)
+    save_index(index, output_path)
+    write_atomically(manifest_path, json.dumps({
+        "files": manifest, "chunker": chunker.settings(), "index_digest": file_hash(output_path),
+    }))
+    # The keyword index is cheap to build and needs no API calls, so it is always kept fresh.
+    keywords = bm25.build_for_index_struct(index.index_struct, output_path)
+    print(f"bm25_path:{bm25.get_bm25_path(output_path)} ({len(keywords.terms)} terms)")
+    if build_ann:
+        ivf = ann.build_for_index_struct(index.index_struct, output_path, ann_lists)
+        print(f"ann_path:{ann.get_ann_path(output_path)} ({ivf.n_lists} lists)")
+    if quantize_dtype:
+        quantized = quantize.build_for_index_struct(index.index_struct, output_path,
+                                                    quantize_dtype)
+        print(f"quant_path:{quantize.get_quant_path(output_path)} "
+              f"({quantized.dtype}, {quantized.nbytes} bytes)")
+    return index
+
+
+def split_documents(documents, chunker):
+    """One document per chunk of each document, keeping its extra_info.
+
+    Chunks are made to fit the index, so gpt_index turns each into a single node.
+    """
+    return [Document(text, extra_info=document.extra_info)
+            for document in documents for text in chunker.split_text(document.get_text())]
+
+
+def get_reader(input_file_path, num_files_limit=None):
+    """SimpleDirectoryReader over a folder, parsing on every core and caching documents."""
+    spec = importlib.util.spec_from_file_location("simple_directory_reader", READER_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module.SimpleDirectoryReader(
+        input_file_path, recursive=True, exclude_hidden=True, num_files_limit=num_files_limit,
+        num_workers=os.cpu_count(), cache_dir=DOCUMENT_CACHE_DIR)
+
+
+def get_index_path(input_file_path, output_dir):
+    """Path of the index file for an input folder, ex: indexes/index_www-paulgraham-com.json"""
+    file_name = os.path.basename(input_file_path).split('/')[-1]
+    return os.path.abspath(os.path.join(output_dir, f'index_{file_name}.json'))
+
+
+def get_manifest_path(index_path):
+    """Path of the manifest used by update_index, ex: index_www-paulgraham-com.manifest.json"""
+    return os.path.splitext(index_path)[0] + '.manifest.json'
+
+
+def file_hash(path) -> str:
+    """SHA-256 of a file's contents."""
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+def save_index(index, output_path):
+    """Save an index so that readers never see a partially written file.
+
+    If the index was converted with index_store.py, the store is converted again, or removed
+    if the index is no longer a vector index, so that it is never loaded instead of the
+    newer JSON file.
+    """
+    write_atomically(output_path, index.save_to_string())
+    if index_store.store_exists(output_path):
+        if isinstance(index, GPTSimpleVectorIndex):
+            index_store.convert(output_path)
+        else:
+            index_store.remove(output_path)
+
+
+def write_atomically(path, contents):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        f.write(contents)
+    os.replace(tmp_path, path)
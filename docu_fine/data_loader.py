@@ -1,6 +1,17 @@
+import argparse
+import hashlib
+import json
 import os
+import sys
 import openai
 
+sys.path.append("..")
+from chunker import Chunker
+from llm_scheduler import Scheduler, get_backend
+
+# Each question is about one chunk of about a sentence or two.
+QA_CHUNK_TOKENS = 64
+
 openai.api_key = os.getenv("OPENAI_API_KEY")
 
 
@@ -71,27 +82,114 @@ Question:
     """
 
 
-def create_training_data(input_file, output_dir='./training_data/'):
-    """Load data and generate training data."""
+def get_output_paths(input_file, output_dir):
+    """./webpages/gap_pdf.txt -> training_data/gap_pdf.jsonl, training_data/gap_pdf.checkpoint.json"""
+    stem = os.path.join(output_dir, os.path.splitext(os.path.basename(input_file))[0])
+    return stem + ".jsonl", stem + ".checkpoint.json"
+
+
+def load_checkpoint(checkpoint_path, run_key):
+    """Whether the checkpoint was written by a run with the same input and settings."""
+    if not os.path.exists(checkpoint_path):
+        return False
+    with open(checkpoint_path) as f:
+        checkpoint = json.load(f)
+    if checkpoint["run"] != run_key:
+        print("input or settings changed since the checkpoint, starting over")
+        return False
+    return True
+
+
+def save_checkpoint(checkpoint_path, run_key):
+    with open(checkpoint_path + ".tmp", "w") as f:
+        json.dump({"run": run_key}, f)
+    os.replace(checkpoint_path + ".tmp", checkpoint_path)
+
+
+def read_done(output_path, chunks):
+    """Chunks that have a record in output_path, and the size of its complete records.
+
+    Each record's completion is its chunk; identical chunks are counted once per record. A
+    last line cut short by a crash is not a record.
+    """
+    unclaimed = {}
+    for i, chunk in enumerate(chunks):
+        unclaimed.setdefault(chunk, []).append(i)
+    done, output_bytes = set(), 0
+    if not os.path.exists(output_path):
+        return done, output_bytes
+    with open(output_path, "rb") as f:
+        for line in f:
+            try:
+                indices = unclaimed.get(json.loads(line)["completion"])
+            except (ValueError, KeyError):
+                break
+            if not line.endswith(b"\n"):
+                break
+            if indices:
+                done.add(indices.pop(0))
+            output_bytes += len(line)
+    return done, output_bytes
+
+
+def create_training_data(input_file, output_dir='./training_data/', parallelism=8,
+                         description="An SEC filing of Gap's recent financial reporting."):
+    """Generate a question for every chunk of input_file, as fine-tuning data.
+
+    Up to parallelism completions run at once. Each (question, chunk) pair is appended to
+    <output_dir>/<input name>.jsonl as {"prompt": question, "completion": chunk} as soon as it
+    completes. A checkpoint file next to it records the input and settings of the run, so
+    a restarted run with the same ones reads which chunks are done from the JSONL file and
+    only generates the chunks that are missing. Returns the path of the JSONL file.
+    """
     with open(input_file) as f:
-        lines = f.readlines()
-
-    description = "An SEC filing of Gap's recent financial reporting."
-
-    chunk = ""
-    for line in lines:
-        line.strip('\n')
-        chunk += line
-        if len(chunk) > 200:
-            prompt = generate_sentence_question(description, chunk)
-            response = openai.Completion.create(
-                model="text-davinci-003",
-                prompt=prompt,
-                temperature=0,
-                max_tokens=100,
-            )
-            print("Q:", response.choices[0].text, "\nA:", chunk, "\n\n")
-            chunk = ""
-
-
-create_training_data('./webpages/gap_pdf.txt')
+        chunks = Chunker(QA_CHUNK_TOKENS).split_text(f.read())
+
+    os.makedirs(output_dir, exist_ok=True)
+    output_path, checkpoint_path = get_output_paths(input_file, output_dir)
+    run_key = hashlib.sha256(json.dumps([chunks, description]).encode("utf-8")).hexdigest()
+    if load_checkpoint(checkpoint_path, run_key):
+        done, output_bytes = read_done(output_path, chunks)
+    else:
+        done, output_bytes = set(), 0
+    todo = [i for i in range(len(chunks)) if i not in done]
+    print(f"{len(chunks)} chunks, {len(done)} already done, {len(todo)} to generate")
+
+    scheduler = Scheduler(get_backend(), max_workers=parallelism)
+    prompts = (generate_sentence_question(description, chunks[i]) for i in todo)
+    with open(output_path, "a+b") as output:
+        # Drop a record cut short, or the output of another run: those chunks are generated
+        # again.
+        output.truncate(output_bytes)
+        output.flush()
+        save_checkpoint(checkpoint_path, run_key)
+        completions = scheduler.complete_unordered(
+            prompts,
+            model="text-davinci-003",
+            temperature=0,
+            max_tokens=100,
+        )
+        for position, question in completions:
+            i = todo[position]
+            record = {"prompt": question.strip(), "completion": chunks[i]}
+            output.write((json.dumps(record) + "\n").encode("utf-8"))
+            output.flush()
+            done.add(i)
+            print(f"[{len(done)}/{len(chunks)}] Q: {record['prompt']}")
+
+    print(scheduler.format_stats())
+    return output_path
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate QA fine-tuning data from a text file.")
+    parser.add_argument("input_file", nargs="?", default="./webpages/gap_pdf.txt")
+    parser.add_argument("--output-dir", default="./training_data/")
+    parser.add_argument("--parallelism", type=int, default=8,
+                        help="number of completion requests in flight at once")
+    args = parser.parse_args(argv)
+    print("output:", create_training_data(args.input_file, args.output_dir, args.parallelism))
+
+
+if __name__ == "__main__":
+    main()
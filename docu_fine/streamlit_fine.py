@@ -1,4 +1,3 @@
-from bs4 import BeautifulSoup
 from urllib.parse import urljoin
 from urllib.parse import urlparse
 import requests
@@ -6,6 +5,10 @@ import os
 import streamlit as st
 
 import sys
+# Used to include http_cache and html_text from the above directory
+sys.path.append("..")
+from http_cache import HttpCache
+import html_text
 
 st.set_page_config(page_title="Curl", page_icon=":robot:")
 """
@@ -15,9 +18,6 @@ Downloads the URL from output folder and saves it.
 
 def save_page(url, output_folder="./webpages"):
     print("Your url is:" + url)
-    response = requests.get(url)
-    soup = BeautifulSoup(response.text, 'html.parser')
-    extracted_text = soup.get_text().strip()
 
     # Use URL path suffix to create filename. Strip leading "/".
     # Example: "http://www.paulgraham.com/talk.html" ->  "/talk.html" -> "talk.html"
@@ -37,6 +37,15 @@ def save_page(url, output_folder="./webpages"):
     if not os.path.exists(output_folder_path):
         os.makedirs(output_folder_path)
 
+    # Skip extracting and writing the page if it has not changed since the last download.
+    cache = HttpCache(os.path.join(output_folder, output_folder_subfolder, HttpCache.FILE_NAME))
+    response = requests.get(url, headers=cache.request_headers(url))
+    if cache.is_unchanged(url, response.status_code, response.content, response.headers):
+        st.write("Unchanged since last download: " + url)
+        return
+
+    extracted_text, _ = html_text.extract(response.text)
+
     # Replace suffix with .txt
     # Example: "talk.html" -> "talk.txt"
     filename = filename + ".txt"
@@ -48,6 +57,8 @@ def save_page(url, output_folder="./webpages"):
         st.write("Downloaded: " + url)
         if st.button("Generate QA pairs!"):
             st.write("Generating QA pairs...")
+    cache.store(url, response.headers, response.content, file_path)
+    cache.save()
 
 
 st.header("Input the url you would like to download")
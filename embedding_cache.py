@@ -0,0 +1,219 @@
+"""Content-addressed cache of embeddings, shared by every index and by queries.
+
+Embeddings are keyed on (embedding engine, SHA-256 of the whitespace-normalized text) and
+stored as float32 blobs in one SQLite file, so rebuilding an index or asking the same
+question again never pays for the same embedding twice.
+"""
+import contextlib
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+from typing import List, Optional
+
+import numpy as np
+from gpt_index.embeddings.openai import (
+    _QUERY_MODE_MODEL_DICT,
+    _TEXT_MODE_MODEL_DICT,
+    OpenAIEmbedding,
+)
+
+import tracing
+from llm_scheduler import Scheduler, estimate_tokens, get_shared_scheduler
+
+# EMBEDDING_CACHE_PATH moves the cache, e.g. to start benchmarks from an empty one.
+DEFAULT_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH") or os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), ".cache", "embeddings.sqlite"
+)
+
+WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_text(text: str) -> str:
+    """Collapse whitespace. OpenAI embeds newlines as spaces anyway."""
+    return WHITESPACE.sub(" ", text).strip()
+
+
+def cache_key(model: str, text: str) -> bytes:
+    return hashlib.sha256(f"{model}\0{normalize_text(text)}".encode("utf-8")).digest()
+
+
+class EmbeddingCache:
+    """SQLite-backed embedding store with hit/miss counters.
+
+    Safe to share between threads (e.g. Streamlit sessions); each process opens its own
+    connection to the same file.
+    """
+
+    def __init__(self, path: str = DEFAULT_CACHE_PATH) -> None:
+        self.path = path
+        if os.path.dirname(path) and not os.path.exists(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings (key BLOB PRIMARY KEY, vector BLOB NOT NULL)"
+        )
+        self._conn.commit()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, model: str, text: str) -> Optional[List[float]]:
+        return self.get_many(model, [text])[0]
+
+    def get_many(self, model: str, texts: List[str]) -> List[Optional[List[float]]]:
+        """Cached embedding for each text, or None where there is none."""
+        keys = [cache_key(model, text) for text in texts]
+        found = {}
+        with self._lock:
+            # Stay well under SQLite's limit on query parameters.
+            for start in range(0, len(keys), 500):
+                chunk = keys[start:start + 500]
+                rows = self._conn.execute(
+                    "SELECT key, vector FROM embeddings WHERE key IN (%s)"
+                    % ",".join("?" * len(chunk)),
+                    chunk,
+                ).fetchall()
+                found.update(rows)
+            results = [
+                np.frombuffer(found[key], dtype=np.float32).tolist() if key in found else None
+                for key in keys
+            ]
+            hits = sum(r is not None for r in results)
+            self.hits += hits
+            self.misses += len(results) - hits
+        return results
+
+    def put(self, model: str, text: str, embedding: List[float]) -> None:
+        self.put_many(model, [text], [embedding])
+
+    def put_many(self, model: str, texts: List[str], embeddings: List[List[float]]) -> None:
+        rows = [
+            (cache_key(model, text), np.asarray(embedding, dtype=np.float32).tobytes())
+            for text, embedding in zip(texts, embeddings)
+        ]
+        with self._lock:
+            self._conn.executemany("INSERT OR REPLACE INTO embeddings VALUES (?, ?)", rows)
+            self._conn.commit()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def stats(self) -> dict:
+        """Hit/miss counts of this process, and the number of cached embeddings."""
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "size": len(self),
+        }
+
+    def format_stats(self) -> str:
+        stats = self.stats()
+        return (
+            f"embedding cache: {stats['hits']} hits, {stats['misses']} misses "
+            f"({stats['hit_rate']:.0%} hit rate), {stats['size']} embeddings stored"
+        )
+
+
+_shared_cache: Optional[EmbeddingCache] = None
+
+
+def get_shared_cache() -> EmbeddingCache:
+    """The process-wide cache at DEFAULT_CACHE_PATH."""
+    global _shared_cache
+    if _shared_cache is None:
+        _shared_cache = EmbeddingCache()
+    return _shared_cache
+
+
+class CachedOpenAIEmbedding(OpenAIEmbedding):
+    """OpenAIEmbedding that looks up embeddings in an EmbeddingCache before calling the API.
+
+    Missing embeddings are requested through a llm_scheduler.Scheduler, in batches.
+
+    Args:
+        cache (Optional[EmbeddingCache]): Cache to use. Defaults to the shared cache.
+        scheduler (Optional[Scheduler]): Scheduler to use. Defaults to the shared scheduler.
+        Other arguments are passed to OpenAIEmbedding.
+    """
+
+    def __init__(
+        self,
+        cache: Optional[EmbeddingCache] = None,
+        scheduler: Optional[Scheduler] = None,
+        **kwargs,
+    ) -> None:
+        """Init params."""
+        super().__init__(**kwargs)
+        # Not `cache or ...`: an empty cache has len() 0.
+        self.cache = cache if cache is not None else get_shared_cache()
+        self.scheduler = scheduler or get_shared_scheduler()
+        # (text, embedding list) of each text embedding deferred, see deferred().
+        self._deferred = None
+
+    def _engine(self, mode_model_dict: dict) -> str:
+        if self.deployment_name is not None:
+            return self.deployment_name
+        return mode_model_dict[(self.mode, self.model)]
+
+    def embed_texts(self, texts: List[str], query: bool = False) -> List[List[float]]:
+        """Embeddings of several texts: cached ones from the cache, the rest in batches."""
+        engine = self._engine(_QUERY_MODE_MODEL_DICT if query else _TEXT_MODE_MODEL_DICT)
+        with tracing.span("embed", texts=len(texts), query=query) as span:
+            embeddings = self.cache.get_many(engine, texts)
+            missing = list(dict.fromkeys(
+                text for text, embedding in zip(texts, embeddings) if embedding is None
+            ))
+            if missing:
+                # Only what is sent to the API counts: cached texts cost nothing.
+                span.set(sent=len(missing),
+                         tokens_in=sum(estimate_tokens(text) for text in missing))
+                computed = dict(zip(missing, self.scheduler.embed(missing, engine)))
+                self.cache.put_many(engine, missing, [computed[text] for text in missing])
+                embeddings = [computed[text] if embedding is None else embedding
+                              for text, embedding in zip(texts, embeddings)]
+        return embeddings
+
+    @contextlib.contextmanager
+    def deferred(self):
+        """Defer text embeddings until flush() or the end of the block, to batch them.
+
+        gpt_index embeds the chunks of a document one at a time, as it inserts them. Within
+        this block get_text_embedding returns an empty list at once, and flush() embeds every
+        text deferred so far in a few batched requests and fills in their lists. Nothing may
+        read those embeddings before they are flushed. If the block raises, they stay empty.
+        """
+        self._deferred = []
+        try:
+            yield self
+            self.flush()
+        finally:
+            self._deferred = None
+
+    @property
+    def num_deferred(self) -> int:
+        return len(self._deferred or ())
+
+    def flush(self) -> None:
+        """Embed the texts deferred so far; see deferred()."""
+        deferred, self._deferred = self._deferred, []
+        if deferred:
+            embeddings = self.embed_texts([text for text, _ in deferred])
+            for (_, vector), embedding in zip(deferred, embeddings):
+                vector.extend(embedding)
+
+    def _get_query_embedding(self, query: str) -> List[float]:
+        """Get query embedding."""
+        return self.embed_texts([query], query=True)[0]
+
+    def _get_text_embedding(self, text: str) -> List[float]:
+        """Get text embedding."""
+        if self._deferred is not None:
+            vector = []
+            self._deferred.append((text, vector))
+            return vector
+        return self.embed_texts([text])[0]
@@ -0,0 +1,97 @@
+"""Answer a question with a span of the retrieved text, without calling the LLM.
+
+Many questions are answered by one sentence of one node ("What is Gap's earnings per
+share?"). extract_answer splits the retrieved nodes into sentences (bullet points count as
+sentences too) and scores every span of one or two consecutive sentences by how much of
+the question it covers: the idf-weighted share of the question's terms that appear in the
+span. A span must also say something the question does not: a number, or a name (a
+capitalized word after the start of a sentence, or an acronym) that is not a question term.
+A span without such content, e.g. one that only restates the question ("Gap will discuss
+earnings per share on the call."), keeps NO_CONTENT_WEIGHT of its coverage. The result is
+the confidence of the answer; callers escalate to LLM synthesis below a threshold.
+
+Terms come from bm25.tokenize, so "earnings" does not match "earning", and question words
+(how, many, ...) are ignored.
+"""
+import re
+from typing import Callable, List, NamedTuple, Optional, Sequence
+
+from bm25 import tokenize
+
+# Sentence ends, blank lines, and line breaks before a bullet point.
+SPAN_BREAK = re.compile(r"(?<=[.!?])\s+|\n\s*\n|\n(?=\s*[•●▪o*-]\s)")
+MAX_SPAN_SENTENCES = 2
+# Longer "sentences" are usually tables or run-together text, not answers.
+MAX_SENTENCE_CHARS = 600
+QUESTION_WORDS = frozenset("""
+how many much does do did can could would should might may some any about tell give
+""".split())
+DEFAULT_THRESHOLD = 0.75
+# Share of its coverage a span without answer content keeps: below any useful threshold.
+NO_CONTENT_WEIGHT = 0.5
+
+
+class ExtractiveAnswer(NamedTuple):
+    text: str
+    # Share of the question's idf weight covered by the span, in [0, 1], times
+    # NO_CONTENT_WEIGHT if the span has no answer content.
+    confidence: float
+    # Position of the node the span was taken from in the nodes passed in.
+    node_position: int
+
+
+def question_terms(question: str) -> List[str]:
+    return sorted({term for term in tokenize(question) if term not in QUESTION_WORDS})
+
+
+def sentences(text: str) -> List[str]:
+    return [" ".join(sentence.split()) for sentence in SPAN_BREAK.split(text)
+            if sentence.strip() and len(sentence) <= MAX_SENTENCE_CHARS]
+
+
+def answer_content(sentence: str, terms) -> List[str]:
+    """Numbers and names in a sentence that are not among the question's terms."""
+    content = []
+    for i, word in enumerate(sentence.split()):
+        word = word.strip(".,;:!?()[]\"'")
+        is_number = any(c.isdigit() for c in word)
+        is_name = word[:1].isupper() and (i > 0 or (len(word) > 1 and word.isupper()))
+        if (is_number or is_name) and any(t not in terms for t in tokenize(word)):
+            content.append(word)
+    return content
+
+
+def extract_answer(
+    question: str, texts: Sequence[str], idf: Callable[[str], float]
+) -> Optional[ExtractiveAnswer]:
+    """The span of texts that best covers the question, or None if none shares a term.
+
+    texts are searched in order, and earlier texts win ties, so pass them best first.
+    """
+    weights = {term: idf(term) for term in question_terms(question)}
+    total = sum(weights.values())
+    if not total:
+        return None
+    best, best_key = None, None
+    for position, text in enumerate(texts):
+        spans = sentences(text)
+        span_terms = [set(tokenize(span)) & weights.keys() for span in spans]
+        span_content = [bool(answer_content(span, weights.keys())) for span in spans]
+        for start in range(len(spans)):
+            covered, has_content = set(), False
+            for end in range(start, min(start + MAX_SPAN_SENTENCES, len(spans))):
+                if end > start and not span_terms[end] - covered and has_content:
+                    # The next sentence adds no question term, and the span already has an
+                    # answer: a longer span is no better.
+                    break
+                covered |= span_terms[end]
+                has_content = has_content or span_content[end]
+                coverage = sum(weights[term] for term in covered) / total
+                confidence = coverage if has_content else coverage * NO_CONTENT_WEIGHT
+                # Higher confidence first, then fewer sentences.
+                key = (confidence, start - end)
+                if coverage and (best_key is None or key > best_key):
+                    best_key = key
+                    best = ExtractiveAnswer(" ".join(spans[start:end + 1]), confidence,
+                                            position)
+    return best
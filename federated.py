@@ -0,0 +1,247 @@
+"""Ask one question of several indexes at once, and answer it from all of them.
+
+federated_query retrieves candidates from every index concurrently, one thread each, so
+retrieval takes about as long as the slowest index rather than the sum of them all. The
+candidates are merged into one global top k, and a single answer is written from the merged
+context, streamed like stream_query's.
+
+How each index retrieves its candidates:
+
+    vector indexes      hybrid retrieval (or vector only, with keyword_weight=0), as when it
+                        is queried alone
+    tree indexes        their leaves, scored like the nodes of a vector index
+                        (retrieval.get_leaf_retriever) instead of chosen with the LLM
+    index server        indexes served by index_server, over POST /retrieve
+
+Each index ranks its candidates on a scale of its own: hybrid scores are min-max normalized
+over one index's candidates, so every index's best scores about 1.0 however well it matches
+the question. The merged candidates are ranked on one scale instead, the cosine similarity of
+their embedding to the question's, which is comparable across indexes because they all embed
+with the same model. The question is embedded once for every local index. A chunk found in
+several indexes is kept once.
+
+Usage:
+    python federated.py "question" [index name ...]    default: every index in indexes/
+"""
+import contextvars
+import logging
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+
+import index_catalog
+import tracing
+
+DEFAULT_TOP_K = 4
+
+
+class Candidate(NamedTuple):
+    """A chunk retrieved from one index."""
+
+    index: str
+    text: str
+    doc_id: Optional[str]
+    extra_info: Optional[dict]
+    # Cosine similarity to the question, comparable across indexes.
+    similarity: float
+    # The index's own score, e.g. a fused hybrid score.
+    score: float
+
+
+def keyword_weight(retrieval=None) -> float:
+    """The keyword_weight of a label of index_catalog.RETRIEVAL_MODES (default hybrid).
+
+    Keyword retrieval picks each index's candidates with BM25 alone; they are still ranked
+    by their similarity once merged.
+    """
+    modes = index_catalog.RETRIEVAL_MODES
+    kwargs = modes.get(retrieval, next(iter(modes.values())))
+    if kwargs.get("retrieval") == "bm25":
+        return 1.0
+    return kwargs.get("keyword_weight", 0.0)
+
+
+def retrieve(name, index, query_str, query_embedding, top_k, keyword_weight=0.0):
+    """The top_k Candidates of one index, best first by the index's own score."""
+    from gpt_index import GPTTreeIndex
+
+    from retrieval import FastVectorIndex, get_leaf_retriever, get_retriever
+
+    with tracing.span("retrieve", index=name) as span:
+        if isinstance(index, (FastVectorIndex, GPTTreeIndex)):
+            if isinstance(index, GPTTreeIndex):
+                retriever = get_leaf_retriever(index)
+            else:
+                retriever = get_retriever(index.index_struct)
+            if keyword_weight:
+                scores, similarities, rows = retriever.top_k_hybrid(
+                    query_embedding, query_str, top_k, keyword_weight)
+            else:
+                similarities, rows = retriever.top_k_batch([query_embedding], top_k)
+                found = rows[0] >= 0
+                similarities = scores = similarities[0][found]
+                rows = rows[0][found]
+            nodes = retriever.get_nodes([retriever.ids[row] for row in rows])
+            candidates = [
+                Candidate(name, node.get_text(), node.ref_doc_id, node.extra_info,
+                          float(similarity), float(score))
+                for node, similarity, score in zip(nodes, similarities, scores)
+            ]
+            span.set(retrieval="hybrid" if keyword_weight else "vector")
+        else:
+            # Served by index_server, which embeds the question itself.
+            similarities, nodes = index.retrieve_batch([query_str], top_k)[0]
+            candidates = [
+                Candidate(name, node["source_text"], node["doc_id"], node["extra_info"],
+                          similarity, similarity)
+                for node, similarity in zip(nodes, similarities)
+            ]
+            span.set(retrieval="remote")
+        span.set(doc_ids=[c.doc_id for c in candidates],
+                 similarities=[round(c.similarity, 4) for c in candidates])
+    return candidates
+
+
+def merge(candidates: List[List[Candidate]], top_k: int) -> List[Candidate]:
+    """The top_k most similar candidates of all indexes. A chunk found in several indexes is
+    kept once, with its best similarity."""
+    best = {}
+    for index_candidates in candidates:
+        for candidate in index_candidates:
+            text = candidate.text
+            if text not in best or candidate.similarity > best[text].similarity:
+                best[text] = candidate
+    return sorted(best.values(), key=lambda c: c.similarity, reverse=True)[:top_k]
+
+
+def retrieve_all(
+    indexes: Dict[str, object],
+    query_str: str,
+    top_k: int = DEFAULT_TOP_K,
+    keyword_weight: float = 0.0,
+    max_workers: Optional[int] = None,
+) -> Tuple[List[Candidate], Dict[str, str]]:
+    """(merged top_k Candidates, errors) of every index (name -> index), retrieved
+    concurrently, max_workers at a time (default: all of them).
+
+    An index that fails is left out, and its error is returned by name.
+    """
+    from index_server import RemoteIndex
+
+    local = [index for index in indexes.values() if not isinstance(index, RemoteIndex)]
+    query_embedding = None
+    if local:
+        # Every index embeds with the same cached model; embed the question once for all.
+        query_embedding = local[0].embed_model.get_query_embedding(query_str)
+    results, errors = [], {}
+    with ThreadPoolExecutor(max_workers or len(indexes) or 1) as pool:
+        futures = {
+            # In a copy of this context, so the spans of each index nest under the query's.
+            name: pool.submit(contextvars.copy_context().run, retrieve, name, index, query_str,
+                              query_embedding, top_k, keyword_weight)
+            for name, index in indexes.items()
+        }
+        for name, future in futures.items():
+            try:
+                results.append(future.result())
+            except Exception as e:
+                logging.warning(f"> Could not retrieve from {name}: {e}")
+                errors[name] = f"{type(e).__name__}: {e}"
+    return merge(results, top_k), errors
+
+
+def synthesize(query_str: str, candidates: List[Candidate], llm_predictor,
+               response_mode: str = "tree_summarize") -> str:
+    """One answer written from the text of every candidate, each headed with its index."""
+    from gpt_index.indices.prompt_helper import PromptHelper
+    from gpt_index.indices.response.builder import ResponseBuilder, ResponseMode, TextChunk
+    from gpt_index.prompts.default_prompts import DEFAULT_REFINE_PROMPT, DEFAULT_TEXT_QA_PROMPT
+
+    builder = ResponseBuilder(
+        PromptHelper.from_llm_predictor(llm_predictor), llm_predictor, DEFAULT_TEXT_QA_PROMPT,
+        DEFAULT_REFINE_PROMPT,
+        texts=[TextChunk(f"From {c.index}:\n{c.text}") for c in candidates])
+    with tracing.span("synthesize", response_mode=response_mode, chunks=len(candidates)):
+        return builder.get_response(query_str, mode=ResponseMode(response_mode)) or ""
+
+
+def federated_query(
+    indexes: Dict[str, object],
+    query_str: str,
+    on_token: Optional[Callable[[str, str], None]] = None,
+    on_sources: Optional[Callable[[list], None]] = None,
+    top_k: int = DEFAULT_TOP_K,
+    keyword_weight: float = 0.0,
+    response_mode: str = "tree_summarize",
+    max_workers: Optional[int] = None,
+):
+    """Answer query_str from the top_k chunks of all the indexes (name -> index).
+
+    Reports progress like streaming.stream_query: on_sources(source_nodes) once the merged
+    candidates are known, with the name of their index in extra_info["index"], then
+    on_token(token, answer) as the answer is written. Returns a gpt_index Response whose
+    extra_info lists the indexes asked, and the errors of any that failed.
+    """
+    from gpt_index.response.schema import Response, SourceNode
+
+    from llm_scheduler import StreamingLLMPredictor
+
+    streamed = []
+
+    def send_token(token, answer):
+        if not streamed:
+            streamed.append(True)
+        if on_token is not None:
+            on_token(token, answer)
+
+    with tracing.span("query", query=query_str, indexes=len(indexes)) as span:
+        candidates, errors = retrieve_all(indexes, query_str, top_k, keyword_weight,
+                                          max_workers)
+        source_nodes = [
+            SourceNode(c.text, c.doc_id, extra_info=dict(c.extra_info or {}, index=c.index),
+                       similarity=c.similarity)
+            for c in candidates
+        ]
+        if on_sources is not None:
+            on_sources(source_nodes)
+        answer = ""
+        if candidates:
+            answer = synthesize(query_str, candidates, StreamingLLMPredictor(send_token),
+                                response_mode)
+        if not streamed and answer:
+            send_token(answer, answer)
+        extra_info = {"federated": list(indexes)}
+        if errors:
+            extra_info["errors"] = errors
+        span.set(errors=len(errors))
+    return Response(answer, source_nodes=source_nodes, extra_info=extra_info)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        sys.exit(__doc__)
+    from index_server import connect
+
+    spans = []
+    tracing.enable().add_sink(spans.append)
+    paths = index_catalog.gather_indexes(index_catalog.INDEX_DIR)
+    names = sys.argv[2:] or sorted(paths)
+    unknown = [name for name in names if name not in paths]
+    if unknown:
+        sys.exit(f"unknown indexes: {', '.join(unknown)}; known: {', '.join(sorted(paths))}")
+    # Use the index server's loaded indexes if one is running, like main.py.
+    client = connect()
+    load = client.get_index if client is not None else index_catalog.load_index
+    indexes = {name: load(paths[name]) for name in names}
+
+    print("Answer: ", end="")
+    response = federated_query(indexes, sys.argv[1],
+                               on_token=lambda token, answer: print(token, end="", flush=True),
+                               keyword_weight=keyword_weight())
+    print("\n\nSources:")
+    for node in response.source_nodes:
+        print(f"> [{node.extra_info['index']}, similarity {node.similarity:.3f}] "
+              f"{' '.join(node.source_text.split())[:150]}")
+    for name, error in response.extra_info.get("errors", {}).items():
+        print(f"> [{name}] failed: {error}")
+    print("\nTrace:\n" + tracing.format_spans(spans))
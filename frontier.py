@@ -0,0 +1,196 @@
+"""Crawl frontier: URL normalization, a compact seen-set, and resumable BFS state."""
+import bisect
+import hashlib
+import json
+import os
+import posixpath
+from array import array
+from collections import deque
+from urllib.parse import parse_qsl, urlencode, urlparse, urlunparse
+
+# Query parameters that only track where a click came from, never what page is served.
+TRACKING_PARAMS = {"fbclid", "gclid", "mc_cid", "mc_eid", "ref", "_ga"}
+DEFAULT_PORTS = {"http": 80, "https": 443}
+
+
+def normalize_url(url):
+    """Return the canonical form of a URL, so equivalent URLs are only crawled once.
+
+    Example: "HTTP://Example.com:80/a/./b/?utm_source=x&z=1&a=2#top" -> "http://example.com/a/b/?a=2&z=1"
+
+    The trailing slash is kept: "/a/" and "/a" can be different pages, and relative links on
+    them resolve differently. Only used as a key; pages are fetched from the URL as found.
+    """
+    parsed = urlparse(url.strip())
+    scheme = parsed.scheme.lower()
+    host = (parsed.hostname or "").lower()
+    if parsed.port is not None and parsed.port != DEFAULT_PORTS.get(scheme):
+        host = "%s:%d" % (host, parsed.port)
+
+    # Resolve "." and "..", and collapse "//".
+    path = posixpath.normpath(parsed.path) if parsed.path else "/"
+    if path.startswith("//"):
+        path = "/" + path.lstrip("/")
+    if path == ".":
+        path = "/"
+    if parsed.path.endswith(("/", "/.", "/..")) and not path.endswith("/"):
+        path += "/"
+
+    query = [(k, v) for k, v in parse_qsl(parsed.query, keep_blank_values=True)
+             if not k.lower().startswith("utm") and k.lower() not in TRACKING_PARAMS]
+    return urlunparse((scheme, host, path, "", urlencode(sorted(query)), ""))
+
+
+def url_hash(url):
+    """64-bit hash of a normalized URL."""
+    return int.from_bytes(hashlib.blake2b(url.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+class SeenSet:
+    """Set of URLs that have already been queued.
+
+    Only a 64-bit hash of each URL is kept, in a sorted array of unsigned 64-bit ints
+    (8 bytes per URL, under 1 MB for 100k URLs). New hashes go to a small buffer set
+    that is merged into the sorted array once it grows past buffer_size.
+    """
+
+    def __init__(self, buffer_size=4096):
+        self.hashes = array("Q")
+        self.buffer = set()
+        self.buffer_size = buffer_size
+
+    def __len__(self):
+        return len(self.hashes) + len(self.buffer)
+
+    def __contains__(self, url):
+        h = url_hash(url)
+        if h in self.buffer:
+            return True
+        i = bisect.bisect_left(self.hashes, h)
+        return i < len(self.hashes) and self.hashes[i] == h
+
+    def add(self, url):
+        """Add a URL. Returns False if it was already in the set."""
+        if url in self:
+            return False
+        self.buffer.add(url_hash(url))
+        if len(self.buffer) >= self.buffer_size:
+            self._merge()
+        return True
+
+    def _merge(self):
+        self.hashes = array("Q", sorted(self.hashes.tolist() + list(self.buffer)))
+        self.buffer = set()
+
+    def save(self, path):
+        self._merge()
+        with open(path, "wb") as f:
+            self.hashes.tofile(f)
+
+    @classmethod
+    def load(cls, path, buffer_size=4096):
+        seen = cls(buffer_size)
+        with open(path, "rb") as f:
+            seen.hashes.frombytes(f.read())
+        return seen
+
+
+class Frontier:
+    """Breadth-first crawl frontier with a depth limit and a page budget.
+
+    max_depth - links are followed up to this many hops from the seed (the seed is depth 0)
+    max_pages - stop handing out URLs after this many pages
+    state_dir - if set, save() writes the frontier there and Frontier.load() resumes it
+    seed      - URL the crawl started from, saved with the frontier so that a crawl of another
+                site does not resume it
+
+    URLs handed out by pop() stay "in progress" until mark_done(); a saved frontier puts them
+    back at the head of the queue, so an interrupted crawl refetches at most those pages.
+    URLs are queued as they were found; the seen-set holds their normalize_url() form.
+    """
+
+    QUEUE_FILE = "frontier.json"
+    SEEN_FILE = "seen.bin"
+
+    def __init__(self, max_depth=1, max_pages=1000, state_dir=None, seed=None):
+        self.max_depth = max_depth
+        self.max_pages = max_pages
+        self.state_dir = state_dir
+        self.seed = normalize_url(seed) if seed else None
+        self.queue = deque()
+        self.in_progress = {}
+        self.seen = SeenSet()
+        self.pages_done = 0
+
+    def __len__(self):
+        return len(self.queue)
+
+    def add(self, url, depth):
+        """Queue a URL found at this depth, unless it is too deep or was already queued."""
+        if depth > self.max_depth:
+            return False
+        if not self.seen.add(normalize_url(url)):
+            return False
+        self.queue.append((url, depth))
+        return True
+
+    def has_next(self):
+        return bool(self.queue) and self.pages_done + len(self.in_progress) < self.max_pages
+
+    def pop(self):
+        """Return the next (url, depth) to crawl."""
+        url, depth = self.queue.popleft()
+        self.in_progress[url] = depth
+        return url, depth
+
+    def mark_done(self, url):
+        del self.in_progress[url]
+        self.pages_done += 1
+
+    def finished(self):
+        return not self.has_next() and not self.in_progress
+
+    def save(self):
+        """Write the frontier to state_dir.
+
+        The queue is replaced before the seen-set. If the process stops between the two, the
+        queue holds URLs that the old seen-set lacks; load() adds them back, so no queued URL
+        is ever lost.
+        """
+        if self.state_dir is None:
+            return
+        if not os.path.exists(self.state_dir):
+            os.makedirs(self.state_dir)
+        state = {
+            "seed": self.seed,
+            "max_depth": self.max_depth,
+            "max_pages": self.max_pages,
+            "pages_done": self.pages_done,
+            "queue": list(self.in_progress.items()) + list(self.queue),
+        }
+        queue_path = os.path.join(self.state_dir, self.QUEUE_FILE)
+        with open(queue_path + ".tmp", "w") as f:
+            json.dump(state, f)
+        os.replace(queue_path + ".tmp", queue_path)
+        seen_path = os.path.join(self.state_dir, self.SEEN_FILE)
+        self.seen.save(seen_path + ".tmp")
+        os.replace(seen_path + ".tmp", seen_path)
+
+    @classmethod
+    def load(cls, state_dir):
+        """Load a frontier saved by save(), or return None if state_dir has none."""
+        queue_path = os.path.join(state_dir, cls.QUEUE_FILE)
+        if not os.path.exists(queue_path):
+            return None
+        with open(queue_path) as f:
+            state = json.load(f)
+        frontier = cls(state["max_depth"], state["max_pages"], state_dir, state.get("seed"))
+        frontier.pages_done = state["pages_done"]
+        frontier.queue.extend((url, depth) for url, depth in state["queue"])
+        seen_path = os.path.join(state_dir, cls.SEEN_FILE)
+        if os.path.exists(seen_path):
+            frontier.seen = SeenSet.load(seen_path)
+        # The queue may be newer than the seen-set, see save().
+        for url, _ in frontier.queue:
+            frontier.seen.add(normalize_url(url))
+        return frontier
@@ -0,0 +1,76 @@
+"""Single-pass HTML to text extractor.
+
+Streams the page through lxml's HTML parser with a callback target instead of building a
+tree, collecting the visible text and the link targets in the same pass.
+"""
+import re
+
+from lxml import etree
+
+# Elements whose contents are never shown on the page.
+SKIP_TAGS = {"script", "style", "noscript", "template", "svg", "iframe", "object"}
+
+# Elements that start a new line of text.
+BLOCK_TAGS = {
+    "address", "article", "aside", "blockquote", "br", "dd", "div", "dl", "dt", "fieldset",
+    "figcaption", "figure", "footer", "form", "h1", "h2", "h3", "h4", "h5", "h6", "header",
+    "hr", "li", "main", "nav", "ol", "p", "pre", "section", "table", "td", "th", "title",
+    "tr", "ul",
+}
+
+BLANK_LINES = re.compile(r"\n[ \t\r\f\v]*(?:\n[ \t\r\f\v]*)+\n")
+
+
+class _TextTarget:
+    """lxml parser target that keeps visible text and <a href> values."""
+
+    def __init__(self):
+        self.parts = []
+        self.links = []
+        self.skip_depth = 0
+
+    def start(self, tag, attrib):
+        if tag in SKIP_TAGS:
+            self.skip_depth += 1
+        elif tag == "a":
+            href = attrib.get("href")
+            if href is not None:
+                self.links.append(href)
+        elif tag in BLOCK_TAGS and not self.skip_depth:
+            self.parts.append("\n")
+
+    def end(self, tag):
+        if tag in SKIP_TAGS:
+            self.skip_depth = max(self.skip_depth - 1, 0)
+        elif tag in BLOCK_TAGS and not self.skip_depth:
+            self.parts.append("\n")
+
+    def data(self, data):
+        if not self.skip_depth:
+            self.parts.append(data)
+
+    def comment(self, text):
+        pass
+
+    def close(self):
+        text = "".join(self.parts)
+        # Collapse runs of blank lines left behind by markup.
+        return BLANK_LINES.sub("\n\n", text).strip(), self.links
+
+
+def extract(html):
+    """Return (visible text, list of href values) for an HTML page.
+
+    Pass the decoded str when the HTTP response already told us the charset; bytes are
+    decoded from the page's own <meta charset>, or as latin-1 if it has none.
+    """
+    if not html:
+        return "", []
+    target = _TextTarget()
+    parser = etree.HTMLParser(target=target, remove_comments=True)
+    parser.feed(html)
+    try:
+        return parser.close()
+    except etree.XMLSyntaxError:
+        # Nothing parseable in the page, e.g. only whitespace.
+        return "", []
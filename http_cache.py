@@ -0,0 +1,131 @@
+"""On-disk HTTP cache of validators, so re-downloading an unchanged page costs only headers."""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+
+class HttpCache:
+    """Per-URL ETag, Last-Modified and body digest, stored in a SQLite file.
+
+    Usage:
+        cache = HttpCache(os.path.join(output_folder, HttpCache.FILE_NAME))
+        response = requests.get(url, headers=cache.request_headers(url))
+        if not cache.is_unchanged(url, response.status_code, response.content, response.headers):
+            ... extract and write file_path ...
+            cache.store(url, response.headers, response.content, file_path)
+        cache.save()
+
+    Each entry also remembers the file the page was written to, the links found on the
+    page (so a crawl can continue past an unchanged page), and when the body last changed.
+    store() updates one row and save() commits the rows changed since the last save, so
+    saving after every page costs the same however many pages are cached. A cache saved as
+    JSON by earlier versions (LEGACY_FILE_NAME, in the same folder) is imported once.
+    """
+
+    FILE_NAME = ".http_cache.sqlite"
+    LEGACY_FILE_NAME = ".http_cache.json"
+
+    def __init__(self, path):
+        self.path = path
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS pages (url TEXT PRIMARY KEY, etag TEXT, "
+            "last_modified TEXT, digest TEXT NOT NULL, file_path TEXT NOT NULL, "
+            "links TEXT NOT NULL, changed_at REAL NOT NULL)"
+        )
+        self._lock = threading.Lock()
+        legacy_path = os.path.join(os.path.dirname(path), self.LEGACY_FILE_NAME)
+        if os.path.exists(legacy_path) and not len(self):
+            with open(legacy_path) as f:
+                for url, entry in json.load(f).items():
+                    self._put(url, entry)
+        self._conn.commit()
+
+    def _put(self, url, entry):
+        self._conn.execute(
+            "INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (url, entry.get("etag"), entry.get("last_modified"), entry["digest"],
+             entry["file_path"], json.dumps(entry.get("links") or []), entry["changed_at"]))
+
+    def get(self, url):
+        """The entry of a URL, as a dict, or None."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT etag, last_modified, digest, file_path, links, changed_at FROM pages "
+                "WHERE url = ?", (url,)).fetchone()
+        if row is None:
+            return None
+        return {"etag": row[0], "last_modified": row[1], "digest": row[2], "file_path": row[3],
+                "links": json.loads(row[4]), "changed_at": row[5]}
+
+    def __len__(self):
+        return self._conn.execute("SELECT COUNT(*) FROM pages").fetchone()[0]
+
+    def request_headers(self, url):
+        """Conditional request headers for this URL, if we still have its file."""
+        entry = self.get(url)
+        if entry is None or not os.path.exists(entry["file_path"]):
+            return {}
+        headers = {}
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def is_unchanged(self, url, status, content, headers=None):
+        """True if the server answered 304, or sent the same body as last time.
+
+        A 200 with the same body may still carry new validators: with headers given, they
+        replace the stored ones, so the next request can be answered with a 304.
+        """
+        entry = self.get(url)
+        if entry is None or not os.path.exists(entry["file_path"]):
+            return False
+        if status == 304:
+            return True
+        if status != 200 or entry["digest"] != digest(content):
+            return False
+        if headers is not None:
+            with self._lock:
+                self._conn.execute(
+                    "UPDATE pages SET etag = ?, last_modified = ? WHERE url = ?",
+                    (headers.get("ETag"), headers.get("Last-Modified"), url))
+        return True
+
+    def store(self, url, headers, content, file_path, links=None):
+        """Record the validators of a page that was just written to file_path."""
+        with self._lock:
+            self._put(url, {
+                "etag": headers.get("ETag"),
+                "last_modified": headers.get("Last-Modified"),
+                "digest": digest(content),
+                "file_path": file_path,
+                "links": links,
+                "changed_at": time.time(),
+            })
+
+    def get_links(self, url):
+        return self.get(url)["links"]
+
+    def changed_files(self, since=0.0):
+        """Files whose page body changed after the given timestamp."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT file_path FROM pages WHERE changed_at > ? ORDER BY file_path",
+                (since,)).fetchall()
+        return [row[0] for row in rows]
+
+    def save(self):
+        """Commit the entries stored since the last save."""
+        with self._lock:
+            self._conn.commit()
+
+
+def digest(content):
+    if isinstance(content, str):
+        content = content.encode("utf-8")
+    return hashlib.sha256(content).hexdigest()
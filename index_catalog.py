@@ -0,0 +1,145 @@
+"""The saved indexes the apps offer, and how to load one.
+
+Shared by streamlit_main.py, main.py and index_server.py. Nothing heavy is imported until an
+index is actually loaded.
+"""
+import os
+from pathlib import Path
+
+INDEX_DIR = "./indexes/"
+
+# Pre-generated indexes offered in the app: display name -> index file.
+option_files = {
+    'Paul Graham essays': 'indexes/index_1676177220783.json',
+    # 'GPT Index documentation': 'indexes/index_1676182223692.json'),
+    'Marc Andreessen blog': 'indexes/index_pmarchive-com.json',
+    'The Jefferson Bible': 'indexes/index_bible.json',
+    'Gap Earnings': 'indexes/index_pdf.json'
+}
+
+# Offered after option_files: a question to every index in INDEX_DIR at once (federated.py).
+FEDERATED_OPTION = 'All indexes (federated)'
+
+# How a vector index can retrieve the nodes that answer a question: label -> query kwargs.
+# Keyword retrieval (retrieval.KEYWORD_RETRIEVAL) makes no embedding call.
+RETRIEVAL_MODES = {
+    'Hybrid (keywords + embeddings)': {'mode': 'default', 'keyword_weight': 0.5},
+    'Vector (embeddings)': {'mode': 'default'},
+    'Keyword (BM25)': {'mode': 'default', 'retrieval': 'bm25'},
+}
+
+# Query kwargs of vector indexes that opt in to extractive answers: answer with a sentence of
+# the retrieved text when it covers the question (retrieval.EXTRACTIVE_RESPONSE_MODE), and
+# summarize with the LLM otherwise.
+EXTRACTIVE_QUERY_KWARGS = {'response_mode': 'extractive',
+                           'fallback_response_mode': 'tree_summarize'}
+
+
+def query_kwargs(path, retrieval=None, extractive=False):
+    """Arguments of index.query for the index at path: the retrieval mode (label of
+    RETRIEVAL_MODES, default hybrid) and extractive answers (off by default) apply to vector
+    indexes."""
+    if is_tree_index(path):
+        return {'mode': 'default', 'response_mode': 'tree_summarize'}
+    kwargs = dict(RETRIEVAL_MODES.get(retrieval, next(iter(RETRIEVAL_MODES.values()))))
+    kwargs.update(EXTRACTIVE_QUERY_KWARGS if extractive
+                  else {'response_mode': 'tree_summarize'})
+    return kwargs
+
+# Files saved next to an index that are not indexes themselves: the update_index manifest,
+# the index_store files, and the ANN and BM25 indexes.
+SIDECAR_SUFFIXES = (".manifest.json", ".meta.json", ".f32", ".texts", ".offsets", ".ivf.npz",
+                    ".bm25.npz", ".quant.npz", ".tmp")
+
+# The index struct is saved before the docstore, and starts with these keys; see is_tree_index.
+TREE_KEY = '"all_nodes"'
+VECTOR_KEY = '"nodes_dict"'
+HEAD_BYTES = 1 << 16
+
+
+def index_name(path):
+    """indexes/index_bible.json -> bible"""
+    return Path(path).stem.replace("index_", "")
+
+
+"""
+Given a path, return a dictionary of all indexes in this path.
+Key: Name of the index
+Value: Path of this index
+"""
+def gather_indexes(directory):
+    file_paths = {}
+    for file_or_folder in os.listdir(directory):
+        file_or_directory_path = os.path.join(directory, file_or_folder)
+        if not os.path.isfile(file_or_directory_path):
+            # skip folders
+            continue
+        if not file_or_folder.endswith(".json") or file_or_folder.endswith(SIDECAR_SUFFIXES):
+            continue
+
+        file_paths[index_name(file_or_directory_path)] = file_or_directory_path
+    return file_paths
+
+
+def is_tree_index(path):
+    """Whether the index saved at path is a GPTTreeIndex rather than a vector index.
+
+    Only the head of the file is read: the index struct comes first, and a tree's node map
+    (all_nodes) comes before any node text, as does a vector index's nodes_dict.
+    """
+    import index_store
+
+    if index_store.has_store(path):
+        return False
+    with open(path, encoding="utf-8", errors="ignore") as f:
+        head = f.read(HEAD_BYTES)
+    tree, vector = head.find(TREE_KEY), head.find(VECTOR_KEY)
+    return tree >= 0 and (vector < 0 or tree < vector)
+
+
+def get_mtime(path):
+    """Latest modification time of an index and the files loaded with it."""
+    import ann
+    import bm25
+    import index_store
+    import quantize
+
+    prefix = index_store.get_store_prefix(path)
+    paths = [path, prefix + index_store.META_EXT, prefix + index_store.EMBEDDINGS_EXT,
+             ann.get_ann_path(path), bm25.get_bm25_path(path), quantize.get_quant_path(path)]
+    return max(os.stat(p).st_mtime_ns for p in paths if os.path.exists(p))
+
+
+def load_index(path):
+    """Load the index saved at path, with a cached embedding model."""
+    from gpt_index import GPTTreeIndex
+
+    import index_store
+    import tracing
+    from embedding_cache import CachedOpenAIEmbedding
+    from llm_scheduler import ScheduledLLMPredictor
+    from retrieval import FastVectorIndex
+
+    with tracing.span("load", index=index_name(path)) as span:
+        # Query embeddings are cached too, so repeated questions skip the embedding call.
+        # Completions of queries that are not streamed go through the shared scheduler (and
+        # LLM_BACKEND) too.
+        kwargs = {"embed_model": CachedOpenAIEmbedding(), "llm_predictor": ScheduledLLMPredictor()}
+        if is_tree_index(path):
+            span.set(kind="tree")
+            return GPTTreeIndex.load_from_disk(path, **kwargs)
+        elif index_store.has_store(path):
+            # Converted with `python index_store.py convert`: memory-map it, not parse JSON.
+            span.set(kind="store")
+            index = FastVectorIndex.from_store(
+                index_store.MmapVectorStore.from_index_path(path), **kwargs)
+        else:
+            span.set(kind="vector")
+            index = FastVectorIndex.load_from_disk(path, **kwargs)
+        # Use the approximate nearest-neighbour index built by `python ann.py build`, if any.
+        index.load_ann(path)
+        # And the keyword index saved with it, for KEYWORD_RETRIEVAL queries.
+        index.load_bm25(path)
+        # And the quantized embeddings built by `python quantize.py build`, if any.
+        index.load_quantized(path)
+        return index
@@ -0,0 +1,325 @@
+"""Loaded indexes kept within a memory budget, for the Streamlit app.
+
+streamlit_main used to keep every index that any session selected in st.cache_resource, for
+the life of the server. IndexManager keeps them in least recently used order and estimates
+the memory each one holds (estimate_bytes). When a load takes the total over the budget, the
+least recently used indexes are dropped until it fits. Pinned indexes are loaded at startup
+and never dropped.
+
+Sessions ask the manager for an index each time they answer a question, instead of keeping
+it, so an evicted index is freed once the questions still using it are answered. A federated
+question asks for all of its indexes at once (get_many): none of them is evicted to make room
+for another, and a selection that does not fit in the budget is reported rather than loaded
+and evicted in turn.
+
+Configured with environment variables:
+
+    INDEX_MEMORY_BUDGET_MB=512          the budget, in MB (default 1024)
+    INDEX_PRELOAD=Gap Earnings,bible    indexes to pin: names of index_catalog.option_files
+                                        or of gather_indexes, or index files
+
+`python index_manager.py [budget_mb]` loads every index in indexes/ through a manager with
+that budget, and prints what each one holds and what was evicted.
+"""
+import gc
+import os
+import sys
+import threading
+import time
+from collections import Counter, OrderedDict
+from typing import Callable, Iterable, Optional
+
+import index_catalog
+
+MB = 1 << 20
+DEFAULT_BUDGET_MB = 1024
+
+# Embeddings loaded from JSON are lists of Python floats: 8 bytes of list per float (counted by
+# sys.getsizeof) and a 24-byte float object.
+FLOAT_OBJECT_BYTES = 24
+# A Node or Document, besides its text and embedding.
+OBJECT_BYTES = 1000
+# A term of a BM25 index, in its term list and term -> id dict.
+TERM_BYTES = 150
+
+
+def _array_bytes(obj) -> int:
+    """Bytes of the numpy arrays held by obj, except memory-mapped ones, which the OS can
+    page out."""
+    # Imported here: the Streamlit app imports this module before its first paint.
+    import numpy as np
+
+    return sum(value.nbytes for value in vars(obj).values()
+               if isinstance(value, np.ndarray) and not isinstance(value, np.memmap))
+
+
+def estimate_bytes(index) -> int:
+    """Approximate memory held by a loaded index: its node and document texts, its
+    embeddings, and the arrays of its retriever (see retrieval.py) once it has one.
+
+    Indexes served by index_server hold nothing in this process.
+    """
+    index_struct = getattr(index, "index_struct", None)
+    if index_struct is None:
+        return 0
+    # A tree's nodes, or a vector index's.
+    nodes = getattr(index_struct, "all_nodes", None)
+    if nodes is None:
+        nodes = getattr(index_struct, "nodes_dict", {})
+    nodes = list(nodes.values())
+    docs = list(index.docstore.docs.values())
+    texts = [node.text for node in nodes] + [getattr(doc, "text", None) for doc in docs]
+    embeddings = list(getattr(index_struct, "embedding_dict", {}).values())
+    embeddings += [node.embedding for node in nodes if node.embedding]
+    total = sum(sys.getsizeof(text) for text in texts if text)
+    total += OBJECT_BYTES * (len(nodes) + len(docs))
+    total += sum(sys.getsizeof(e) + FLOAT_OBJECT_BYTES * len(e) for e in embeddings)
+    retriever = getattr(index_struct, "_retriever", None)
+    if retriever is not None:
+        total += _array_bytes(retriever)
+        for part in (retriever.bm25, retriever.ann, retriever.quantized):
+            if part is not None:
+                total += _array_bytes(part)
+        if retriever.bm25 is not None:
+            total += TERM_BYTES * len(retriever.bm25.terms)
+    return total
+
+
+def _retriever_parts(index) -> tuple:
+    """Ids of the retriever of an index and of the parts attached to it, which change when
+    estimate_bytes would change after the index is loaded."""
+    retriever = getattr(getattr(index, "index_struct", None), "_retriever", None)
+    if retriever is None:
+        return ()
+    return (id(retriever), id(retriever.bm25), id(retriever.ann), id(retriever.quantized))
+
+
+def resolve_path(name_or_path: str) -> str:
+    """The index file of an app option, of an index name in indexes/, or a path."""
+    if name_or_path in index_catalog.option_files:
+        return index_catalog.option_files[name_or_path]
+    gathered = index_catalog.gather_indexes(index_catalog.INDEX_DIR)
+    return gathered.get(name_or_path, name_or_path)
+
+
+def load_index(path: str):
+    """The index at path: the index server's, if one is running, or loaded in this process."""
+    from index_server import connect
+
+    client = connect()
+    if client is not None:
+        return client.get_index(path)
+    return index_catalog.load_index(path)
+
+
+class _Entry:
+    def __init__(self, index, size):
+        self.index = index
+        self.bytes = size
+        self.parts = _retriever_parts(index)
+
+    def refresh(self):
+        """Estimate the size again if a retriever was built or attached since the last
+        estimate: queries build one the first time they search an index."""
+        parts = _retriever_parts(self.index)
+        if parts != self.parts:
+            self.bytes = estimate_bytes(self.index)
+            self.parts = parts
+
+
+class IndexManager:
+    """Loaded indexes by file, the least recently used evicted past a memory budget.
+
+    Safe to share between threads (e.g. Streamlit sessions); concurrent requests for an index
+    that is not loaded wait for one load.
+
+    Args:
+        budget_bytes: memory the indexes may hold, as estimate_bytes estimates it.
+        pinned: index files loaded by preload() and never evicted.
+        load: loads the index at a path. Defaults to load_index().
+    """
+
+    def __init__(self, budget_bytes: int = DEFAULT_BUDGET_MB * MB, pinned: Iterable[str] = (),
+                 load: Optional[Callable] = None) -> None:
+        self.budget_bytes = budget_bytes
+        self.pinned = [os.path.abspath(path) for path in pinned]
+        self._load = load or load_index
+        # Path -> _Entry, least recently used first.
+        self._entries = OrderedDict()
+        # Path -> lock held while it loads.
+        self._loading = {}
+        self._lock = threading.Lock()
+        self.counts = Counter()
+
+    def get(self, path: str):
+        """The index at path, loaded first if it is not, and now the most recently used."""
+        path = os.path.abspath(path)
+        return self._get(path, keep={path})
+
+    def get_many(self, paths: Iterable[str]) -> list:
+        """The indexes at paths, in order, as get() loads them, but none of them is evicted
+        to make room for another: they are used together. A selection that does not fit in
+        the budget is reported, and kept until the next load evicts it."""
+        paths = [os.path.abspath(path) for path in paths]
+        indexes = [self._get(path, keep=set(paths)) for path in paths]
+        with self._lock:
+            selected = sum(self._entries[path].bytes for path in set(paths)
+                           if path in self._entries)
+        if selected > self.budget_bytes:
+            print(f"> the {len(indexes)} selected indexes hold {selected / MB:.1f} MB, over the "
+                  f"{self.budget_bytes / MB:.0f} MB budget: select fewer, or raise "
+                  f"INDEX_MEMORY_BUDGET_MB")
+        return indexes
+
+    def _get(self, path, keep):
+        index = self._use(path)
+        if index is not None:
+            return index
+        with self._lock:
+            loading = self._loading.setdefault(path, threading.Lock())
+        with loading:
+            # Loaded by another thread while this one waited.
+            index = self._use(path)
+            if index is not None:
+                return index
+            try:
+                start = time.perf_counter()
+                index = self._load(path)
+                seconds = time.perf_counter() - start
+                size = estimate_bytes(index)
+                with self._lock:
+                    self._entries[path] = _Entry(index, size)
+                    self.counts["loads"] += 1
+                    evicted = self._evict_over_budget(keep)
+            finally:
+                # Threads already waiting on it find the index loaded; later ones find it
+                # in _entries, or load it again if this load failed.
+                with self._lock:
+                    if self._loading.get(path) is loading:
+                        del self._loading[path]
+        print(f"loaded {index_catalog.index_name(path)} ({size / MB:.1f} MB) in "
+              f"{seconds:.3f}s; {self.format_stats()}")
+        if evicted:
+            # Indexes hold reference cycles (an index struct and its retriever), which only
+            # the garbage collector frees.
+            gc.collect()
+        return index
+
+    def _use(self, path):
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is None:
+                return None
+            self._entries.move_to_end(path)
+            self.counts["hits"] += 1
+            return entry.index
+
+    def _evict_over_budget(self, keep) -> list:
+        """Evict the least recently used indexes, other than those in keep and the pinned
+        ones, until the rest fit in the budget. The sizes of indexes whose retriever changed
+        since they were estimated are estimated again first."""
+        for entry in self._entries.values():
+            entry.refresh()
+        evicted = []
+        for path in list(self._entries):
+            if self.resident_bytes() <= self.budget_bytes:
+                break
+            if path not in keep and path not in self.pinned:
+                evicted.append(path)
+                self._remove(path)
+        if self.resident_bytes() > self.budget_bytes:
+            print(f"> indexes hold {self.resident_bytes() / MB:.1f} MB, over the "
+                  f"{self.budget_bytes / MB:.0f} MB budget, with nothing left to evict")
+        for path in evicted:
+            print(f"evicted {index_catalog.index_name(path)}")
+        return evicted
+
+    def _remove(self, path):
+        entry = self._entries.pop(path)
+        self.counts["evictions"] += 1
+        self.counts["evicted_bytes"] += entry.bytes
+
+    def evict(self, path: str) -> bool:
+        """Drop the index at path, pinned or not. Returns False if it was not loaded."""
+        path = os.path.abspath(path)
+        with self._lock:
+            if path not in self._entries:
+                return False
+            self._remove(path)
+        gc.collect()
+        return True
+
+    def preload(self) -> None:
+        """Load the pinned indexes. An index that fails to load is reported and skipped."""
+        for path in self.pinned:
+            try:
+                self.get(path)
+            except Exception as e:
+                print(f"> could not preload {path}: {e}")
+
+    def resident_bytes(self) -> int:
+        return sum(entry.bytes for entry in self._entries.values())
+
+    def __contains__(self, path) -> bool:
+        return os.path.abspath(path) in self._entries
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> dict:
+        """The loaded indexes, least recently used first, and the load, hit and eviction
+        counts of this process."""
+        with self._lock:
+            for entry in self._entries.values():
+                entry.refresh()
+            loaded = [{"name": index_catalog.index_name(path), "path": path,
+                       "mb": round(entry.bytes / MB, 2), "pinned": path in self.pinned}
+                      for path, entry in self._entries.items()]
+            resident = self.resident_bytes()
+        return {
+            "loaded": loaded,
+            "resident_mb": round(resident / MB, 2),
+            "budget_mb": round(self.budget_bytes / MB, 2),
+            "hits": self.counts["hits"],
+            "loads": self.counts["loads"],
+            "evictions": self.counts["evictions"],
+            "evicted_mb": round(self.counts["evicted_bytes"] / MB, 2),
+        }
+
+    def format_stats(self) -> str:
+        stats = self.stats()
+        return (
+            f"index manager: {len(stats['loaded'])} indexes loaded, {stats['resident_mb']:.1f} "
+            f"of {stats['budget_mb']:.0f} MB; {stats['loads']} loads, {stats['hits']} hits, "
+            f"{stats['evictions']} evictions ({stats['evicted_mb']:.1f} MB)"
+        )
+
+
+_shared_manager: Optional[IndexManager] = None
+_shared_lock = threading.Lock()
+
+
+def get_shared_manager() -> IndexManager:
+    """The process-wide manager, set up from INDEX_MEMORY_BUDGET_MB and INDEX_PRELOAD.
+
+    Its pinned indexes start loading in the background when it is first asked for.
+    """
+    global _shared_manager
+    with _shared_lock:
+        if _shared_manager is None:
+            budget_mb = float(os.getenv("INDEX_MEMORY_BUDGET_MB") or DEFAULT_BUDGET_MB)
+            preload = [resolve_path(name.strip())
+                       for name in os.getenv("INDEX_PRELOAD", "").split(",") if name.strip()]
+            _shared_manager = IndexManager(int(budget_mb * MB), pinned=preload)
+            if preload:
+                threading.Thread(target=_shared_manager.preload, daemon=True).start()
+        return _shared_manager
+
+
+if __name__ == "__main__":
+    budget_mb = float(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_BUDGET_MB
+    manager = IndexManager(int(budget_mb * MB), load=index_catalog.load_index)
+    for name, path in sorted(index_catalog.gather_indexes(index_catalog.INDEX_DIR).items()):
+        manager.get(path)
+    for entry in manager.stats()["loaded"]:
+        print(f"{entry['name']}: {entry['mb']:.2f} MB")
@@ -0,0 +1,446 @@
+"""Serve the saved indexes from one process, so the apps share them instead of loading them.
+
+Every Streamlit session and every run of main.py used to parse its own copy of an index.
+IndexServer loads the indexes of index_catalog (the app's options and everything in
+indexes/) once, answers retrieval and query requests for them over HTTP on localhost, and
+reloads an index when its files change on disk. Queries keep using the old copy until the
+new one has loaded.
+
+IndexClient is the thin client: connect() returns one if a server is running, and
+IndexClient.get_index returns an object that can be queried like a local index, so the apps
+use the server when there is one and load indexes themselves otherwise.
+
+Endpoints (JSON):
+    GET  /health
+    GET  /indexes                                    names, paths and whether they are loaded
+    GET  /metrics                                    latency histograms of the traced stages
+                                                     of queries, for Prometheus (tracing.py)
+    POST /retrieve {"index", "queries", "top_k"}     top nodes of an index, no LLM call (the
+                                                     leaves of a tree index)
+    POST /query    {"index", "query", "kwargs"}      index.query(query, **kwargs)
+    POST /query    {..., "stream": true}             the same, as JSON lines: {"source_nodes"}
+                                                     when retrieved, a {"token"} per piece of
+                                                     the answer, then the whole response
+
+"index" is a name from GET /indexes or the path of an index file.
+
+Usage:
+    python index_server.py serve [port]
+"""
+import json
+import os
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, NamedTuple, Optional
+
+import index_catalog
+import streaming
+import tracing
+
+DEFAULT_PORT = 8766
+DEFAULT_URL = os.getenv("INDEX_SERVER_URL", f"http://127.0.0.1:{DEFAULT_PORT}")
+# Seconds between checks for changed index files.
+RELOAD_INTERVAL = 2.0
+
+
+class _Entry:
+    def __init__(self, path):
+        self.path = path
+        self.index = None
+        self.mtime = None
+        self.error = None
+        # Held while loading, so concurrent requests wait for one load instead of each
+        # starting their own.
+        self.lock = threading.Lock()
+
+
+class IndexServer:
+    """The loaded indexes, by name.
+
+    Args:
+        paths: index name -> index file. Defaults to index_catalog.option_files and
+            index_catalog.gather_indexes(index_catalog.INDEX_DIR).
+    """
+
+    def __init__(self, paths: Optional[Dict[str, str]] = None):
+        if paths is None:
+            paths = dict(index_catalog.option_files)
+            paths.update(index_catalog.gather_indexes(index_catalog.INDEX_DIR))
+        self.entries = {}
+        self.lock = threading.Lock()
+        # The same file may be listed under several names (an option and its file name).
+        for name, path in paths.items():
+            self.add(name, path)
+
+    def add(self, name, path):
+        path = os.path.abspath(path)
+        with self.lock:
+            for entry in self.entries.values():
+                if entry.path == path:
+                    self.entries[name] = entry
+                    return entry
+            entry = self.entries[name] = _Entry(path)
+            return entry
+
+    def resolve(self, name_or_path) -> _Entry:
+        """The entry for an index name or file; a file that is not listed yet is added."""
+        entry = self.entries.get(name_or_path)
+        if entry is not None:
+            return entry
+        path = os.path.abspath(name_or_path)
+        for entry in list(self.entries.values()):
+            if entry.path == path:
+                return entry
+        if name_or_path.endswith(".json") and os.path.isfile(path):
+            return self.add(index_catalog.index_name(path), path)
+        raise KeyError(f"unknown index {name_or_path!r}")
+
+    def _load(self, entry):
+        start = time.perf_counter()
+        mtime = index_catalog.get_mtime(entry.path)
+        index = index_catalog.load_index(entry.path)
+        entry.index, entry.mtime, entry.error = index, mtime, None
+        print(f"loaded {entry.path} in {time.perf_counter() - start:.3f}s")
+
+    def get(self, name_or_path):
+        """The loaded index, loading it first if needed."""
+        entry = self.resolve(name_or_path)
+        if entry.index is None:
+            with entry.lock:
+                if entry.index is None:
+                    if not os.path.exists(entry.path):
+                        raise KeyError(f"index file {entry.path} does not exist")
+                    self._load(entry)
+        return entry.index
+
+    def load_all(self):
+        for entry in self._unique_entries():
+            try:
+                self.get(entry.path)
+            except Exception as e:
+                entry.error = str(e)
+                print(f"could not load {entry.path}: {e}")
+
+    def reload_changed(self) -> List[str]:
+        """Reload the loaded indexes whose files changed. Returns their paths."""
+        reloaded = []
+        for entry in self._unique_entries():
+            if entry.index is None or not os.path.exists(entry.path):
+                continue
+            if index_catalog.get_mtime(entry.path) == entry.mtime:
+                continue
+            with entry.lock:
+                try:
+                    self._load(entry)
+                    reloaded.append(entry.path)
+                except Exception as e:
+                    # E.g. caught mid-write: keep serving the old copy and retry next time.
+                    entry.error = str(e)
+                    print(f"could not reload {entry.path}: {e}")
+        return reloaded
+
+    def watch(self, interval=RELOAD_INTERVAL):
+        """Reload changed indexes every interval seconds, in a background thread."""
+        def loop():
+            while True:
+                time.sleep(interval)
+                self.reload_changed()
+
+        threading.Thread(target=loop, daemon=True).start()
+
+    def _unique_entries(self):
+        return list({id(entry): entry for entry in self.entries.values()}.values())
+
+    def describe(self):
+        return [
+            {"name": name, "path": entry.path, "loaded": entry.index is not None,
+             "error": entry.error}
+            for name, entry in self.entries.items()
+        ]
+
+    def retrieve(self, name_or_path, queries, top_k=1):
+        index = self.get(name_or_path)
+        if hasattr(index, "retrieve_batch"):
+            results = index.retrieve_batch(queries, top_k)
+        else:
+            # A tree index: its leaves, scored like the nodes of a vector index.
+            from retrieval import get_leaf_retriever
+
+            retriever = get_leaf_retriever(index)
+            results = [retriever.retrieve(index.embed_model.get_query_embedding(query), top_k)
+                       for query in queries]
+        return [
+            [_node_json(node, similarity) for similarity, node in zip(similarities, nodes)]
+            for similarities, nodes in results
+        ]
+
+    def query(self, name_or_path, query, on_token=None, on_sources=None, **kwargs):
+        index = self.get(name_or_path)
+        if on_token is None and on_sources is None:
+            with tracing.span("query", query=query,
+                              index=index_catalog.index_name(name_or_path)):
+                response = index.query(query, **kwargs)
+        else:
+            response = streaming.stream_query(index, query, on_token, on_sources, **kwargs)
+        return response_json(response)
+
+
+def response_json(response):
+    """A Response as JSON; RemoteResponse(**response_json(response)) reads it back."""
+    return {"response": response.response,
+            "source_nodes": _source_nodes_json(response.source_nodes),
+            "extra_info": response.extra_info}
+
+
+def _node_json(node, similarity):
+    return {"source_text": node.get_text(), "doc_id": node.ref_doc_id,
+            "extra_info": node.extra_info, "similarity": similarity}
+
+
+def _source_nodes_json(source_nodes):
+    return [{"source_text": node.source_text, "doc_id": node.doc_id,
+             "extra_info": node.extra_info, "similarity": node.similarity}
+            for node in source_nodes]
+
+
+class _IndexHandler(BaseHTTPRequestHandler):
+    """Answers the index server's endpoints from an IndexServer."""
+
+    indexes = None
+
+    def do_GET(self):
+        if self.path == "/health":
+            self._reply(200, {"ok": True})
+        elif self.path == "/indexes":
+            self._reply(200, {"indexes": self.indexes.describe()})
+        elif self.path == "/metrics":
+            data = tracing.get_tracer().histograms.prometheus_text().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+        else:
+            self._reply(404, {"error": f"unknown endpoint {self.path}"})
+
+    def do_POST(self):
+        request = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        try:
+            if self.path == "/retrieve":
+                body = {"results": self.indexes.retrieve(
+                    request["index"], request["queries"], request.get("top_k", 1))}
+            elif self.path == "/query" and request.get("stream"):
+                self._stream_query(request)
+                return
+            elif self.path == "/query":
+                body = self.indexes.query(request["index"], request["query"],
+                                          **request.get("kwargs", {}))
+            else:
+                self._reply(404, {"error": f"unknown endpoint {self.path}"})
+                return
+        except KeyError as e:
+            self._reply(404, {"error": str(e.args[0] if e.args else e)})
+            return
+        except (TypeError, ValueError) as e:
+            self._reply(400, {"error": str(e)})
+            return
+        except Exception as e:
+            self._reply(500, {"error": f"{type(e).__name__}: {e}"})
+            return
+        self._reply(200, body)
+
+    def _stream_query(self, request):
+        """Answer /query with "stream": true. Errors after the reply started are sent as an
+        {"error"} line."""
+        index = request["index"]
+        try:
+            self.indexes.get(index)
+        except KeyError as e:
+            self._reply(404, {"error": str(e.args[0] if e.args else e)})
+            return
+        except Exception as e:
+            # E.g. an index file that does not parse: nothing was sent yet, so reply as /query.
+            print(f"could not load {index}: {type(e).__name__}: {e}")
+            self._reply(500, {"error": f"{type(e).__name__}: {e}"})
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.end_headers()
+
+        def send(event):
+            self.wfile.write(json.dumps(event).encode("utf-8") + b"\n")
+            self.wfile.flush()
+
+        try:
+            body = self.indexes.query(
+                index, request["query"],
+                on_token=lambda token, answer: send({"token": token}),
+                on_sources=lambda nodes: send({"source_nodes": _source_nodes_json(nodes)}),
+                **request.get("kwargs", {}))
+        except Exception as e:
+            print(f"query of {index} failed: {type(e).__name__}: {e}")
+            try:
+                send({"error": f"{type(e).__name__}: {e}"})
+            except OSError:
+                pass  # The client went away, which may be what failed.
+            return
+        send(body)
+
+    def _reply(self, status, body):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(port=DEFAULT_PORT, indexes=None, preload=True, reload_interval=RELOAD_INTERVAL):
+    """Start an index server on localhost in background threads, and return it.
+
+    It answers right away; with preload, every index is loaded in the background, and
+    requests for an index that is still loading wait for it.
+    """
+    indexes = indexes or IndexServer()
+    handler = type("IndexHandler", (_IndexHandler,), {"indexes": indexes})
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    server.indexes = indexes
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    if preload:
+        threading.Thread(target=indexes.load_all, daemon=True).start()
+    if reload_interval:
+        indexes.watch(reload_interval)
+    return server
+
+
+class RemoteSourceNode(NamedTuple):
+    source_text: str
+    doc_id: Optional[str]
+    extra_info: Optional[dict] = None
+    similarity: Optional[float] = None
+
+
+class RemoteResponse:
+    """The answer to a query, like gpt_index's Response."""
+
+    def __init__(self, response, source_nodes, extra_info=None):
+        self.response = response
+        self.source_nodes = [RemoteSourceNode(**node) for node in source_nodes]
+        self.extra_info = extra_info
+
+    def __str__(self):
+        return self.response or "None"
+
+    def get_formatted_sources(self, length=100):
+        return streaming.format_sources(self.source_nodes, length)
+
+
+class RemoteIndex:
+    """An index served by an index server, queried like a local one."""
+
+    def __init__(self, client, name):
+        self.client = client
+        self.name = name
+
+    def query(self, query_str, **kwargs):
+        return self.client.query(self.name, query_str, **kwargs)
+
+    def stream_query(self, query_str, on_token=None, on_sources=None, **kwargs):
+        return self.client.stream_query(self.name, query_str, on_token, on_sources, **kwargs)
+
+    def retrieve_batch(self, queries, similarity_top_k=1):
+        """(similarities, source node dicts) per question."""
+        return [
+            ([node["similarity"] for node in nodes], nodes)
+            for nodes in self.client.retrieve(self.name, queries, similarity_top_k)
+        ]
+
+
+class IndexClient:
+    def __init__(self, url=DEFAULT_URL, timeout=600):
+        self.url = url.rstrip("/")
+        self.timeout = timeout
+
+    def _open(self, path, body=None, timeout=None):
+        data = None if body is None else json.dumps(body).encode("utf-8")
+        request = urllib.request.Request(self.url + path, data=data,
+                                         headers={"Content-Type": "application/json"})
+        try:
+            return urllib.request.urlopen(request, timeout=timeout or self.timeout)
+        except urllib.error.HTTPError as e:
+            message = json.load(e).get("error", str(e))
+            raise (KeyError if e.code == 404 else RuntimeError)(message) from None
+
+    def _request(self, path, body=None, timeout=None):
+        with self._open(path, body, timeout) as f:
+            return json.load(f)
+
+    def healthy(self, timeout=0.5):
+        try:
+            return self._request("/health", timeout=timeout).get("ok", False)
+        except (OSError, ValueError):
+            return False
+
+    def indexes(self):
+        return self._request("/indexes")["indexes"]
+
+    def retrieve(self, index, queries, top_k=1):
+        return self._request("/retrieve", {"index": _remote_name(index), "queries": list(queries),
+                                           "top_k": top_k})["results"]
+
+    def query(self, index, query, **kwargs):
+        body = self._request("/query", {"index": _remote_name(index), "query": query,
+                                        "kwargs": kwargs})
+        return RemoteResponse(body["response"], body["source_nodes"], body.get("extra_info"))
+
+    def stream_query(self, index, query, on_token=None, on_sources=None, **kwargs):
+        """query(), calling on_sources and on_token(token, answer) as the server answers."""
+        answer = ""
+        body = {"index": _remote_name(index), "query": query, "kwargs": kwargs, "stream": True}
+        with self._open("/query", body) as f:
+            for line in f:
+                event = json.loads(line)
+                if "error" in event:
+                    raise RuntimeError(event["error"])
+                elif "token" in event:
+                    answer += event["token"]
+                    if on_token is not None:
+                        on_token(event["token"], answer)
+                elif "response" in event:
+                    return RemoteResponse(event["response"], event["source_nodes"],
+                                          event.get("extra_info"))
+                elif on_sources is not None:
+                    on_sources([RemoteSourceNode(**node) for node in event["source_nodes"]])
+        raise RuntimeError("the index server closed the stream before answering")
+
+    def get_index(self, index):
+        return RemoteIndex(self, index)
+
+
+def _remote_name(index):
+    # Paths are resolved by the server, which may run in another directory.
+    return os.path.abspath(index) if index.endswith(".json") else index
+
+
+def connect(url=DEFAULT_URL) -> Optional[IndexClient]:
+    """A client for the index server at url, or None if none is running."""
+    client = IndexClient(url)
+    return client if client.healthy() else None
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] != "serve":
+        print(__doc__)
+        sys.exit(1)
+    # Queries are traced for /metrics; TRACE_JSONL also writes every span to a file.
+    tracing.enable()
+    server = serve(int(sys.argv[2]) if len(sys.argv) > 2 else DEFAULT_PORT)
+    print(f"index server on http://127.0.0.1:{server.server_port}")
+    threading.Event().wait()
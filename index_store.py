@@ -0,0 +1,242 @@
+"""Compact on-disk format for vector indexes.
+
+A GPTSimpleVectorIndex saved as JSON stores every embedding as a list of Python floats, so
+loading it parses megabytes of JSON and allocates millions of float objects. convert() writes
+the same index as four files next to the JSON file:
+
+    index_<name>.f32        float32 embedding matrix, row-major (count x dim)
+    index_<name>.texts      UTF-8 node texts, concatenated
+    index_<name>.offsets    int64 byte offsets into .texts (count + 1)
+    index_<name>.meta.json  dim, count and the small per-node fields (ids, doc ids, info)
+
+MmapVectorStore opens the matrix and offsets with numpy.memmap, so nothing is read until it
+is used, and only reads the texts of the nodes that are asked for.
+
+The meta file records the modification time and size of the JSON file it was converted
+from. has_store() only reports a store that matches its JSON file: once the JSON file is
+rewritten (e.g. by data_loader.update_index, which converts it again), an old store is
+ignored, with a warning, and the JSON file is loaded instead.
+
+Usage:
+    python index_store.py convert indexes/index_pmarchive-com.json
+    python index_store.py verify indexes/*.json
+"""
+import functools
+import json
+import logging
+import os
+import sys
+
+import numpy as np
+
+EMBEDDINGS_EXT = ".f32"
+TEXTS_EXT = ".texts"
+OFFSETS_EXT = ".offsets"
+META_EXT = ".meta.json"
+
+
+def get_store_prefix(index_path):
+    """indexes/index_bible.json -> indexes/index_bible"""
+    return os.path.splitext(index_path)[0]
+
+
+def store_exists(index_path):
+    """Whether index_path was ever converted, even if the store is stale."""
+    return os.path.exists(get_store_prefix(index_path) + META_EXT)
+
+
+def has_store(index_path):
+    """Whether index_path has a store converted from its current contents."""
+    meta_path = get_store_prefix(index_path) + META_EXT
+    if not os.path.exists(meta_path):
+        return False
+    if not os.path.exists(index_path):
+        return True
+    stamp = _source_stamp(index_path)
+    if _read_source(meta_path, os.stat(meta_path).st_mtime_ns) != stamp:
+        _warn_stale(index_path, stamp["mtime_ns"])
+        return False
+    return True
+
+
+def _source_stamp(index_path):
+    stat = os.stat(index_path)
+    return {"mtime_ns": stat.st_mtime_ns, "size": stat.st_size}
+
+
+@functools.lru_cache(maxsize=256)
+def _read_source(meta_path, meta_mtime_ns):
+    """The source stamp in a meta file, read once per version of the file."""
+    with open(meta_path) as f:
+        return json.load(f).get("source")
+
+
+@functools.lru_cache(maxsize=256)
+def _warn_stale(index_path, mtime_ns):
+    """Warn once per version of a stale index."""
+    logging.warning(f"> {index_path} changed since it was converted, loading the JSON file; "
+                    f"run `python index_store.py convert {index_path}` to use the store again")
+
+
+def convert(index_path, prefix=None):
+    """Convert a GPTSimpleVectorIndex JSON file to the compact format, and return the prefix."""
+    prefix = prefix or get_store_prefix(index_path)
+    # Before reading, so that a write during the conversion leaves the store stale.
+    source = _source_stamp(index_path)
+    with open(index_path) as f:
+        index_struct = json.load(f)["index_struct"]
+    if "embedding_dict" not in index_struct:
+        raise ValueError(f"{index_path} is not a vector index: it has no embeddings.")
+
+    embedding_dict = index_struct["embedding_dict"]
+    nodes_dict = index_struct["nodes_dict"]
+    text_ids = list(embedding_dict.keys())
+    nodes = [nodes_dict[str(index_struct["id_map"][text_id])] for text_id in text_ids]
+    dim = len(embedding_dict[text_ids[0]]) if text_ids else 0
+
+    embeddings = np.asarray([embedding_dict[text_id] for text_id in text_ids], dtype=np.float32)
+    _write(prefix + EMBEDDINGS_EXT, embeddings.reshape(len(text_ids), dim).tobytes())
+
+    texts = [node["text"].encode("utf-8") for node in nodes]
+    offsets = np.zeros(len(texts) + 1, dtype=np.int64)
+    np.cumsum([len(t) for t in texts], out=offsets[1:])
+    _write(prefix + TEXTS_EXT, b"".join(texts))
+    _write(prefix + OFFSETS_EXT, offsets.tobytes())
+
+    meta = {
+        "source": source,
+        "dim": dim,
+        "count": len(text_ids),
+        "doc_id": index_struct.get("doc_id"),
+        "text_ids": text_ids,
+        "ref_doc_ids": [node.get("ref_doc_id") for node in nodes],
+        "indexes": [node.get("index") for node in nodes],
+        "extra_info": [node.get("extra_info") for node in nodes],
+        "node_info": [node.get("node_info") for node in nodes],
+    }
+    # Meta is written last: a store only exists once its meta file does.
+    _write(prefix + META_EXT, json.dumps(meta).encode("utf-8"))
+    return prefix
+
+
+def remove(index_path):
+    """Delete the store of index_path, if there is one. The meta file goes first."""
+    prefix = get_store_prefix(index_path)
+    for ext in (META_EXT, EMBEDDINGS_EXT, TEXTS_EXT, OFFSETS_EXT):
+        if os.path.exists(prefix + ext):
+            os.remove(prefix + ext)
+
+
+def _write(path, data):
+    with open(path + ".tmp", "wb") as f:
+        f.write(data)
+    os.replace(path + ".tmp", path)
+
+
+class MmapVectorStore:
+    """Read-only view of an index written by convert().
+
+    embeddings is a (count, dim) float32 numpy.memmap. Node texts are read from disk on
+    demand by get_text / get_node.
+    """
+
+    def __init__(self, prefix):
+        self.prefix = prefix
+        with open(prefix + META_EXT) as f:
+            meta = json.load(f)
+        self.dim = meta["dim"]
+        self.count = meta["count"]
+        self.doc_id = meta["doc_id"]
+        self.text_ids = meta["text_ids"]
+        self.ref_doc_ids = meta["ref_doc_ids"]
+        self.indexes = meta["indexes"]
+        self.extra_info = meta["extra_info"]
+        self.node_info = meta["node_info"]
+        if self.count:
+            self.embeddings = np.memmap(prefix + EMBEDDINGS_EXT, dtype=np.float32, mode="r",
+                                        shape=(self.count, self.dim))
+        else:
+            self.embeddings = np.zeros((0, self.dim), dtype=np.float32)
+        self.offsets = np.memmap(prefix + OFFSETS_EXT, dtype=np.int64, mode="r")
+
+    @classmethod
+    def from_index_path(cls, index_path):
+        return cls(get_store_prefix(index_path))
+
+    def __len__(self):
+        return self.count
+
+    def get_text(self, i):
+        start, end = int(self.offsets[i]), int(self.offsets[i + 1])
+        with open(self.prefix + TEXTS_EXT, "rb") as f:
+            f.seek(start)
+            return f.read(end - start).decode("utf-8")
+
+    def get_texts(self, ids):
+        """Texts of several nodes, reading the text file once."""
+        texts = []
+        with open(self.prefix + TEXTS_EXT, "rb") as f:
+            for i in ids:
+                start, end = int(self.offsets[i]), int(self.offsets[i + 1])
+                f.seek(start)
+                texts.append(f.read(end - start).decode("utf-8"))
+        return texts
+
+    def get_node(self, i, text=None):
+        """The gpt_index Node at row i."""
+        from gpt_index.data_structs.data_structs import Node
+
+        return Node(
+            text=self.get_text(i) if text is None else text,
+            index=self.indexes[i],
+            ref_doc_id=self.ref_doc_ids[i],
+            extra_info=self.extra_info[i],
+            node_info=self.node_info[i],
+        )
+
+    def get_nodes(self, ids):
+        return [self.get_node(i, text) for i, text in zip(ids, self.get_texts(ids))]
+
+
+def verify(index_path):
+    """Convert an index to a temporary store and check that it round-trips exactly."""
+    prefix = convert(index_path, get_store_prefix(index_path) + ".verify")
+    store = None
+    try:
+        store = MmapVectorStore(prefix)
+        with open(index_path) as f:
+            index_struct = json.load(f)["index_struct"]
+        assert store.text_ids == list(index_struct["embedding_dict"].keys())
+        for i, text_id in enumerate(store.text_ids):
+            node = index_struct["nodes_dict"][str(index_struct["id_map"][text_id])]
+            expected = np.asarray(index_struct["embedding_dict"][text_id], dtype=np.float32)
+            assert np.array_equal(store.embeddings[i], expected), f"embedding {text_id}"
+            assert store.get_text(i) == node["text"], f"text {text_id}"
+            assert store.ref_doc_ids[i] == node["ref_doc_id"], f"ref_doc_id {text_id}"
+            assert store.node_info[i] == node["node_info"], f"node_info {text_id}"
+        return store.count
+    finally:
+        del store
+        for ext in (EMBEDDINGS_EXT, TEXTS_EXT, OFFSETS_EXT, META_EXT):
+            if os.path.exists(prefix + ext):
+                os.remove(prefix + ext)
+
+
+def main(argv):
+    if len(argv) < 2 or argv[0] not in ("convert", "verify"):
+        print(__doc__)
+        return 1
+    command, paths = argv[0], argv[1:]
+    for path in paths:
+        try:
+            if command == "convert":
+                print(f"converted {path} -> {convert(path)}.*")
+            else:
+                print(f"verified {path}: {verify(path)} nodes round-trip (embeddings as float32)")
+        except ValueError as e:
+            print(f"skipping {path}: {e}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
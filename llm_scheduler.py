@@ -0,0 +1,510 @@
+"""Shared scheduler for OpenAI embedding and completion requests.
+
+Scheduler batches embedding inputs into as few requests as the API allows, runs
+completions concurrently, and keeps both under request-per-minute and token-per-minute
+budgets. Requests that fail with a rate limit or a transient error are retried with jittered
+exponential backoff; a rate limit also pauses every other request on the same budget, so
+concurrent workers back off together instead of all hitting 429s. Completions can also be
+streamed (complete_stream), e.g. to show an answer while it is written.
+
+Requests go through a backend: OpenAIBackend calls the API, FakeBackend answers locally and
+deterministically (and can simulate rate limits), for tests and benchmarks. Set
+LLM_BACKEND=fake to make get_shared_scheduler() use FakeBackend, or serve FakeBackend over
+HTTP and point openai.api_base at it:
+
+Usage:
+    python llm_scheduler.py serve-fake [port]
+"""
+import hashlib
+import itertools
+import json
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter, deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+import openai
+from gpt_index.langchain_helpers.chain_wrapper import LLMPredictor
+from gpt_index.prompts.prompts import QuestionAnswerPrompt, RefinePrompt
+
+import tracing
+
+# Embedding requests take at most this many inputs.
+MAX_BATCH_SIZE = 2048
+# Keep each embedding request well below the API's request size limit.
+MAX_BATCH_TOKENS = 100000
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (~4 characters per token), good enough for budgeting."""
+    return len(text) // 4 + 1
+
+
+class RetryableError(Exception):
+    """A request failed in a way that is worth retrying.
+
+    rate_limited is True for 429s; retry_after is the wait the server asked for, if any.
+    """
+
+    def __init__(self, message, rate_limited=False, retry_after=None):
+        super().__init__(message)
+        self.rate_limited = rate_limited
+        self.retry_after = retry_after
+
+
+class RateLimiter:
+    """Token buckets for requests and tokens per minute, shared by threads.
+
+    acquire() blocks until both budgets allow the request. A request that needs more tokens
+    than the whole per-minute budget waits for a full bucket, and then goes through.
+    """
+
+    def __init__(self, requests_per_minute: float, tokens_per_minute: float) -> None:
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.requests = float(requests_per_minute)
+        self.tokens = float(tokens_per_minute)
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.waited = 0.0
+        self.condition = threading.Condition()
+
+    def _refill(self, now):
+        elapsed = now - self.updated
+        self.updated = now
+        self.requests = min(self.requests_per_minute,
+                            self.requests + elapsed * self.requests_per_minute / 60)
+        self.tokens = min(self.tokens_per_minute,
+                          self.tokens + elapsed * self.tokens_per_minute / 60)
+
+    def acquire(self, tokens: int) -> None:
+        tokens = min(tokens, self.tokens_per_minute)
+        start = time.monotonic()
+        with self.condition:
+            while True:
+                now = time.monotonic()
+                self._refill(now)
+                if now >= self.paused_until and self.requests >= 1 and self.tokens >= tokens:
+                    self.requests -= 1
+                    self.tokens -= tokens
+                    self.waited += now - start
+                    return
+                wait = max(
+                    self.paused_until - now,
+                    (1 - self.requests) * 60 / self.requests_per_minute,
+                    (tokens - self.tokens) * 60 / self.tokens_per_minute,
+                )
+                self.condition.wait(max(wait, 0.001))
+
+    def pause(self, seconds: float) -> None:
+        """Hold back every request for a while, e.g. after the server returned a 429."""
+        with self.condition:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+
+class OpenAIBackend:
+    """Sends requests to the OpenAI API (or whatever openai.api_base points to)."""
+
+    RETRY_ERRORS = (
+        openai.error.APIError,
+        openai.error.Timeout,
+        openai.error.TryAgain,
+        openai.error.APIConnectionError,
+        openai.error.ServiceUnavailableError,
+    )
+
+    def _call(self, create, **params):
+        try:
+            return create(**params)
+        except openai.error.RateLimitError as e:
+            retry_after = (e.headers or {}).get("retry-after")
+            raise RetryableError(str(e), rate_limited=True,
+                                 retry_after=float(retry_after) if retry_after else None)
+        except self.RETRY_ERRORS as e:
+            raise RetryableError(str(e))
+
+    def embed(self, texts: List[str], engine: str) -> List[List[float]]:
+        # Newlines are replaced as in gpt_index, so embeddings match those it computed.
+        response = self._call(openai.Embedding.create,
+                              input=[text.replace("\n", " ") for text in texts], engine=engine)
+        return [d["embedding"] for d in sorted(response["data"], key=lambda d: d["index"])]
+
+    def complete(self, prompt: str, **params) -> str:
+        return self._call(openai.Completion.create, prompt=prompt, **params)["choices"][0]["text"]
+
+    def complete_stream(self, prompt: str, **params) -> Iterator[str]:
+        for chunk in self._call(openai.Completion.create, prompt=prompt, stream=True, **params):
+            yield chunk["choices"][0]["text"]
+
+
+class FakeBackend:
+    """Deterministic local stand-in for the API.
+
+    Embeddings are unit vectors seeded by the text, completions are derived from a hash of
+    the prompt. With requests_per_minute / tokens_per_minute set, requests over the limit
+    of the last minute fail like a 429. calls counts requests, embedded texts and 429s.
+    Streamed completions yield a word every token_latency seconds.
+    """
+
+    def __init__(self, dim=1536, latency=0.0, requests_per_minute=None,
+                 tokens_per_minute=None, token_latency=0.0) -> None:
+        self.dim = dim
+        self.latency = latency
+        self.token_latency = token_latency
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.calls = Counter()
+        self.window = deque()
+        self.lock = threading.Lock()
+
+    def _admit(self, tokens):
+        with self.lock:
+            now = time.monotonic()
+            while self.window and self.window[0][0] <= now - 60:
+                self.window.popleft()
+            used = sum(t for _, t in self.window)
+            if ((self.requests_per_minute and len(self.window) + 1 > self.requests_per_minute)
+                    or (self.tokens_per_minute and used + tokens > self.tokens_per_minute)):
+                self.calls["rate_limited"] += 1
+                retry_after = self.window[0][0] + 60 - now if self.window else 1.0
+                raise RetryableError("fake rate limit", rate_limited=True,
+                                     retry_after=retry_after)
+            self.window.append((now, tokens))
+        if self.latency:
+            time.sleep(self.latency)
+
+    def embedding(self, text: str) -> List[float]:
+        seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:4], "little")
+        vector = np.random.RandomState(seed).standard_normal(self.dim).astype(np.float32)
+        return (vector / np.linalg.norm(vector)).tolist()
+
+    def embed(self, texts: List[str], engine: str) -> List[List[float]]:
+        self._admit(sum(estimate_tokens(text) for text in texts))
+        with self.lock:
+            self.calls["embed"] += 1
+            self.calls["embedded"] += len(texts)
+        return [self.embedding(text) for text in texts]
+
+    def _words(self, prompt, max_tokens):
+        self._admit(estimate_tokens(prompt) + max_tokens)
+        with self.lock:
+            self.calls["complete"] += 1
+        words = ["fake"] + [hashlib.sha256(f"{prompt}{i}".encode("utf-8")).hexdigest()[:6]
+                            for i in range(max(max_tokens // 4, 1))]
+        return words[:max_tokens]
+
+    def complete(self, prompt: str, max_tokens: int = 16, **params) -> str:
+        return " " + " ".join(self._words(prompt, max_tokens))
+
+    def complete_stream(self, prompt: str, max_tokens: int = 16, **params) -> Iterator[str]:
+        for word in self._words(prompt, max_tokens):
+            if self.token_latency:
+                time.sleep(self.token_latency)
+            yield " " + word
+
+
+class Scheduler:
+    """Batches, rate-limits and retries embedding and completion requests.
+
+    Args:
+        backend: OpenAIBackend (default) or FakeBackend.
+        embed_limiter / complete_limiter: budgets for each kind of request.
+        max_workers: number of requests in flight at once.
+        retries: attempts after the first before giving up.
+    """
+
+    def __init__(self, backend=None, embed_limiter: Optional[RateLimiter] = None,
+                 complete_limiter: Optional[RateLimiter] = None, max_workers: int = 8,
+                 retries: int = 6, max_batch_size: int = MAX_BATCH_SIZE,
+                 max_batch_tokens: int = MAX_BATCH_TOKENS) -> None:
+        self.backend = backend or OpenAIBackend()
+        self.embed_limiter = embed_limiter or RateLimiter(3000, 1000000)
+        self.complete_limiter = complete_limiter or RateLimiter(3000, 250000)
+        self.retries = retries
+        self.max_batch_size = max_batch_size
+        self.max_batch_tokens = max_batch_tokens
+        self.max_workers = max_workers
+        self.pool = ThreadPoolExecutor(max_workers)
+        self.stats = Counter()
+        self.stats_lock = threading.Lock()
+
+    def _count(self, **counts):
+        with self.stats_lock:
+            self.stats.update(counts)
+
+    def _request(self, limiter, tokens, send):
+        for attempt in range(self.retries + 1):
+            limiter.acquire(tokens)
+            try:
+                result = send()
+                self._count(requests=1)
+                return result
+            except RetryableError as e:
+                if attempt == self.retries:
+                    self._count(failed=1)
+                    raise
+                # Exponential backoff with jitter: ~0.5s, 1s, 2s, ...
+                delay = 0.5 * 2 ** attempt * (0.5 + random.random())
+                if e.rate_limited:
+                    self._count(rate_limited=1)
+                    delay = max(delay, e.retry_after or 0)
+                    limiter.pause(delay)
+                self._count(retries=1)
+                time.sleep(delay)
+
+    def batches(self, texts: Sequence[str]) -> List[List[int]]:
+        """Split texts into batches of indexes within the size and token limits."""
+        batches, batch, batch_tokens = [], [], 0
+        for i, text in enumerate(texts):
+            tokens = estimate_tokens(text)
+            if batch and (len(batch) >= self.max_batch_size
+                          or batch_tokens + tokens > self.max_batch_tokens):
+                batches.append(batch)
+                batch, batch_tokens = [], 0
+            batch.append(i)
+            batch_tokens += tokens
+        if batch:
+            batches.append(batch)
+        return batches
+
+    def embed(self, texts: Sequence[str], engine: str) -> List[List[float]]:
+        """Embeddings of texts, in order, in as few concurrent requests as possible."""
+        texts = list(texts)
+
+        def send(batch):
+            batch_texts = [texts[i] for i in batch]
+            tokens = sum(estimate_tokens(text) for text in batch_texts)
+            return self._request(self.embed_limiter, tokens,
+                                 lambda: self.backend.embed(batch_texts, engine))
+
+        batches = self.batches(texts)
+        embeddings = [None] * len(texts)
+        for batch, batch_embeddings in zip(batches, self.pool.map(send, batches)):
+            for i, embedding in zip(batch, batch_embeddings):
+                embeddings[i] = embedding
+        self._count(embedded=len(texts))
+        return embeddings
+
+    def complete(self, prompt: str, **params) -> str:
+        tokens = estimate_tokens(prompt) + params.get("max_tokens", 16)
+        return self._request(self.complete_limiter, tokens,
+                             lambda: self.backend.complete(prompt, **params))
+
+    def complete_stream(self, prompt: str, **params) -> Iterator[str]:
+        """Pieces of the completion of prompt, as the backend produces them.
+
+        Failures before the first piece are retried like complete(); once text has been
+        yielded, an error is raised to the caller.
+        """
+        tokens = estimate_tokens(prompt) + params.get("max_tokens", 16)
+
+        def start():
+            stream = iter(self.backend.complete_stream(prompt, **params))
+            return stream, next(stream, None)
+
+        stream, first = self._request(self.complete_limiter, tokens, start)
+        if first is not None:
+            yield first
+            yield from stream
+
+    def complete_many(self, prompts: Sequence[str], **params) -> List[str]:
+        """Completions of several prompts, run concurrently, in order."""
+        return list(self.pool.map(lambda prompt: self.complete(prompt, **params), prompts))
+
+    def complete_unordered(self, prompts: Iterable[str], **params) -> Iterator[Tuple[int, str]]:
+        """(position, completion) of each prompt, as soon as it completes.
+
+        Prompts are only taken from the iterable as requests finish, so at most about two
+        per worker are queued at a time.
+        """
+        prompts = enumerate(prompts)
+        pending = {}
+
+        def submit(count):
+            for i, prompt in itertools.islice(prompts, count):
+                pending[self.pool.submit(self.complete, prompt, **params)] = i
+
+        submit(2 * self.max_workers)
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield pending.pop(future), future.result()
+            submit(len(done))
+
+    def format_stats(self) -> str:
+        return (
+            f"scheduler: {self.stats['requests']} requests, {self.stats['embedded']} texts "
+            f"embedded, {self.stats['retries']} retries ({self.stats['rate_limited']} rate "
+            f"limited), waited {self.embed_limiter.waited + self.complete_limiter.waited:.1f}s "
+            f"for budget"
+        )
+
+
+_shared_scheduler: Optional[Scheduler] = None
+_shared_lock = threading.Lock()
+
+
+def get_backend():
+    """FakeBackend if LLM_BACKEND=fake, else OpenAIBackend."""
+    if os.getenv("LLM_BACKEND") == "fake":
+        # E.g. LLM_FAKE_TOKEN_LATENCY=0.05 to watch answers stream in the app, or
+        # LLM_FAKE_LATENCY=0.5 to make every request take about as long as the API's.
+        return FakeBackend(latency=float(os.getenv("LLM_FAKE_LATENCY", 0)),
+                           token_latency=float(os.getenv("LLM_FAKE_TOKEN_LATENCY", 0)))
+    return OpenAIBackend()
+
+
+def get_shared_scheduler() -> Scheduler:
+    """The process-wide scheduler, so every caller shares the same budgets."""
+    global _shared_scheduler
+    with _shared_lock:
+        if _shared_scheduler is None:
+            _shared_scheduler = Scheduler(get_backend())
+        return _shared_scheduler
+
+
+class ScheduledLLMPredictor(LLMPredictor):
+    """gpt_index LLMPredictor that sends its completions through a Scheduler.
+
+    Uses the model, temperature and max_tokens of the langchain OpenAI llm. Each completion
+    is traced as an "llm" span, see tracing.py.
+    """
+
+    def __init__(self, scheduler: Optional[Scheduler] = None, **kwargs) -> None:
+        super().__init__(**kwargs)
+        self.scheduler = scheduler or get_shared_scheduler()
+
+    def _params(self):
+        return {"model": self._llm.model_name, "temperature": self._llm.temperature,
+                "max_tokens": self._llm.max_tokens}
+
+    def _span(self, prompt, formatted, **attributes):
+        prompt_type = getattr(prompt, "prompt_type", None)
+        return tracing.span("llm", prompt_type=getattr(prompt_type, "value", prompt_type),
+                            tokens_in=estimate_tokens(formatted), **attributes)
+
+    def _predict(self, prompt, **prompt_args) -> str:
+        formatted = prompt.format(**prompt_args)
+        with self._span(prompt, formatted) as span:
+            response = self.scheduler.complete(formatted, **self._params())
+            span.set(tokens_out=estimate_tokens(response))
+        return response
+
+
+class StreamingLLMPredictor(ScheduledLLMPredictor):
+    """ScheduledLLMPredictor that streams the answers it writes.
+
+    Question-answering and refine prompts, which write the answer a query returns, are
+    streamed: on_token(token, answer) is called with each piece and the answer so far. A
+    refine prompt starts a new answer. Other prompts (summaries, choosing tree nodes)
+    complete as usual.
+    """
+
+    STREAMED_PROMPTS = (QuestionAnswerPrompt, RefinePrompt)
+
+    def __init__(self, on_token: Callable[[str, str], None],
+                 scheduler: Optional[Scheduler] = None, **kwargs) -> None:
+        super().__init__(scheduler, **kwargs)
+        self.on_token = on_token
+
+    def _predict(self, prompt, **prompt_args) -> str:
+        if not isinstance(prompt, self.STREAMED_PROMPTS):
+            return super()._predict(prompt, **prompt_args)
+        formatted = prompt.format(**prompt_args)
+        answer = ""
+        start = time.perf_counter()
+        with self._span(prompt, formatted, streamed=True) as span:
+            for token in self.scheduler.complete_stream(formatted, **self._params()):
+                if not answer:
+                    span.set(first_token_seconds=round(time.perf_counter() - start, 6))
+                answer += token
+                self.on_token(token, answer)
+            span.set(tokens_out=estimate_tokens(answer))
+        return answer
+
+
+class _FakeAPIHandler(BaseHTTPRequestHandler):
+    """Answers the embeddings and completions endpoints of the OpenAI API with FakeBackend."""
+
+    backend = None
+
+    def do_POST(self):
+        request = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        try:
+            if self.path.endswith("/embeddings"):
+                texts = request["input"]
+                texts = [texts] if isinstance(texts, str) else texts
+                embeddings = self.backend.embed(texts, request.get("model", ""))
+                body = {"object": "list", "data": [
+                    {"object": "embedding", "index": i, "embedding": e}
+                    for i, e in enumerate(embeddings)
+                ]}
+            elif self.path.endswith("/completions") and request.get("stream"):
+                stream = self.backend.complete_stream(request["prompt"],
+                                                      request.get("max_tokens", 16))
+                # Rate limits are checked before the first word, while a 429 can be sent.
+                self._reply_stream(itertools.chain([next(stream, "")], stream))
+                return
+            elif self.path.endswith("/completions"):
+                text = self.backend.complete(request["prompt"], request.get("max_tokens", 16))
+                body = {"object": "text_completion",
+                        "choices": [{"text": text, "index": 0, "finish_reason": "stop"}]}
+            else:
+                self._reply(404, {"error": {"message": f"unknown endpoint {self.path}"}})
+                return
+        except RetryableError as e:
+            self._reply(429, {"error": {"message": str(e), "type": "rate_limit"}},
+                        {"Retry-After": "%.3f" % (e.retry_after or 1)})
+            return
+        self._reply(200, body)
+
+    def _reply(self, status, body, headers=None):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _reply_stream(self, texts):
+        """Send completion pieces as server-sent events, like the API with stream=True."""
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.end_headers()
+        for text in texts:
+            event = {"object": "text_completion",
+                     "choices": [{"text": text, "index": 0, "finish_reason": None}]}
+            self.wfile.write(f"data: {json.dumps(event)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+        self.wfile.write(b"data: [DONE]\n\n")
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve_fake(port=0, backend=None):
+    """Start a fake API server on localhost in a background thread, and return it.
+
+    Point openai.api_base at f"http://127.0.0.1:{server.server_port}/v1" to use it.
+    """
+    handler = type("FakeAPIHandler", (_FakeAPIHandler,), {"backend": backend or FakeBackend()})
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] != "serve-fake":
+        print(__doc__)
+        sys.exit(1)
+    server = serve_fake(int(sys.argv[2]) if len(sys.argv) > 2 else 8765)
+    print(f"fake OpenAI API on http://127.0.0.1:{server.server_port}/v1")
+    threading.Event().wait()
@@ -1,18 +1,37 @@
-from gpt_index import GPTSimpleVectorIndex
+import index_catalog
+import tracing
+from index_server import connect
 
 import logging
+import os
 import sys
 
-logging.basicConfig(stream=sys.stdout, level=logging.DEBUG)
-logging.getLogger().addHandler(logging.StreamHandler(stream=sys.stdout))
+# gpt_index's token usage is logged at INFO; LOG_LEVEL=DEBUG shows every prompt too.
+logging.basicConfig(stream=sys.stdout, level=os.getenv("LOG_LEVEL", "INFO"))
 
+INDEX_PATH = 'index_pdf.json'
 
-print('loading index')
-index = GPTSimpleVectorIndex.load_from_disk('index_pdf.json')
+# Where the time went is printed after the answer, stage by stage.
+spans = []
+tracing.enable().add_sink(spans.append)
+
+# Ask the index server if one is running (`python index_server.py serve`): it already has
+# the index loaded.
+client = connect()
+if client is not None:
+    print('using index server at', client.url)
+    index = client.get_index(INDEX_PATH)
+else:
+    print('loading index')
+    index = index_catalog.load_index(INDEX_PATH)
 
 
 query = input('Query: ')
-response = index.query(query, mode="default",
-                       response_mode="tree_summarize")
+with tracing.span("query", query=query):
+    response = index.query(query, **index_catalog.query_kwargs(INDEX_PATH))
+print("\nAnswer:", str(response).strip())
 sources = response.get_formatted_sources(length=2000)
 print("\nSources:", sources)
+print("\nTrace:\n" + tracing.format_spans(spans))
+if client is None:
+    print(index.embed_model.cache.format_stats())
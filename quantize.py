@@ -0,0 +1,153 @@
+"""Quantized copies of the embeddings of a vector index: float16, or int8 scaled per vector.
+
+The embedding matrix of a vector index holds 4 bytes per dimension in float32; a float16
+copy holds 2 and an int8 copy 1. Rows are normalized to unit length before they are
+quantized, so the score of a query against a quantized row approximates their cosine
+similarity. An int8 row stores round(x / scale) with scale = max(|x|) / 127, so each row
+uses the whole int8 range whatever its largest component is.
+
+VectorRetriever (retrieval.py) scores queries directly on the quantized matrix, dequantizing
+a block of rows at a time into float32 so that BLAS does the products, then rescores the
+best rescore * k candidates at full precision from its embedding matrix. For an index_store
+file set that matrix is memory-mapped, so only the candidates' rows are read from disk and the
+quantized copy is all the index keeps in memory.
+
+The copy is saved next to the vector index it was built from, as index_<name>.quant.npz,
+like the IVF and BM25 indexes (ann.py, bm25.py), either by data_loader.create_index
+(quantize_dtype="int8") or by converting an existing index:
+
+Usage:
+    python quantize.py build indexes/index_www-paulgraham-com.json [int8|float16]
+"""
+import json
+import os
+import sys
+
+import numpy as np
+
+QUANT_EXT = ".quant.npz"
+DTYPES = ("int8", "float16")
+DEFAULT_DTYPE = "int8"
+# Candidates rescored at full precision per result: rescore * k.
+DEFAULT_RESCORE = 4
+# Rows dequantized at a time while scoring: small enough for the float32 block to stay in
+# cache.
+BLOCK_ROWS = 128
+
+
+def get_quant_path(index_path):
+    """indexes/index_bible.json -> indexes/index_bible.quant.npz"""
+    return os.path.splitext(index_path)[0] + QUANT_EXT
+
+
+def _normalize(matrix):
+    matrix = np.asarray(matrix, dtype=np.float32)
+    return matrix / np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+
+
+class QuantizedMatrix:
+    """Unit-length embedding rows in float16, or in int8 with a float32 scale per row."""
+
+    def __init__(self, codes, scales, text_ids):
+        self.codes = codes
+        self.scales = scales
+        self.text_ids = list(text_ids)
+
+    @classmethod
+    def build(cls, embeddings, text_ids, dtype=DEFAULT_DTYPE):
+        if dtype not in DTYPES:
+            raise ValueError(f"unknown dtype {dtype!r}: use one of {', '.join(DTYPES)}")
+        if len(text_ids) == 0:
+            # An index with no nodes yet: its embeddings may not even have a dimension.
+            embeddings = np.asarray(embeddings, dtype=np.float32)
+            dim = embeddings.shape[1] if embeddings.ndim == 2 else 0
+            codes = np.zeros((0, dim), dtype=dtype)
+            return cls(codes, None if dtype == "float16" else np.zeros(0, np.float32), text_ids)
+        rows = _normalize(embeddings).reshape(len(text_ids), -1)
+        if dtype == "float16":
+            return cls(rows.astype(np.float16), None, text_ids)
+        scales = np.maximum(np.abs(rows).max(axis=1) / 127, 1e-12).astype(np.float32)
+        codes = np.round(rows / scales[:, None]).astype(np.int8)
+        return cls(codes, scales, text_ids)
+
+    @property
+    def dtype(self):
+        return self.codes.dtype.name
+
+    @property
+    def nbytes(self):
+        return self.codes.nbytes + (self.scales.nbytes if self.scales is not None else 0)
+
+    def __len__(self):
+        return len(self.text_ids)
+
+    def dequantize(self, rows=None):
+        """float32 rows (all by default)."""
+        codes = self.codes if rows is None else self.codes[rows]
+        matrix = codes.astype(np.float32)
+        if self.scales is not None:
+            matrix *= (self.scales if rows is None else self.scales[rows])[:, None]
+        return matrix
+
+    def scores(self, queries):
+        """Approximate cosine similarities, (num_queries, count), for a (num_queries, dim)
+        array of unit-length queries."""
+        queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+        count = len(self.codes)
+        # Row-major by row, so that each block's scores are one contiguous slice.
+        scores = np.empty((count, len(queries)), dtype=np.float32)
+        block = np.empty((min(BLOCK_ROWS, count), self.codes.shape[1]), dtype=np.float32)
+        for start in range(0, count, BLOCK_ROWS):
+            n = min(BLOCK_ROWS, count - start)
+            np.copyto(block[:n], self.codes[start:start + n], casting="unsafe")
+            np.dot(block[:n], queries.T, out=scores[start:start + n])
+        if self.scales is not None:
+            scores *= self.scales[:, None]
+        return scores.T
+
+    def save(self, path):
+        arrays = {"codes": self.codes, "text_ids": np.asarray(self.text_ids, dtype=str)}
+        if self.scales is not None:
+            arrays["scales"] = self.scales
+        with open(path + ".tmp", "wb") as f:
+            np.savez(f, **arrays)
+        os.replace(path + ".tmp", path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            scales = data["scales"] if "scales" in data.files else None
+            return cls(data["codes"], scales, data["text_ids"].tolist())
+
+
+def build_for_index_struct(index_struct, index_path, dtype=DEFAULT_DTYPE):
+    """Build and save the quantized copy of a SimpleIndexDict that is saved at index_path."""
+    return _build_and_save(index_struct.embedding_dict, index_path, dtype)
+
+
+def build_for_index_path(index_path, dtype=DEFAULT_DTYPE):
+    """Build and save the quantized copy of a GPTSimpleVectorIndex JSON file."""
+    with open(index_path) as f:
+        index_struct = json.load(f)["index_struct"]
+    if "embedding_dict" not in index_struct:
+        raise ValueError(f"{index_path} is not a vector index: it has no embeddings.")
+    return _build_and_save(index_struct["embedding_dict"], index_path, dtype)
+
+
+def _build_and_save(embedding_dict, index_path, dtype):
+    text_ids = list(embedding_dict.keys())
+    embeddings = np.asarray([embedding_dict[t] for t in text_ids], dtype=np.float32)
+    quantized = QuantizedMatrix.build(embeddings, text_ids, dtype)
+    quantized.save(get_quant_path(index_path))
+    return quantized
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3 or sys.argv[1] != "build":
+        print(__doc__)
+        sys.exit(1)
+    dtype = sys.argv[3] if len(sys.argv) > 3 else DEFAULT_DTYPE
+    for path in sys.argv[2:3]:
+        quantized = build_for_index_path(path, dtype)
+        print(f"built {get_quant_path(path)}: {len(quantized)} rows as {quantized.dtype}, "
+              f"{quantized.nbytes / 1e6:.2f} MB")
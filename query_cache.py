@@ -0,0 +1,292 @@
+"""Answers to questions already asked, so asking again skips retrieval and the LLM.
+
+QueryCache sits in front of streamlit_main.query_index, with two tiers:
+
+    exact       keyed on the index file and its modification time, the normalized question
+                ("What is Gap's profit?" and "what is gap's profit" are the same) and the
+                query kwargs (retrieval and response mode)
+    semantic    otherwise, the answer to the most similar cached question to the same index
+                with the same kwargs, if the cosine similarity of their embeddings is at
+                least similarity_threshold
+
+Entries expire ttl seconds after they were answered, and the least recently used are evicted
+past max_entries. They are kept in one SQLite file, like the embedding cache, so they
+survive restarts; an index that changes on disk has a new modification time, and its old
+answers are never returned again.
+
+The question is embedded through the shared embedding cache with the model a vector index
+queries with, so for vector indexes a semantic lookup that misses costs no extra embedding
+request: the query embeds the question from the cache. Tree and keyword queries do not
+embed the question, and pass semantic=False to skip the tier.
+"""
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import Counter
+from typing import Optional, Tuple
+
+import numpy as np
+
+import tracing
+
+# QUERY_CACHE_PATH moves the cache, like EMBEDDING_CACHE_PATH.
+DEFAULT_CACHE_PATH = os.getenv("QUERY_CACHE_PATH") or os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), ".cache", "queries.sqlite"
+)
+DEFAULT_TTL = 7 * 24 * 3600
+DEFAULT_MAX_ENTRIES = 10000
+# text-embedding-ada-002 rates unrelated questions about the same topic around 0.8-0.9, and
+# rewordings of the same question above 0.95.
+DEFAULT_SIMILARITY_THRESHOLD = 0.95
+
+TRAILING_PUNCTUATION = re.compile(r"[\s?!.]+$")
+
+
+def normalize_query(query: str) -> str:
+    """Lowercase, with whitespace collapsed and trailing punctuation dropped."""
+    return TRAILING_PUNCTUATION.sub("", " ".join(query.lower().split()))
+
+
+def scope_key(index_path: str, query_kwargs: dict) -> str:
+    """Answers can be reused for questions to the same version of an index file, asked with
+    the same query kwargs."""
+    import index_catalog
+
+    path = os.path.abspath(index_path)
+    return hashlib.sha256(json.dumps(
+        [path, index_catalog.get_mtime(path), query_kwargs], sort_keys=True, default=str
+    ).encode("utf-8")).hexdigest()
+
+
+def entry_key(scope: str, query: str) -> bytes:
+    return hashlib.sha256(f"{scope}\0{normalize_query(query)}".encode("utf-8")).digest()
+
+
+class QueryCache:
+    """SQLite-backed cache of query responses, with exact and semantic lookups.
+
+    Responses are stored as index_server.response_json makes them. Safe to share between
+    threads (e.g. Streamlit sessions).
+
+    Args:
+        path: SQLite file.
+        ttl: seconds an answer can be reused for.
+        max_entries: answers kept; the least recently used are evicted first.
+        similarity_threshold: minimum cosine similarity for a semantic hit.
+        embed_model: embeds questions for the semantic tier. Defaults to a
+            CachedOpenAIEmbedding.
+    """
+
+    def __init__(self, path: str = DEFAULT_CACHE_PATH, ttl: float = DEFAULT_TTL,
+                 max_entries: int = DEFAULT_MAX_ENTRIES,
+                 similarity_threshold: float = DEFAULT_SIMILARITY_THRESHOLD,
+                 embed_model=None) -> None:
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.similarity_threshold = similarity_threshold
+        self._embed_model = embed_model
+        if os.path.dirname(path) and not os.path.exists(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses (key BLOB PRIMARY KEY, scope TEXT NOT NULL, "
+            "query TEXT NOT NULL, embedding BLOB, response TEXT NOT NULL, "
+            "created REAL NOT NULL, used REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS responses_scope ON responses (scope)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS responses_used ON responses (used)")
+        self._conn.commit()
+        self._lock = threading.Lock()
+        # Scope -> (keys, unit embeddings as rows), read from the file on first use.
+        self._vectors = {}
+        self.counts = Counter()
+
+    @property
+    def embed_model(self):
+        if self._embed_model is None:
+            from embedding_cache import CachedOpenAIEmbedding
+
+            self._embed_model = CachedOpenAIEmbedding()
+        return self._embed_model
+
+    def _embed(self, query: str) -> np.ndarray:
+        vector = np.asarray(self.embed_model.get_query_embedding(query), dtype=np.float32)
+        return vector / max(float(np.linalg.norm(vector)), 1e-12)
+
+    def _use(self, key: bytes, now: float) -> Optional[Tuple[dict, str]]:
+        """(response, normalized question) stored under key if it has not expired, marked as
+        just used."""
+        row = self._conn.execute(
+            "SELECT response, query, created FROM responses WHERE key = ?", (key,)).fetchone()
+        if row is None or row[2] < now - self.ttl:
+            return None
+        self._conn.execute("UPDATE responses SET used = ? WHERE key = ?", (now, key))
+        self._conn.commit()
+        return json.loads(row[0]), row[1]
+
+    def _scope_vectors(self, scope: str, now: float):
+        if scope not in self._vectors:
+            rows = self._conn.execute(
+                "SELECT key, embedding FROM responses WHERE scope = ? AND embedding IS NOT NULL "
+                "AND created >= ?", (scope, now - self.ttl)).fetchall()
+            self._vectors[scope] = (
+                [key for key, _ in rows],
+                np.asarray([np.frombuffer(blob, dtype=np.float32) for _, blob in rows],
+                           dtype=np.float32))
+        return self._vectors[scope]
+
+    def get(self, index_path: str, query: str, query_kwargs: dict,
+            semantic: bool = True) -> Optional[dict]:
+        """The cached response to a question, or None.
+
+        The response's extra_info records the tier that answered ("cached"), and for a
+        semantic hit the question that was answered and its similarity.
+        """
+        with tracing.span("cache") as span:
+            scope = scope_key(index_path, query_kwargs)
+            now = time.time()
+            with self._lock:
+                found = self._use(entry_key(scope, query), now)
+            if found is not None:
+                span.set(hit="exact")
+                return self._hit(found[0], "exact")
+            if semantic and self.similarity_threshold is not None:
+                embedding = self._embed(query)
+                with self._lock:
+                    keys, vectors = self._scope_vectors(scope, now)
+                    if keys:
+                        similarities = vectors @ embedding
+                        best = int(np.argmax(similarities))
+                        if similarities[best] >= self.similarity_threshold:
+                            found = self._use(keys[best], now)
+                if found is not None:
+                    similarity = round(float(similarities[best]), 4)
+                    span.set(hit="semantic", similarity=similarity)
+                    return self._hit(found[0], "semantic", cached_query=found[1],
+                                     similarity=similarity)
+            span.set(hit=None)
+            with self._lock:
+                self.counts["misses"] += 1
+            return None
+
+    def _hit(self, body: dict, tier: str, **extra_info) -> dict:
+        with self._lock:
+            self.counts[f"{tier}_hits"] += 1
+        body["extra_info"] = dict(body.get("extra_info") or {}, cached=tier, **extra_info)
+        return body
+
+    def put(self, index_path: str, query: str, query_kwargs: dict, response: dict,
+            semantic: bool = True) -> None:
+        """Cache the response (as index_server.response_json makes it) to a question."""
+        scope = scope_key(index_path, query_kwargs)
+        embedding = (self._embed(query).tobytes()
+                     if semantic and self.similarity_threshold is not None else None)
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (entry_key(scope, query), scope, normalize_query(query), embedding,
+                 json.dumps(response), now, now))
+            self._vectors.pop(scope, None)
+            self._evict(now)
+            self._conn.commit()
+
+    def _evict(self, now: float) -> None:
+        """Drop expired answers, then the least recently used past max_entries."""
+        expired = self._conn.execute(
+            "DELETE FROM responses WHERE created < ?", (now - self.ttl,)).rowcount
+        over = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0] \
+            - self.max_entries
+        evicted = 0
+        if over > 0:
+            evicted = self._conn.execute(
+                "DELETE FROM responses WHERE key IN "
+                "(SELECT key FROM responses ORDER BY used LIMIT ?)", (over,)).rowcount
+        if expired or evicted:
+            self.counts["expired"] += expired
+            self.counts["evicted"] += evicted
+            self._vectors.clear()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM responses")
+            self._conn.commit()
+            self._vectors.clear()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+    def stats(self) -> dict:
+        """Hit/miss and eviction counts of this process, and the number of cached answers."""
+        hits = self.counts["exact_hits"] + self.counts["semantic_hits"]
+        lookups = hits + self.counts["misses"]
+        return {
+            "exact_hits": self.counts["exact_hits"],
+            "semantic_hits": self.counts["semantic_hits"],
+            "misses": self.counts["misses"],
+            "hit_rate": hits / lookups if lookups else 0.0,
+            "expired": self.counts["expired"],
+            "evicted": self.counts["evicted"],
+            "size": len(self),
+        }
+
+    def format_stats(self) -> str:
+        stats = self.stats()
+        return (
+            f"query cache: {stats['exact_hits']} exact and {stats['semantic_hits']} semantic "
+            f"hits, {stats['misses']} misses ({stats['hit_rate']:.0%} hit rate), "
+            f"{stats['size']} answers stored"
+        )
+
+
+_shared_cache: Optional[QueryCache] = None
+_shared_lock = threading.Lock()
+
+
+def get_shared_cache() -> QueryCache:
+    """The process-wide cache at DEFAULT_CACHE_PATH."""
+    global _shared_cache
+    with _shared_lock:
+        if _shared_cache is None:
+            _shared_cache = QueryCache()
+        return _shared_cache
+
+
+def cached_query(index, index_path, query_str, on_token=None, on_sources=None, cache=None,
+                 **query_kwargs):
+    """streaming.stream_query(index, query_str, ...) through a QueryCache (default: the
+    shared one).
+
+    A cached answer is returned as an index_server.RemoteResponse, after being passed to
+    on_sources and on_token at once. Only vector queries that embed the question use the
+    semantic tier; see the module docstring.
+    """
+    import index_catalog
+    from index_server import RemoteResponse, response_json
+    from retrieval import KEYWORD_RETRIEVAL
+    from streaming import stream_query
+
+    if cache is None:
+        cache = get_shared_cache()
+    semantic = (not index_catalog.is_tree_index(index_path)
+                and query_kwargs.get("mode", "default") == "default"
+                and query_kwargs.get("retrieval") != KEYWORD_RETRIEVAL)
+    body = cache.get(index_path, query_str, query_kwargs, semantic=semantic)
+    if body is not None:
+        response = RemoteResponse(**body)
+        if on_sources is not None:
+            on_sources(response.source_nodes)
+        if on_token is not None and response.response:
+            on_token(response.response, response.response)
+        return response
+    response = stream_query(index, query_str, on_token, on_sources, **query_kwargs)
+    if response.response:
+        cache.put(index_path, query_str, query_kwargs, response_json(response),
+                  semantic=semantic)
+    return response
@@ -0,0 +1,536 @@
+"""Vectorized top-k retrieval for vector indexes.
+
+GPTSimpleVectorIndex scores a query against its nodes one at a time in Python. VectorRetriever
+keeps all embeddings in one float32 matrix and scores a query with a single matrix-vector
+product (or a batch of queries with one matrix-matrix product), then picks the top k with
+argpartition.
+
+FastVectorIndex is a GPTSimpleVectorIndex that queries through a VectorRetriever. It can be
+loaded from the usual JSON file, or from an index_store file set without loading any node
+text until it is retrieved. Its queries with retrieval=KEYWORD_RETRIEVAL retrieve nodes with
+BM25 (bm25.py) instead, without embedding the question. get_leaf_retriever scores the leaves
+of a tree index the same way, for retrieval without the LLM. With a quantized copy of the embeddings
+(quantize.py) attached, queries score the int8 or float16 matrix and rescore the best
+candidates at full precision.
+"""
+import logging
+import os
+from typing import Callable, List, Optional, Sequence, Tuple
+
+import numpy as np
+from gpt_index import GPTSimpleVectorIndex, GPTTreeIndex
+from gpt_index.data_structs.data_structs import Node, SimpleIndexDict
+from gpt_index.indices.query.embedding_utils import SimilarityTracker
+from gpt_index.indices.response.builder import ResponseMode
+from gpt_index.indices.query.schema import QueryMode
+from gpt_index.indices.query.vector_store.simple import GPTSimpleVectorIndexQuery
+from gpt_index.indices.utils import truncate_text
+from gpt_index.response.schema import Response, SourceNode
+
+import ann
+import extractive
+import quantize
+import tracing
+from bm25 import BM25Index, get_bm25_path
+from index_store import MmapVectorStore
+from quantize import QuantizedMatrix
+
+# Retrieval of FastVectorIndex queries that uses BM25 alone, without embedding the question:
+# index.query(q, retrieval=KEYWORD_RETRIEVAL). See GPTFastVectorIndexQuery.
+KEYWORD_RETRIEVAL = "bm25"
+# Response mode of FastVectorIndex queries that try an extractive answer first; see
+# GPTFastVectorIndexQuery.
+EXTRACTIVE_RESPONSE_MODE = "extractive"
+
+
+class VectorRetriever:
+    """Cosine-similarity top-k over a matrix of embeddings.
+
+    Args:
+        embeddings: (count, dim) array, e.g. a numpy.memmap. Rows are used as given when
+            normalized is True; otherwise their norms are computed on the first full scan
+            and applied to the scores, so a memory-mapped matrix is never copied.
+        ids: id of each row, passed to get_nodes.
+        get_nodes: returns the Nodes for a list of ids.
+        text_ids: node id of each row, if different from ids. Used to match an ANN index.
+
+    With an ann.IVFIndex attached (see set_ann), queries only score the rows in the nprobe
+    closest lists instead of the whole matrix. Otherwise, with a quantize.QuantizedMatrix
+    attached (see set_quantized), queries score the quantized matrix and rescore the best
+    rescore * k rows exactly, so a memory-mapped matrix is only read for those rows. Keyword
+    queries use the attached BM25Index (see set_bm25), or one built from the node texts on
+    first use.
+    """
+
+    def __init__(
+        self,
+        embeddings: np.ndarray,
+        ids: Sequence,
+        get_nodes: Callable[[List], List[Node]],
+        normalized: bool = False,
+        text_ids: Optional[Sequence[str]] = None,
+    ) -> None:
+        self.embeddings = embeddings
+        self.ids = list(ids)
+        self.get_nodes = get_nodes
+        self.text_ids = self.ids if text_ids is None else list(text_ids)
+        self.ann: Optional[ann.IVFIndex] = None
+        self.nprobe = 8
+        self.bm25: Optional[BM25Index] = None
+        self.quantized: Optional[QuantizedMatrix] = None
+        self.rescore = quantize.DEFAULT_RESCORE
+        self.normalized = normalized
+        self._inv_norms = None
+
+    @property
+    def inv_norms(self) -> Optional[np.ndarray]:
+        """1 / norm of each row, or None if the rows are normalized. Computed on first use:
+        it reads the whole matrix."""
+        if self.normalized or not len(self.ids):
+            return None
+        if self._inv_norms is None:
+            norms = np.linalg.norm(self.embeddings, axis=1)
+            self._inv_norms = 1.0 / np.maximum(norms, 1e-12)
+        return self._inv_norms
+
+    @classmethod
+    def from_index_struct(cls, index_struct: SimpleIndexDict) -> "VectorRetriever":
+        """Copy the embedding dict of an index into one normalized matrix."""
+        ids = list(index_struct.embedding_dict.keys())
+        embeddings = np.asarray(
+            [index_struct.embedding_dict[text_id] for text_id in ids], dtype=np.float32
+        )
+        if len(ids):
+            embeddings /= np.maximum(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12)
+        return cls(embeddings, ids, index_struct.get_nodes, normalized=True)
+
+    @classmethod
+    def from_store(cls, store: MmapVectorStore) -> "VectorRetriever":
+        """Score directly on the memory-mapped matrix of an index_store file set."""
+        return cls(store.embeddings, range(store.count), store.get_nodes,
+                   text_ids=store.text_ids)
+
+    def set_ann(self, ivf: ann.IVFIndex, nprobe: Optional[int] = None) -> bool:
+        """Use an IVF index for queries. Returns False, and keeps exact search, if it is stale."""
+        if ivf.text_ids != self.text_ids:
+            logging.warning("> ANN index does not match the vector index, using exact search")
+            return False
+        self.ann = ivf
+        if nprobe is not None:
+            self.nprobe = nprobe
+        return True
+
+    def set_bm25(self, bm25: BM25Index) -> bool:
+        """Use a saved BM25 index for keyword queries. Returns False if it is stale."""
+        if bm25.text_ids != self.text_ids:
+            logging.warning("> BM25 index does not match the vector index, rebuilding it")
+            return False
+        self.bm25 = bm25
+        return True
+
+    def set_quantized(self, quantized: QuantizedMatrix, rescore: Optional[int] = None) -> bool:
+        """Score queries on a quantized copy of the embeddings, then rescore the best
+        rescore * k rows at full precision (rescore=0: quantized scores only). Returns False,
+        and keeps exact search, if it is stale."""
+        if quantized.text_ids != self.text_ids:
+            logging.warning("> Quantized index does not match the vector index, using exact "
+                            "search")
+            return False
+        self.quantized = quantized
+        if rescore is not None:
+            self.rescore = rescore
+        return True
+
+    def get_bm25(self) -> BM25Index:
+        if self.bm25 is None:
+            texts = [node.get_text() for node in self.get_nodes(self.ids)]
+            self.bm25 = BM25Index.build(texts, self.text_ids)
+        return self.bm25
+
+    def retrieve_keywords(self, query_str: str, k: int) -> Tuple[List[float], List[Node]]:
+        """Top k (BM25 scores, Nodes) for a question, best first. Nodes without any of its
+        terms are never returned, so there may be fewer than k."""
+        scores, rows = self.get_bm25().top_k(query_str, k)
+        return scores.tolist(), self.get_nodes([self.ids[row] for row in rows])
+
+    def retrieve_hybrid(
+        self, query_embedding: Sequence[float], query_str: str, k: int, keyword_weight: float,
+        candidates: Optional[int] = None,
+    ) -> Tuple[List[float], List[Node]]:
+        """Top k (fused scores, Nodes), fusing vector similarity and BM25.
+
+        The best candidates (default max(4k, 20)) by either score are pooled; both scores
+        are min-max normalized over the pool, then mixed as
+        (1 - keyword_weight) * vector + keyword_weight * keywords.
+        """
+        fused, _, rows = self.top_k_hybrid(query_embedding, query_str, k, keyword_weight,
+                                           candidates)
+        return fused.tolist(), self.get_nodes([self.ids[row] for row in rows])
+
+    def top_k_hybrid(
+        self, query_embedding: Sequence[float], query_str: str, k: int, keyword_weight: float,
+        candidates: Optional[int] = None,
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Top k (fused scores, vector similarities, row numbers), best first; see
+        retrieve_hybrid."""
+        candidates = candidates or max(4 * k, 20)
+        _, vector_rows = self.top_k_batch([query_embedding], candidates)
+        # Scored once: the fused scores below read the same array.
+        keyword_scores = self.get_bm25().scores(query_str)
+        _, keyword_rows = BM25Index.top_k_of_scores(keyword_scores, candidates)
+        rows = np.union1d(vector_rows[0][vector_rows[0] >= 0], keyword_rows)
+        if not len(rows):
+            return np.zeros(0), np.zeros(0), rows.astype(np.int64)
+        query = np.asarray(query_embedding, dtype=np.float32)
+        similarities = self._exact_scores(rows, query / max(np.linalg.norm(query), 1e-12))
+        fused = ((1 - keyword_weight) * _min_max(similarities)
+                 + keyword_weight * _min_max(keyword_scores[rows]))
+        best = np.argsort(-fused, kind="stable")[:k]
+        return fused[best], similarities[best], rows[best]
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def scores(self, query_embeddings: np.ndarray) -> np.ndarray:
+        """Cosine similarities, (num_queries, count), for a (num_queries, dim) array."""
+        queries = np.asarray(query_embeddings, dtype=np.float32)
+        queries = queries / np.maximum(np.linalg.norm(queries, axis=1, keepdims=True), 1e-12)
+        scores = queries @ self.embeddings.T
+        if self.inv_norms is not None:
+            scores *= self.inv_norms
+        return scores
+
+    def _exact_scores(self, rows: np.ndarray, query: np.ndarray) -> np.ndarray:
+        """Cosine similarities of some rows to a unit-length query, reading only those rows."""
+        block = np.asarray(self.embeddings[rows], dtype=np.float32)
+        scores = block @ query
+        if not self.normalized:
+            scores /= np.maximum(np.linalg.norm(block, axis=1), 1e-12)
+        return scores
+
+    def _top_k_ann(self, query_embeddings: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Top k per query among the rows of the nprobe closest IVF lists.
+
+        Queries that find fewer than k candidates are padded with -inf and row -1.
+        """
+        queries = np.atleast_2d(np.asarray(query_embeddings, dtype=np.float32))
+        queries = queries / np.maximum(np.linalg.norm(queries, axis=1, keepdims=True), 1e-12)
+        top_scores = np.full((len(queries), k), -np.inf, dtype=np.float32)
+        top_rows = np.full((len(queries), k), -1, dtype=np.int64)
+        for i, query in enumerate(queries):
+            rows = np.sort(self.ann.probe(query, self.nprobe))
+            if not len(rows):
+                continue
+            scores = self._exact_scores(rows, query)
+            n = min(k, len(rows))
+            best = np.argpartition(-scores, n - 1)[:n] if n < len(rows) else np.arange(len(rows))
+            best = best[np.argsort(-scores[best])]
+            top_scores[i, :n] = scores[best]
+            top_rows[i, :n] = rows[best]
+        return top_scores, top_rows
+
+    def _top_k_quantized(
+        self, query_embeddings: np.ndarray, k: int
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Top k per query by the quantized matrix's scores, rescored exactly from the best
+        rescore * k of them unless rescore is 0."""
+        queries = np.atleast_2d(np.asarray(query_embeddings, dtype=np.float32))
+        queries = queries / np.maximum(np.linalg.norm(queries, axis=1, keepdims=True), 1e-12)
+        scores = self.quantized.scores(queries)
+        count = scores.shape[1]
+        n = min(count, k * self.rescore) if self.rescore else k
+        if n < count:
+            rows = np.argpartition(-scores, n - 1, axis=1)[:, :n]
+        else:
+            rows = np.tile(np.arange(count), (len(queries), 1))
+        if self.rescore:
+            # Sorted, so that a memory-mapped matrix is read in file order.
+            rows = np.sort(rows, axis=1)
+            scores = np.stack([self._exact_scores(query_rows, query)
+                               for query_rows, query in zip(rows, queries)])
+        else:
+            scores = np.take_along_axis(scores, rows, axis=1)
+        order = np.argsort(-scores, axis=1)[:, :k]
+        return np.take_along_axis(scores, order, axis=1), np.take_along_axis(rows, order, axis=1)
+
+    def top_k_batch(
+        self, query_embeddings: Sequence[Sequence[float]], k: Optional[int]
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Top k (similarities, row numbers) per query, best first, for a batch of queries.
+
+        k=None returns every row.
+        """
+        if self.ann is not None and k is not None and len(self.ids):
+            return self._top_k_ann(query_embeddings, min(k, len(self.ids)))
+        if self.quantized is not None and k and len(self.ids):
+            return self._top_k_quantized(query_embeddings, min(k, len(self.ids)))
+        scores = self.scores(np.atleast_2d(np.asarray(query_embeddings, dtype=np.float32)))
+        k = scores.shape[1] if k is None else min(k, scores.shape[1])
+        if k == 0:
+            empty = np.zeros((scores.shape[0], 0))
+            return empty, empty.astype(np.int64)
+        if k < scores.shape[1]:
+            rows = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        else:
+            rows = np.tile(np.arange(scores.shape[1]), (scores.shape[0], 1))
+        top_scores = np.take_along_axis(scores, rows, axis=1)
+        order = np.argsort(-top_scores, axis=1)
+        return np.take_along_axis(top_scores, order, axis=1), np.take_along_axis(rows, order, axis=1)
+
+    def top_k(self, query_embedding: Sequence[float], k: Optional[int]) -> Tuple[List[float], List]:
+        """Top k (similarities, ids) for one query, best first."""
+        similarities, rows = self.top_k_batch([query_embedding], k)
+        found = rows[0] >= 0
+        return similarities[0][found].tolist(), [self.ids[row] for row in rows[0][found]]
+
+    def retrieve(
+        self, query_embedding: Sequence[float], k: Optional[int]
+    ) -> Tuple[List[float], List[Node]]:
+        """Top k (similarities, Nodes) for one query, best first."""
+        similarities, ids = self.top_k(query_embedding, k)
+        return similarities, self.get_nodes(ids)
+
+
+def _min_max(scores: np.ndarray) -> np.ndarray:
+    low, high = scores.min(), scores.max()
+    if high - low < 1e-12:
+        return np.ones_like(scores) if high > 0 else np.zeros_like(scores)
+    return (scores - low) / (high - low)
+
+
+def get_retriever(index_struct: SimpleIndexDict) -> VectorRetriever:
+    """The retriever attached to an index struct, (re)built when its embeddings change.
+
+    FastVectorIndex drops it on every insert and delete; the row count is also checked, for
+    index structs changed by other index classes.
+    """
+    retriever = getattr(index_struct, "_retriever", None)
+    if retriever is None or (
+        not getattr(index_struct, "_retriever_is_external", False)
+        and len(retriever) != len(index_struct.embedding_dict)
+    ):
+        retriever = VectorRetriever.from_index_struct(index_struct)
+        index_struct._retriever = retriever
+    return retriever
+
+
+def get_leaf_retriever(index: GPTTreeIndex) -> VectorRetriever:
+    """A retriever over the leaves of a tree index, the chunks of its documents.
+
+    A tree index chooses its nodes with the LLM, level by level; scoring its leaves like the
+    nodes of a vector index lets it answer /retrieve and federated queries without any
+    completion. The leaves are embedded with the index's embed model on first use (through
+    the embedding cache, so only once), and the retriever is kept on the index struct.
+    """
+    index_struct = index.index_struct
+    retriever = getattr(index_struct, "_retriever", None)
+    if retriever is None:
+        leaves = [node for _, node in sorted(index_struct.all_nodes.items())
+                  if not node.child_indices]
+        texts = [node.get_text() for node in leaves]
+        embed_model = index.embed_model
+        if hasattr(embed_model, "embed_texts"):
+            embeddings = embed_model.embed_texts(texts)
+        else:
+            embeddings = [embed_model.get_text_embedding(text) for text in texts]
+        retriever = VectorRetriever(
+            np.asarray(embeddings, dtype=np.float32).reshape(len(leaves), -1),
+            [node.index for node in leaves],
+            lambda ids: [index_struct.all_nodes[i] for i in ids])
+        index_struct._retriever = retriever
+    return retriever
+
+
+class GPTFastVectorIndexQuery(GPTSimpleVectorIndexQuery):
+    """GPTSimpleVectorIndexQuery that retrieves nodes with a VectorRetriever.
+
+    Args:
+        on_retrieve: called with the retrieved nodes and their similarities before the
+            response is synthesized, e.g. to show the sources while the answer is written.
+        keyword_weight: weight of BM25 scores fused with the vector similarities, from 0
+            (vector only) to 1 (keywords only). See VectorRetriever.retrieve_hybrid.
+        retrieval: KEYWORD_RETRIEVAL to retrieve the nodes that best match the question's
+            terms with BM25 alone, without embedding the question. By default nodes are
+            retrieved by their embeddings, fused with keyword_weight.
+        response_mode: gpt_index's response modes, or EXTRACTIVE_RESPONSE_MODE to answer
+            with a span of the retrieved text when it covers the question with at least
+            extractive_threshold confidence, and otherwise with fallback_response_mode.
+    """
+
+    def __init__(
+        self,
+        *args,
+        on_retrieve: Optional[Callable[[List[Node], List[float]], None]] = None,
+        keyword_weight: float = 0.0,
+        retrieval: Optional[str] = None,
+        response_mode: str = ResponseMode.DEFAULT,
+        extractive_threshold: float = extractive.DEFAULT_THRESHOLD,
+        fallback_response_mode: str = ResponseMode.TREE_SUMMARIZE,
+        **kwargs,
+    ) -> None:
+        if retrieval not in (None, KEYWORD_RETRIEVAL):
+            raise ValueError(f"unknown retrieval {retrieval!r}: use {KEYWORD_RETRIEVAL!r} or None")
+        self.extractive = response_mode == EXTRACTIVE_RESPONSE_MODE
+        super().__init__(
+            *args, response_mode=fallback_response_mode if self.extractive else response_mode,
+            **kwargs)
+        self.on_retrieve = on_retrieve
+        self.keyword_weight = keyword_weight
+        self.retrieval = retrieval or ("hybrid" if keyword_weight else "vector")
+        self.extractive_threshold = extractive_threshold
+        self._retrieved = None
+
+    def _retrieve(self, query_str: str) -> Tuple[List[float], List[Node]]:
+        retriever = get_retriever(self._index_struct)
+        if self.retrieval == KEYWORD_RETRIEVAL:
+            return retriever.retrieve_keywords(query_str, self.similarity_top_k)
+        query_embedding = self._embed_model.get_query_embedding(query_str)
+        if self.keyword_weight:
+            return retriever.retrieve_hybrid(query_embedding, query_str, self.similarity_top_k,
+                                             self.keyword_weight)
+        return retriever.retrieve(query_embedding, self.similarity_top_k)
+
+    def _get_nodes_for_response(
+        self,
+        query_str: str,
+        similarity_tracker: Optional[SimilarityTracker] = None,
+    ) -> List[Node]:
+        """Get nodes for response."""
+        with tracing.span("retrieve", retrieval=self.retrieval) as span:
+            top_similarities, top_k_nodes = self._retrieve(query_str)
+            # Nodes of a vector index have no id of their own; each is one document chunk.
+            span.set(doc_ids=[node.ref_doc_id for node in top_k_nodes],
+                     similarities=[round(float(s), 4) for s in top_similarities])
+        if similarity_tracker is not None:
+            for node, similarity in zip(top_k_nodes, top_similarities):
+                similarity_tracker.add(node, similarity)
+        if self.on_retrieve is not None:
+            self.on_retrieve(top_k_nodes, list(top_similarities))
+
+        if logging.getLogger(__name__).getEffectiveLevel() == logging.DEBUG:
+            fmt_txts = [
+                f"> [Similarity score: {similarity:.6}] {truncate_text(node.get_text(), 100)}"
+                for node, similarity in zip(top_k_nodes, top_similarities)
+            ]
+            logging.debug(f"> Top {len(top_k_nodes)} nodes:\n" + "\n".join(fmt_txts))
+
+        return top_k_nodes
+
+    def get_nodes_and_similarities_for_response(
+        self, query_str: str
+    ) -> List[Tuple[Node, Optional[float]]]:
+        """Get list of tuples of node and similarity for response."""
+        if self._retrieved is not None:
+            # Retrieved already by an extractive attempt.
+            retrieved, self._retrieved = self._retrieved, None
+            return retrieved
+        return super().get_nodes_and_similarities_for_response(query_str)
+
+    def _give_response_for_nodes(self, query_str: str, text_chunks: List[str]) -> str:
+        """Give response for nodes."""
+        with tracing.span("synthesize", response_mode=self._response_mode.value,
+                          chunks=len(text_chunks)):
+            return super()._give_response_for_nodes(query_str, text_chunks)
+
+    def _query(self, query_str: str) -> Response:
+        """Answer a query."""
+        if not self.extractive:
+            return super()._query(query_str)
+        retrieved = self.get_nodes_and_similarities_for_response(query_str)
+        with tracing.span("synthesize", response_mode=EXTRACTIVE_RESPONSE_MODE,
+                          chunks=len(retrieved)) as span:
+            answer = extractive.extract_answer(
+                query_str, [node.get_text() for node, _ in retrieved],
+                get_retriever(self._index_struct).get_bm25().idf)
+            confidence = answer.confidence if answer is not None else 0.0
+            span.set(confidence=round(confidence, 3))
+        if confidence >= self.extractive_threshold:
+            node, similarity = retrieved[answer.node_position]
+            logging.debug(f"> Extractive answer, confidence {confidence:.3f}")
+            return Response(answer.text, source_nodes=[SourceNode.from_node(node, similarity)],
+                            extra_info={"extractive": True, "confidence": confidence})
+        logging.debug(f"> Extractive confidence {confidence:.3f}, synthesizing")
+        self._retrieved = retrieved
+        response = super()._query(query_str)
+        response.extra_info = {"extractive": False, "confidence": confidence}
+        return response
+
+
+class FastVectorIndex(GPTSimpleVectorIndex):
+    """GPTSimpleVectorIndex whose queries use vectorized top-k retrieval."""
+
+    @classmethod
+    def get_query_map(cls):
+        """Get query map."""
+        return {
+            QueryMode.DEFAULT: GPTFastVectorIndexQuery,
+            QueryMode.EMBEDDING: GPTFastVectorIndexQuery,
+        }
+
+    @classmethod
+    def from_store(cls, store: MmapVectorStore, **kwargs) -> "FastVectorIndex":
+        """Build a query-only index over an index_store file set.
+
+        Nodes are read from the store when they are retrieved, so the index struct itself
+        stays empty; inserting into this index is not supported.
+        """
+        index_struct = SimpleIndexDict(doc_id=store.doc_id)
+        index_struct._retriever = VectorRetriever.from_store(store)
+        index_struct._retriever_is_external = True
+        return cls(index_struct=index_struct, **kwargs)
+
+    def _insert(self, document, **insert_kwargs) -> None:
+        super()._insert(document, **insert_kwargs)
+        self._drop_retriever()
+
+    def _delete(self, doc_id: str, **delete_kwargs) -> None:
+        super()._delete(doc_id, **delete_kwargs)
+        self._drop_retriever()
+
+    def _drop_retriever(self) -> None:
+        """Rebuild the retriever on the next query: a document replaced by one with as many
+        chunks leaves the row count unchanged. Its ANN, BM25 and quantized indexes were
+        built for the old rows, so they go too."""
+        if not getattr(self.index_struct, "_retriever_is_external", False):
+            self.index_struct._retriever = None
+
+    def retrieve_batch(
+        self, queries: Sequence[str], similarity_top_k: int = 1
+    ) -> List[Tuple[List[float], List[Node]]]:
+        """Retrieve the top nodes for many questions, scoring them all in one product.
+
+        Returns (similarities, nodes) per question, without synthesizing any answer.
+        """
+        retriever = get_retriever(self.index_struct)
+        query_embeddings = [self._embed_model.get_query_embedding(q) for q in queries]
+        similarities, rows = retriever.top_k_batch(query_embeddings, similarity_top_k)
+        return [
+            (
+                sims[query_rows >= 0].tolist(),
+                retriever.get_nodes([retriever.ids[row] for row in query_rows if row >= 0]),
+            )
+            for sims, query_rows in zip(similarities, rows)
+        ]
+
+    def load_ann(self, index_path: str, nprobe: Optional[int] = None) -> bool:
+        """Use the IVF index saved next to index_path, if there is one (see ann.py)."""
+        ann_path = ann.get_ann_path(index_path)
+        if not os.path.exists(ann_path):
+            return False
+        return get_retriever(self.index_struct).set_ann(ann.IVFIndex.load(ann_path), nprobe)
+
+    def load_bm25(self, index_path: str) -> bool:
+        """Use the BM25 index saved next to index_path, if there is one (see bm25.py)."""
+        bm25_path = get_bm25_path(index_path)
+        if not os.path.exists(bm25_path):
+            return False
+        return get_retriever(self.index_struct).set_bm25(BM25Index.load(bm25_path))
+
+    def load_quantized(self, index_path: str, rescore: Optional[int] = None) -> bool:
+        """Score queries on the quantized embeddings saved next to index_path, if there are
+        any (see quantize.py)."""
+        quant_path = quantize.get_quant_path(index_path)
+        if not os.path.exists(quant_path):
+            return False
+        return get_retriever(self.index_struct).set_quantized(
+            QuantizedMatrix.load(quant_path), rescore)
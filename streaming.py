@@ -0,0 +1,110 @@
+"""Answer a query while showing its progress: sources as soon as they are retrieved, then the
+answer as it is written.
+
+stream_query runs index.query with a StreamingLLMPredictor, so the completion that writes
+the answer is streamed token by token while summaries and tree traversal complete as usual.
+Vector indexes report their sources before the answer is synthesized; other indexes choose
+their nodes with the LLM and report them with the response. Indexes served by index_server
+stream over HTTP.
+
+Nothing heavy is imported until a query runs.
+"""
+import time
+from typing import Callable, Optional
+
+STREAM_REFRESH_SECONDS = 0.05
+
+
+def format_sources(source_nodes, length=100):
+    """Like gpt_index's Response.get_formatted_sources, for any nodes with source_text and
+    doc_id."""
+    return "\n\n".join(
+        f"> Source (Doc id: {node.doc_id or 'None'}): {node.source_text[:length - 3]}..."
+        for node in source_nodes
+    )
+
+
+def stream_query(
+    index,
+    query_str: str,
+    on_token: Optional[Callable[[str, str], None]] = None,
+    on_sources: Optional[Callable[[list], None]] = None,
+    **query_kwargs,
+):
+    """index.query(query_str, **query_kwargs), reporting progress as it goes.
+
+    on_sources(source_nodes) is called once, with SourceNodes, and on_token(token, answer)
+    with each piece of the answer and the answer so far. Returns the Response.
+    The query is traced as a "query" span, see tracing.py.
+    """
+    import tracing
+
+    with tracing.span("query", query=query_str) as span:
+        response = _stream_query(index, query_str, on_token, on_sources, query_kwargs)
+        # E.g. whether the answer is extractive, and its confidence.
+        span.set(**(response.extra_info or {}))
+    return response
+
+
+def _stream_query(index, query_str, on_token, on_sources, query_kwargs):
+    if hasattr(index, "stream_query"):
+        return index.stream_query(query_str, on_token, on_sources, **query_kwargs)
+
+    from gpt_index.response.schema import SourceNode
+
+    from llm_scheduler import StreamingLLMPredictor
+    from retrieval import FastVectorIndex
+
+    sent_sources = []
+    streamed = []
+
+    def send_token(token, answer):
+        if not streamed:
+            streamed.append(True)
+        if on_token is not None:
+            on_token(token, answer)
+
+    def send_sources(source_nodes):
+        if on_sources is not None and not sent_sources:
+            sent_sources.append(True)
+            on_sources(source_nodes)
+
+    if isinstance(index, FastVectorIndex):
+        query_kwargs["on_retrieve"] = lambda nodes, similarities: send_sources(
+            [SourceNode.from_node(n, s) for n, s in zip(nodes, similarities)])
+    response = index.query(query_str, llm_predictor=StreamingLLMPredictor(send_token),
+                           **query_kwargs)
+    send_sources(response.source_nodes)
+    if not streamed and response.response:
+        # Not written by a streamed prompt, e.g. a tree traversal that could not pick a node
+        # returns the LLM's reply to the choice.
+        send_token(response.response, response.response)
+    return response
+
+
+class Throttle:
+    """Calls fn(*args) at most every interval seconds; flush() makes the last call.
+
+    Redrawing a component for every token would slow the page down more than the tokens
+    arrive.
+    """
+
+    def __init__(self, fn, interval=STREAM_REFRESH_SECONDS):
+        self.fn = fn
+        self.interval = interval
+        self.last = 0.0
+        self.pending = None
+
+    def __call__(self, *args):
+        now = time.perf_counter()
+        if now - self.last >= self.interval:
+            self.last = now
+            self.pending = None
+            self.fn(*args)
+        else:
+            self.pending = args
+
+    def flush(self):
+        if self.pending is not None:
+            self.fn(*self.pending)
+            self.pending = None
@@ -1,23 +1,20 @@
-"""Streamlit frontend + main langchain logic."""
-import os
-from gpt_index import GPTSimpleVectorIndex, GPTTreeIndex
-import streamlit as st
-from streamlit_chat import message
-
-from langchain.agents import initialize_agent, Tool
-from langchain.chains.conversation.memory import ConversationBufferMemory
-from langchain.chains import ConversationChain
-from langchain.llms import OpenAI
-from langchain import LLMMathChain, SerpAPIWrapper
+"""Streamlit frontend + main langchain logic.
 
-from crawler import Crawler
-import data_loader
+Only streamlit is imported up front, so the page renders quickly; gpt_index and langchain are
+imported when an index is loaded and when its agent is first built.
+"""
 import time
-from pathlib import Path
+
+START = time.perf_counter()
 
 from pprint import pformat
 
 import streamlit as st
+from streamlit_chat import message
+
+import index_catalog
+from index_catalog import FEDERATED_OPTION, option_files
+from index_manager import get_shared_manager
 
 st.set_page_config(
     page_title="YACC: Yet Another ChatGPT Customizer", page_icon=":robot:")
@@ -96,98 +93,109 @@ class bubble:
         )
 
 
-llm = OpenAI()
-
-@st.cache_resource
 def load_index(path, option=''):
-    print('loading index for: ' + option, path)
-    if option == "Gap Earnings":
-        return GPTTreeIndex.load_from_disk(path)
-    else:
-        return GPTSimpleVectorIndex.load_from_disk(path)
+    # Shared by every session, and kept within a memory budget: the least recently used
+    # indexes are dropped to make room (index_manager.py). With `python index_server.py
+    # serve` running, the server's loaded indexes are used instead.
+    return get_shared_manager().get(path)
 
 
-"""
-Given a path, return a dictionary of all indexes in this path.
-Key: Name of the index
-Value: Path of this index
-"""
-def gather_indexes(directory):
-    file_paths = {}
-    for file_or_folder in os.listdir(directory):
-        file_or_directory_path = os.path.join(directory, file_or_folder)
-        if not os.path.isfile(file_or_directory_path):
-            # skip folders
-            continue
-
-        filename = Path(file_or_directory_path).stem
-        # remove the prefix index_
-        filename = filename.replace("index_", "")
-        file_paths[filename] = file_or_directory_path
-    return file_paths
-
-# Each file should have a list of three things:
-# A name, description, and index filepath
-
-option_files = {
-    'Paul Graham essays': 'indexes/index_1676177220783.json',
-    # 'GPT Index documentation': 'indexes/index_1676182223692.json'),
-    'Marc Andreessen blog': 'indexes/index_pmarchive-com.json',
-    'The Jefferson Bible': 'indexes/index_bible.json',
-    'Gap Earnings': 'indexes/index_pdf.json'
-}
-
-
-@st.cache_resource
 def handle_index(option, input_url=''):
     # Skip crawling if using pre-generated index.
     if option != 'None':
-        print("Loading index:", option)
         # saved_indexes = gather_indexes("./indexes/")
         assert option in option_files
-        st.session_state["index"] = True
         return load_index(option_files[option], option)
     return None
 
 
 def query_index(index, query):
-    response = index.query(query, mode="default",
-                           response_mode="tree_summarize")
-    sources = response.get_formatted_sources(
-        length=2000)
-    print("\nSources:", sources)
-    st.text_area(label="Sources:", value=sources)
+    """Answer from the index, showing the sources as soon as they are retrieved and the
+    answer as it is written. Questions answered before are answered from the query cache."""
+    from query_cache import cached_query, get_shared_cache
+    from streaming import Throttle, format_sources
+
+    start = st.session_state.get("question_start", time.perf_counter())
+    sources_box = st.empty()
+    answer_box = st.empty()
+    first_token = []
+
+    def show_sources(source_nodes):
+        sources = format_sources(source_nodes, length=2000)
+        print(f"\nSources after {time.perf_counter() - start:.3f}s:", sources)
+        sources_box.text_area(label="Sources:", value=sources)
+
+    def show_answer(answer):
+        with answer_box:
+            bubble.bot(answer + " ▌")
+
+    show_answer = Throttle(show_answer)
+
+    def on_token(token, answer):
+        if not first_token:
+            first_token.append(time.perf_counter() - start)
+            print(f"first token after {first_token[0]:.3f}s")
+        show_answer(answer)
+
+    if st.session_state["option"] == FEDERATED_OPTION:
+        # index is name -> index. Not cached: the query cache is kept per index file.
+        from federated import federated_query, keyword_weight
+
+        weight = keyword_weight(st.session_state.get("retrieval"))
+        response = federated_query(index, query, on_token, show_sources, keyword_weight=weight)
+        answer_box.empty()
+        if first_token:
+            st.caption(f"{len(index)} indexes; first token after {first_token[0]:.2f}s, "
+                       f"answered after {time.perf_counter() - start:.2f}s")
+        return response
+
+    path = option_files[st.session_state["option"]]
+    response = cached_query(index, path, query, on_token, show_sources,
+                            **index_catalog.query_kwargs(path, st.session_state.get("retrieval"),
+                                                         st.session_state.get("extractive", False)))
+    extra_info = response.extra_info or {}
+    if extra_info.get("cached"):
+        print(f"{extra_info['cached']} cache hit; {get_shared_cache().format_stats()}")
+    elif extra_info.get("extractive"):
+        print(f"extractive answer, confidence {extra_info['confidence']:.2f}")
+    # The finished answer is shown with the rest of the conversation.
+    answer_box.empty()
+    if extra_info.get("cached"):
+        st.caption(f"Answered from the cache ({extra_info['cached']} match) after "
+                   f"{time.perf_counter() - start:.2f}s")
+    elif first_token:
+        st.caption(f"First token after {first_token[0]:.2f}s, answered after "
+                   f"{time.perf_counter() - start:.2f}s")
     return response
 
 
-def load_chain(index):
-    search = SerpAPIWrapper()
-    llm = OpenAI(temperature=0)
-    llm_math_chain = LLMMathChain(llm=llm, verbose=True)
-
-    tools = [
-        Tool(
-            name="PDF of Gap financials and earnings",
-            func=lambda q: str(query_index(index, q)),
-            description="PDF of financials and earnings from the company Gap filed to the SEC. If you have any question about Gap, use this tool. The input to this should be a natural language question. Always use this tool.",
-            return_direct=True
-        ),
-        # Tool(
-        #     name="Search",
-        #     func=search.run,
-        #     description="Look up something not in the Gap financials PDF."
-        # ),
-        # Tool(
-        #     name="Calculator",
-        #     func=llm_math_chain.run,
-        #     description="useful for when you need to answer questions about math"
-        # )
-    ]
-    memory = ConversationBufferMemory(memory_key="chat_history")
-    llm = OpenAI(temperature=0)
-    agent_chain = initialize_agent(
-        tools, llm, agent="conversational-react-description", memory=memory, verbose=True)
-    return agent_chain
+def get_index(option, selected=()):
+    """The index of an option, the selected indexes (name -> index) for the federated one, or
+    None."""
+    if option == FEDERATED_OPTION:
+        # Loaded together, so that none of them is evicted to make room for another.
+        available = index_catalog.gather_indexes(index_catalog.INDEX_DIR)
+        indexes = get_shared_manager().get_many([available[name] for name in selected])
+        return dict(zip(selected, indexes)) or None
+    return handle_index(option)
+
+
+def load_chain(option, get_index):
+    """The agent chain of this session for an index (option: its name, or the federated
+    option and the names of its indexes), which get_index() returns.
+
+    It is built on the first question and kept in the session state, so its conversation
+    memory survives reruns and later questions skip building it. It asks for the index on
+    every question rather than keeping it, so an index evicted from memory is not held on to.
+    """
+    chains = st.session_state.setdefault("chains", {})
+    if option not in chains:
+        from agent import build_agent
+
+        start = time.perf_counter()
+        chains[option] = build_agent(lambda q: str(query_index(get_index(), q)))
+        print(f"built agent for {option} in {time.perf_counter() - start:.3f}s")
+    return chains[option]
 
 
 def get_text():
@@ -207,18 +215,46 @@ if "past" not in st.session_state:
 
 option = st.selectbox(
     'Select a pre-generated index:',
-    ['None',] + list(option_files.keys()))
-
-index = handle_index(option)
+    ['None',] + list(option_files.keys()) + [FEDERATED_OPTION], key="option")
+
+print(f"first paint after {time.perf_counter() - START:.3f}s")
+# Loads the indexes pinned with INDEX_PRELOAD in the background, on the first run.
+manager = get_shared_manager()
+chain_key = option
+selected = ()
+if option == FEDERATED_OPTION:
+    # Every index in indexes/, or the ones picked here, asked at once (federated.py).
+    available = index_catalog.gather_indexes(index_catalog.INDEX_DIR)
+    selected = tuple(st.multiselect('Indexes:', sorted(available), default=sorted(available),
+                                    key="federated"))
+    chain_key = f"{option}: {', '.join(selected)}"
+index = get_index(option, selected)
+if index is not None:
+    st.session_state["index"] = True
+    if option == FEDERATED_OPTION:
+        st.radio('Retrieval:', list(index_catalog.RETRIEVAL_MODES), key="retrieval",
+                 horizontal=True)
+    elif not index_catalog.is_tree_index(option_files[option]):
+        # Read by query_index; tree indexes always choose their nodes with the LLM.
+        st.radio('Retrieval:', list(index_catalog.RETRIEVAL_MODES), key="retrieval",
+                 horizontal=True)
+        st.checkbox('Answer with a sentence from the sources when it covers the question '
+                    '(no LLM call)', value=False, key="extractive")
 
 if "index" in st.session_state:
-    chain = load_chain(index)
     user_input = get_text()
 
     if user_input:
+        import tracing
+
+        question_start = st.session_state["question_start"] = time.perf_counter()
+        chain = load_chain(chain_key, lambda: get_index(option, selected))
         prompt = "Call GPT Index: " + user_input
         print("\nFull Prompt:\n", prompt)
-        output = chain.run(input=prompt)
+        # The agent's steps and the index queries it makes are traced under this span.
+        with tracing.span("question", index=option):
+            output = chain.run(input=prompt)
+        print(f"answered in {time.perf_counter() - question_start:.3f}s")
 
         st.session_state.past.append(user_input)
         st.session_state.generated.append(output)
@@ -228,3 +264,5 @@ if "index" in st.session_state:
             message(st.session_state["generated"][i], key=str(i))
             message(st.session_state["past"][i],
                     is_user=True, key=str(i) + "_user")
+
+st.sidebar.caption(manager.format_stats())
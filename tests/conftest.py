@@ -0,0 +1,15 @@
+import os
+import sys
+
+# The modules under test live at the top of the repository, like the benchmarks import them.
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+# gpt_index builds an OpenAI client when it loads an index; no test sends it a request.
+os.environ.setdefault("OPENAI_API_KEY", "sk-test")
+# Completions and embeddings, if any, come from llm_scheduler.FakeBackend.
+os.environ.setdefault("LLM_BACKEND", "fake")
+
+# tiktoken would download its encodings; count tokens without network instead.
+from chunker import use_offline_encoding  # noqa: E402
+
+use_offline_encoding()
@@ -0,0 +1,61 @@
+import numpy as np
+import pytest
+
+from ann import IVFIndex
+from retrieval import VectorRetriever
+
+
+def clustered(rows, dim, clusters=8, seed=0):
+    rng = np.random.RandomState(seed)
+    centers = rng.randn(clusters, dim).astype(np.float32)
+    return centers[rng.randint(clusters, size=rows)] + 0.3 * rng.randn(rows, dim).astype(np.float32)
+
+
+def retrievers(embeddings, n_lists, nprobe):
+    ids = list(range(len(embeddings)))
+    exact = VectorRetriever(embeddings, ids, get_nodes=None)
+    approximate = VectorRetriever(embeddings, ids, get_nodes=None)
+    assert approximate.set_ann(IVFIndex.build(embeddings, ids, n_lists), nprobe)
+    return exact, approximate
+
+
+def test_recall_against_exact_search():
+    embeddings = clustered(500, 16)
+    exact, approximate = retrievers(embeddings, 16, nprobe=4)
+    queries = clustered(20, 16, seed=1)
+    _, exact_rows = exact.top_k_batch(queries, 10)
+    _, rows = approximate.top_k_batch(queries, 10)
+    recall = np.mean([len(set(a) & set(e)) / 10 for a, e in zip(rows, exact_rows)])
+    assert recall >= 0.9
+
+
+def test_probing_every_list_is_exact():
+    embeddings = clustered(200, 8)
+    exact, approximate = retrievers(embeddings, 10, nprobe=10)
+    queries = clustered(5, 8, seed=2)
+    exact_scores, exact_rows = exact.top_k_batch(queries, 7)
+    scores, rows = approximate.top_k_batch(queries, 7)
+    np.testing.assert_array_equal(rows, exact_rows)
+    np.testing.assert_allclose(scores, exact_scores, rtol=1e-5)
+
+
+def test_lists_partition_the_rows():
+    ivf = IVFIndex.build(clustered(100, 8), list(range(100)), n_lists=1000)
+    # Never more lists than rows.
+    assert ivf.n_lists == 100
+    assert sorted(ivf.list_rows.tolist()) == list(range(100))
+
+
+@pytest.mark.parametrize("embeddings", [[], np.zeros((0, 8), dtype=np.float32)])
+def test_empty_index(tmp_path, embeddings):
+    ivf = IVFIndex.build(embeddings, [])
+    assert ivf.n_lists == 0
+    assert len(ivf.probe(np.ones(8, dtype=np.float32) / np.sqrt(8), 4)) == 0
+    path = str(tmp_path / "index.ivf.npz")
+    ivf.save(path)
+    assert IVFIndex.load(path).n_lists == 0
+
+    retriever = VectorRetriever(np.zeros((0, 8), dtype=np.float32), [], get_nodes=None)
+    assert retriever.set_ann(ivf)
+    scores, rows = retriever.top_k_batch(np.ones((1, 8)), 3)
+    assert (rows == -1).all()
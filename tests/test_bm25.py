@@ -0,0 +1,88 @@
+import numpy as np
+import pytest
+from gpt_index.readers.schema.base import Document
+
+from bm25 import BM25Index, tokenize
+from retrieval import KEYWORD_RETRIEVAL, FastVectorIndex, get_retriever
+from test_retrieval import HashEmbedding
+
+TEXTS = [
+    "The loaves and the fishes were shared among the crowd.",
+    "Gap reported earnings per share of forty cents this quarter.",
+    "Fishes swim in the sea; fishes swim in rivers; fishes everywhere.",
+    "Nothing in this sentence matches.",
+]
+
+
+def test_tokenize_drops_stopwords_and_case():
+    assert tokenize("The Loaves AND the fishes") == ["loaves", "fishes"]
+
+
+def test_top_k_ranks_rows_containing_query_terms():
+    index = BM25Index.build(TEXTS, ["a", "b", "c", "d"])
+    scores, rows = index.top_k("fishes", 10)
+    # Only rows with the term are returned, the one that repeats it first.
+    assert list(rows) == [2, 0]
+    assert scores[0] > scores[1] > 0
+    scores, rows = index.top_k("earnings per share", 1)
+    assert list(rows) == [1]
+    assert len(index.top_k("unicorns", 3)[1]) == 0
+
+
+def test_rare_terms_weigh_more():
+    index = BM25Index.build(TEXTS, ["a", "b", "c", "d"])
+    assert index.idf("loaves") > index.idf("fishes")
+    assert index.idf("unicorns") >= index.idf("loaves")
+
+
+def test_save_and_load_round_trip(tmp_path):
+    index = BM25Index.build(TEXTS, ["a", "b", "c", "d"])
+    path = str(tmp_path / "index.bm25.npz")
+    index.save(path)
+    loaded = BM25Index.load(path)
+    assert loaded.terms == index.terms
+    assert loaded.text_ids == index.text_ids
+    for query in ("fishes", "loaves and fishes", "earnings per share", "unicorns"):
+        np.testing.assert_allclose(loaded.scores(query), index.scores(query))
+
+
+class CountingEmbedding(HashEmbedding):
+    """HashEmbedding that counts the questions it embeds."""
+
+    queries = 0
+
+    def _get_query_embedding(self, query):
+        self.queries += 1
+        return super()._get_query_embedding(query)
+
+
+def test_bm25_retrieval_does_not_embed_the_question():
+    embed_model = CountingEmbedding()
+    index = FastVectorIndex([Document(text) for text in TEXTS], embed_model=embed_model)
+    response = index.query("loaves", retrieval=KEYWORD_RETRIEVAL, response_mode="no_text",
+                           similarity_top_k=1)
+    assert embed_model.queries == 0
+    assert response.source_nodes[0].source_text == TEXTS[0]
+
+    index.query("loaves", response_mode="no_text", similarity_top_k=1)
+    assert embed_model.queries == 1
+
+
+def test_unknown_retrieval_is_rejected():
+    index = FastVectorIndex([Document(TEXTS[0])], embed_model=HashEmbedding())
+    with pytest.raises(ValueError):
+        index.query("loaves", retrieval="simple", response_mode="no_text")
+
+
+def test_hybrid_scores_bm25_once(monkeypatch):
+    index = FastVectorIndex([Document(text) for text in TEXTS], embed_model=HashEmbedding())
+    retriever = get_retriever(index.index_struct)
+    bm25 = retriever.get_bm25()
+    calls = []
+    scores = bm25.scores
+    monkeypatch.setattr(bm25, "scores", lambda query: calls.append(query) or scores(query))
+    query = "fishes in the sea"
+    _, _, rows = retriever.top_k_hybrid(
+        index.embed_model.get_query_embedding(query), query, 2, keyword_weight=1.0)
+    assert calls == [query]
+    assert rows[0] == 2
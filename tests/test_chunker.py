@@ -0,0 +1,90 @@
+import random
+
+import pytest
+import tiktoken
+
+from chunker import DEFAULT_ENCODING, Chunker, WordEncoding
+
+WORDS = "the crawler saves every page it finds and the index answers questions about them".split()
+
+
+def make_text(paragraphs=12, seed=0):
+    rng = random.Random(seed)
+    return "\n\n".join(
+        " ".join(" ".join(rng.choice(WORDS) for _ in range(rng.randint(4, 15))).capitalize() + "."
+                 for _ in range(rng.randint(1, 6)))
+        for _ in range(paragraphs))
+
+
+def tiktoken_encoding():
+    try:
+        return tiktoken.get_encoding(DEFAULT_ENCODING)
+    except Exception as e:  # Downloaded on first use.
+        pytest.skip(f"tiktoken encoding unavailable: {e!r}")
+
+
+@pytest.mark.parametrize("max_tokens", [8, 20, 64, 1000])
+def test_chunks_fit_and_join_back_to_the_text(max_tokens):
+    text = make_text()
+    chunker = Chunker(max_tokens, encoding=WordEncoding())
+    chunks = chunker.split_text(text)
+    assert all(chunker.count_tokens(chunk) <= max_tokens for chunk in chunks)
+    # Only whitespace between units is lost; a sentence too long for a chunk is cut
+    # between tokens, so its pieces join back without separators.
+    assert "".join("".join(chunks).split()) == "".join(text.split())
+    if max_tokens >= 20:
+        assert " ".join(chunks).split() == text.split()
+    if max_tokens == 1000:
+        assert chunks == [text]
+
+
+def test_overlap_repeats_whole_sentences_within_the_limit():
+    text = make_text()
+    chunker = Chunker(40, overlap_tokens=15, encoding=WordEncoding())
+    chunks = chunker.split_text(text)
+    assert len(chunks) > 2
+    overlaps = 0
+    for previous, chunk in zip(chunks, chunks[1:]):
+        assert chunker.count_tokens(chunk) <= 40
+        # The longest sentence-aligned prefix of chunk that ends previous.
+        sentences = chunk.replace("\n\n", " ").split(". ")
+        shared = [". ".join(sentences[:n]) for n in range(1, len(sentences))
+                  if previous.replace("\n\n", " ").endswith(". ".join(sentences[:n]) + ".")]
+        if shared:
+            overlaps += 1
+            assert chunker.count_tokens(shared[-1] + ".") <= 15
+    assert overlaps
+
+
+def test_run_longer_than_max_tokens_is_cut_between_tokens():
+    text = " ".join(["word%d" % i for i in range(50)])
+    chunker = Chunker(8, encoding=WordEncoding())
+    chunks = chunker.split_text(text)
+    assert [chunker.count_tokens(chunk) for chunk in chunks] == [8] * 6 + [2]
+    assert " ".join(chunks) == text
+
+
+def test_overlap_must_be_less_than_max_tokens():
+    with pytest.raises(ValueError):
+        Chunker(10, overlap_tokens=10, encoding=WordEncoding())
+
+
+def test_word_encoding_round_trips():
+    encoding = WordEncoding()
+    text = "Gap's EPS was $0.41,\n\n  up from last year!"
+    assert encoding.decode(encoding.encode(text)) == text
+    assert encoding.encode("up up") == encoding.encode("up") + encoding.encode(" up")[-1:]
+
+
+def test_word_encoding_chunks_like_tiktoken_on_ascii():
+    """Both encodings round-trip plain ASCII, and chunk it at the same sentence boundaries
+    when every paragraph fits in a chunk with either."""
+    text = make_text(paragraphs=6, seed=1)
+    offline, online = WordEncoding(), tiktoken_encoding()
+    assert offline.decode(offline.encode(text)) == text
+    assert online.decode(online.encode(text)) == text
+    longest = max(len(offline.encode(p)) for p in text.split("\n\n"))
+    assert longest >= max(len(online.encode(p)) for p in text.split("\n\n"))
+    assert (Chunker(longest, encoding=offline).split_text(text)
+            == Chunker(longest, encoding=online).split_text(text)
+            == text.split("\n\n"))
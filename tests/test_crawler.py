@@ -0,0 +1,106 @@
+import functools
+import os
+import socket
+import threading
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from crawler import Crawler
+from frontier import Frontier
+
+
+class QuietHandler(SimpleHTTPRequestHandler):
+    requests = []
+
+    def do_GET(self):
+        QuietHandler.requests.append(self.path)
+        super().do_GET()
+
+    def log_message(self, format, *args):
+        pass
+
+
+def page(title, links):
+    anchors = "".join('<a href="%s">%s</a>' % (link, link) for link in links)
+    return "<html><body><h1>%s</h1><p>Text of %s.</p>%s</body></html>" % (title, title, anchors)
+
+
+@pytest.fixture
+def site(tmp_path):
+    """index.html -> a.html, b.html, missing.html (404) and docs/; docs/ -> page.html, relative
+    to docs/; a.html -> deep.html, two hops from the index."""
+    root = tmp_path / "site"
+    (root / "docs").mkdir(parents=True)
+    (root / "index.html").write_text(page("Index", ["a.html", "b.html", "missing.html", "docs/"]))
+    (root / "a.html").write_text(page("A", ["deep.html", "index.html"]))
+    (root / "b.html").write_text(page("B", ["https://example.com/elsewhere.html"]))
+    (root / "deep.html").write_text(page("Deep", []))
+    (root / "docs" / "index.html").write_text(page("Docs", ["page.html"]))
+    (root / "docs" / "page.html").write_text(page("Docs page", []))
+    server = ThreadingHTTPServer(("127.0.0.1", 0),
+                                 functools.partial(QuietHandler, directory=str(root)))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    QuietHandler.requests = []
+    try:
+        yield "http://127.0.0.1:%d/" % server.server_address[1]
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def crawl(url, folder, mode, **kwargs):
+    crawler = Crawler(url, str(folder), use_cache=False, **kwargs)
+    if mode == "sync":
+        crawler.crawl(resume=False)
+    else:
+        crawler.crawl_async(concurrency=4, retries=1, timeout=5, resume=False)
+    return crawler
+
+
+def saved_files(folder):
+    return {name: open(os.path.join(folder, name)).read()
+            for name in os.listdir(folder) if name.endswith(".txt")}
+
+
+def test_async_crawl_writes_the_same_files_as_crawl(site, tmp_path):
+    crawl(site + "index.html", tmp_path / "sync", "sync", max_depth=2)
+    crawl(site + "index.html", tmp_path / "async", "async", max_depth=2)
+    files = saved_files(tmp_path / "sync")
+    assert files == saved_files(tmp_path / "async")
+    assert set(files) == {"index.txt", "a.txt", "b.txt", "deep.txt", "docs-.txt",
+                          "docs-page.txt"}
+    # docs/page.html was found from a relative link on the docs/ page.
+    assert "Docs page" in files["docs-page.txt"]
+
+
+@pytest.mark.parametrize("mode", ["sync", "async"])
+def test_depth_and_page_budget(site, tmp_path, mode):
+    crawl(site + "index.html", tmp_path / "depth", mode, max_depth=1)
+    assert "deep.txt" not in saved_files(tmp_path / "depth")
+    assert "docs-.txt" in saved_files(tmp_path / "depth")
+
+    crawl(site + "index.html", tmp_path / "budget", mode, max_depth=2, number_of_pages=3)
+    assert len(saved_files(tmp_path / "budget")) <= 3
+    assert "index.txt" in saved_files(tmp_path / "budget")
+
+
+@pytest.mark.parametrize("mode", ["sync", "async"])
+def test_missing_page_is_skipped_once(site, tmp_path, mode):
+    crawler = crawl(site + "index.html", tmp_path / mode, mode, max_depth=1)
+    assert QuietHandler.requests.count("/missing.html") == 1
+    assert "missing.txt" not in saved_files(tmp_path / mode)
+    # Nothing is left to resume: the failed page is done, not retried by the next run.
+    assert Frontier.load(crawler.state_dir).finished()
+
+
+@pytest.mark.parametrize("mode", ["sync", "async"])
+def test_refused_connection_is_skipped(tmp_path, mode):
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    url = "http://127.0.0.1:%d/" % port
+    crawler = crawl(url, tmp_path / mode, mode, timeout=2)
+    assert saved_files(tmp_path / mode) == {}
+    frontier = Frontier.load(crawler.state_dir)
+    assert frontier.finished() and frontier.pages_done == 1
@@ -0,0 +1,54 @@
+from gpt_index import GPTSimpleVectorIndex
+from gpt_index.readers.schema.base import Document
+
+from embedding_cache import CachedOpenAIEmbedding, EmbeddingCache
+from llm_scheduler import FakeBackend, Scheduler
+
+
+def make_embed_model(tmp_path):
+    backend = FakeBackend(dim=8)
+    embed_model = CachedOpenAIEmbedding(cache=EmbeddingCache(str(tmp_path / "cache.sqlite")),
+                                        scheduler=Scheduler(backend))
+    return embed_model, backend
+
+
+def test_embeddings_are_cached(tmp_path):
+    embed_model, backend = make_embed_model(tmp_path)
+    first = embed_model.embed_texts(["a", "b", "a"])
+    assert first[0] == first[2] == backend.embedding("a")
+    assert embed_model.embed_texts(["b", "a"]) == [first[1], first[0]]
+    assert backend.calls["embedded"] == 2
+
+
+def test_deferred_inserts_embed_in_one_request(tmp_path):
+    embed_model, backend = make_embed_model(tmp_path)
+    index = GPTSimpleVectorIndex([], embed_model=embed_model)
+    texts = [f"document number {i}" for i in range(5)]
+    with embed_model.deferred():
+        for text in texts:
+            index.insert(Document(text))
+        assert embed_model.num_deferred == 5
+        assert backend.calls["embed"] == 0
+    assert backend.calls["embed"] == 1
+    assert embed_model.num_deferred == 0
+
+    embedding_dict = index.index_struct.embedding_dict
+    nodes = [index.index_struct.nodes_dict[index.index_struct.id_map[text_id]]
+             for text_id in embedding_dict]
+    assert sorted(node.get_text() for node in nodes) == sorted(texts)
+    for text_id, node in zip(embedding_dict, nodes):
+        assert embedding_dict[text_id] == backend.embedding(node.get_text())
+
+
+def test_flush_embeds_what_was_deferred_so_far(tmp_path):
+    embed_model, backend = make_embed_model(tmp_path)
+    with embed_model.deferred():
+        first = embed_model.get_text_embedding("first")
+        embed_model.flush()
+        assert first == backend.embedding("first")
+        second = embed_model.get_text_embedding("second")
+        assert second == []
+    assert second == backend.embedding("second")
+    assert backend.calls["embed"] == 2
+    # Outside the block, embeddings are returned at once again.
+    assert embed_model.get_text_embedding("third") == backend.embedding("third")
@@ -0,0 +1,44 @@
+from extractive import (DEFAULT_THRESHOLD, NO_CONTENT_WEIGHT, answer_content, extract_answer,
+                        question_terms, sentences)
+
+
+def idf(term):
+    return 1.0
+
+
+def test_question_terms_drop_question_words():
+    assert question_terms("How many stores does Gap have?") == ["gap", "stores"]
+
+
+def test_sentences_split_on_ends_and_bullets():
+    text = "First one. Second one!\n\nThird\n• bullet point"
+    assert sentences(text) == ["First one.", "Second one!", "Third", "• bullet point"]
+
+
+def test_answer_content_is_numbers_and_names_outside_the_question():
+    terms = {"gap", "earnings", "per", "share"}
+    assert answer_content("Gap will discuss earnings per share on the call.", terms) == []
+    assert answer_content("Diluted EPS was $0.41.", terms) == ["EPS", "$0.41"]
+    assert answer_content("It opened in Paris in 2019.", terms) == ["Paris", "2019"]
+
+
+def test_span_restating_the_question_is_not_confident():
+    question = "What is Gap's earnings per share?"
+    text = "Gap will discuss earnings per share on the call. Diluted EPS was $0.41."
+    answer = extract_answer(question, [text], idf)
+    # The span has to reach the figure to count as an answer.
+    assert "$0.41" in answer.text
+    assert answer.confidence >= DEFAULT_THRESHOLD
+
+    answer = extract_answer(question, ["Gap will discuss earnings per share on the call."], idf)
+    assert answer.confidence == NO_CONTENT_WEIGHT
+    assert answer.confidence < DEFAULT_THRESHOLD
+
+
+def test_best_span_across_texts():
+    question = "When did the Paris store open?"
+    texts = ["The store sells shoes.", "Our Paris store opened in 2019. It is large."]
+    answer = extract_answer(question, texts, idf)
+    assert answer.text == "Our Paris store opened in 2019."
+    assert answer.node_position == 1
+    assert extract_answer("unrelated words", texts, idf) is None
@@ -0,0 +1,93 @@
+import os
+
+from crawler import Crawler, Page
+from frontier import Frontier, SeenSet, normalize_url
+
+
+def test_normalize_url():
+    assert (normalize_url("HTTP://Example.com:80/a/./b/?utm_source=x&z=1&a=2#top")
+            == "http://example.com/a/b/?a=2&z=1")
+    # "/a/" and "/a" can be different pages.
+    assert normalize_url("http://example.com/docs/") == "http://example.com/docs/"
+    assert normalize_url("http://example.com/docs") == "http://example.com/docs"
+    assert normalize_url("http://example.com") == "http://example.com/"
+
+
+def test_relative_links_resolve_against_the_page_url(tmp_path):
+    crawler = Crawler("http://example.com/docs/", output_folder=str(tmp_path), use_cache=False)
+    html = '<a href="page.html">Page</a> <a href="../up.html">Up</a> <a href="/root.html">Root</a>'
+    links = crawler.handle_page("http://example.com/docs/",
+                                Page(200, {}, html.encode(), html, "http://example.com/docs/"))
+    assert links == ["http://example.com/docs/", "http://example.com/docs/page.html",
+                     "http://example.com/root.html", "http://example.com/up.html"]
+
+    frontier = crawler.load_frontier(resume=False)
+    url, depth = frontier.pop()
+    for link in links:
+        frontier.add(link, depth + 1)
+    assert [url for url, _ in frontier.queue] == links[1:]
+
+    # After a redirect, links resolve against the URL that was served.
+    links = crawler.handle_page("http://example.com/docs",
+                                Page(200, {}, html.encode(), html, "http://example.com/docs/"))
+    assert "http://example.com/docs/page.html" in links
+
+
+def test_seen_set_across_merges(tmp_path):
+    seen = SeenSet(buffer_size=3)
+    urls = ["http://example.com/%d" % i for i in range(10)]
+    assert all(seen.add(url) for url in urls)
+    assert not seen.add(urls[0])
+    assert len(seen) == 10
+    assert all(url in seen for url in urls)
+    assert "http://example.com/other" not in seen
+
+    seen.save(str(tmp_path / "seen.bin"))
+    loaded = SeenSet.load(str(tmp_path / "seen.bin"))
+    assert len(loaded) == 10
+    assert all(url in loaded for url in urls)
+
+
+def test_frontier_resumes_in_progress_urls(tmp_path):
+    frontier = Frontier(max_depth=2, state_dir=str(tmp_path), seed="http://example.com/")
+    frontier.add("http://example.com/", 0)
+    url, depth = frontier.pop()
+    frontier.add("http://example.com/a", depth + 1)
+    frontier.save()
+
+    loaded = Frontier.load(str(tmp_path))
+    assert loaded.seed == "http://example.com/"
+    assert list(loaded.queue) == [("http://example.com/", 0), ("http://example.com/a", 1)]
+    assert not loaded.add("http://example.com/a", 1)
+
+
+def test_frontier_queue_newer_than_seen_set(tmp_path):
+    frontier = Frontier(max_depth=2, state_dir=str(tmp_path), seed="http://example.com/")
+    frontier.add("http://example.com/", 0)
+    frontier.save()
+    seen = open(tmp_path / Frontier.SEEN_FILE, "rb").read()
+    frontier.add("http://example.com/new", 1)
+    frontier.save()
+    # As if the process stopped after writing the queue, before the seen-set.
+    with open(tmp_path / Frontier.SEEN_FILE, "wb") as f:
+        f.write(seen)
+
+    loaded = Frontier.load(str(tmp_path))
+    assert ("http://example.com/new", 1) in loaded.queue
+    assert not loaded.add("http://example.com/new", 1)
+
+
+def test_crawler_does_not_resume_another_seed(tmp_path):
+    state_dir = str(tmp_path / "state")
+    frontier = Frontier(state_dir=state_dir, seed="http://example.com/")
+    frontier.add("http://example.com/", 0)
+    frontier.add("http://example.com/a", 1)
+    frontier.save()
+
+    crawler = Crawler("http://other.example/", output_folder=str(tmp_path / "out"),
+                      state_dir=state_dir, use_cache=False)
+    resumed = crawler.load_frontier()
+    assert list(resumed.queue) == [("http://other.example/", 0)]
+    crawler = Crawler("http://example.com/", output_folder=str(tmp_path / "out"),
+                      state_dir=state_dir, use_cache=False)
+    assert len(crawler.load_frontier()) == 2
@@ -0,0 +1,52 @@
+import json
+
+from http_cache import HttpCache, digest
+
+
+def make_cache(tmp_path):
+    return HttpCache(str(tmp_path / HttpCache.FILE_NAME))
+
+
+def test_store_save_and_reload(tmp_path):
+    page = tmp_path / "page.txt"
+    page.write_text("text")
+    cache = make_cache(tmp_path)
+    cache.store("http://example.com/", {"ETag": '"v1"'}, b"<html>", str(page),
+                ["http://example.com/a"])
+    cache.save()
+
+    cache = make_cache(tmp_path)
+    assert cache.request_headers("http://example.com/") == {"If-None-Match": '"v1"'}
+    assert cache.get_links("http://example.com/") == ["http://example.com/a"]
+    assert cache.is_unchanged("http://example.com/", 304, b"")
+    assert not cache.is_unchanged("http://example.com/", 200, b"<html>changed")
+    assert cache.changed_files() == [str(page)]
+
+
+def test_unchanged_200_refreshes_validators(tmp_path):
+    page = tmp_path / "page.txt"
+    page.write_text("text")
+    cache = make_cache(tmp_path)
+    cache.store("http://example.com/", {"ETag": '"v1"'}, b"<html>", str(page))
+    assert cache.is_unchanged("http://example.com/", 200, b"<html>",
+                              {"ETag": '"v2"', "Last-Modified": "Sat, 01 Jan 2000 00:00:00 GMT"})
+    assert cache.request_headers("http://example.com/") == {
+        "If-None-Match": '"v2"', "If-Modified-Since": "Sat, 01 Jan 2000 00:00:00 GMT"}
+
+
+def test_no_conditional_headers_without_the_file(tmp_path):
+    cache = make_cache(tmp_path)
+    cache.store("http://example.com/", {"ETag": '"v1"'}, b"<html>", str(tmp_path / "gone.txt"))
+    assert cache.request_headers("http://example.com/") == {}
+    assert not cache.is_unchanged("http://example.com/", 304, b"")
+
+
+def test_imports_the_legacy_json_cache(tmp_path):
+    page = tmp_path / "page.txt"
+    page.write_text("text")
+    entry = {"etag": '"v1"', "last_modified": None, "digest": digest(b"<html>"),
+             "file_path": str(page), "links": [], "changed_at": 1.0}
+    (tmp_path / HttpCache.LEGACY_FILE_NAME).write_text(json.dumps({"http://example.com/": entry}))
+    cache = make_cache(tmp_path)
+    assert len(cache) == 1
+    assert cache.get("http://example.com/") == entry
@@ -0,0 +1,95 @@
+import threading
+from types import SimpleNamespace
+
+import numpy as np
+
+import index_manager
+from index_manager import IndexManager, estimate_bytes
+from retrieval import VectorRetriever
+
+
+def fake_index(floats):
+    """An index that holds one embedding of the given number of floats."""
+    index_struct = SimpleNamespace(nodes_dict={}, embedding_dict={"node": [0.0] * floats})
+    return SimpleNamespace(index_struct=index_struct, docstore=SimpleNamespace(docs={}))
+
+
+class FakeLoader:
+    def __init__(self, floats=1000):
+        self.floats = floats
+        self.loads = []
+
+    def __call__(self, path):
+        self.loads.append(path)
+        return fake_index(self.floats)
+
+
+def make_manager(tmp_path, indexes_in_budget, pinned=()):
+    load = FakeLoader()
+    size = estimate_bytes(fake_index(load.floats))
+    manager = IndexManager(int(size * (indexes_in_budget + 0.5)), pinned=pinned, load=load)
+    paths = [str(tmp_path / f"index_{i}.json") for i in range(4)]
+    return manager, load, paths
+
+
+def test_least_recently_used_is_evicted(tmp_path):
+    manager, load, (a, b, c, _) = make_manager(tmp_path, 2)
+    first = manager.get(a)
+    manager.get(b)
+    assert manager.get(a) is first
+    manager.get(c)
+    assert a in manager and c in manager and b not in manager
+    assert manager.resident_bytes() <= manager.budget_bytes
+    assert len(load.loads) == 3
+    manager.get(b)
+    assert len(load.loads) == 4
+    assert manager.stats()["evictions"] == 2
+
+
+def test_pinned_indexes_are_never_evicted(tmp_path):
+    manager, _, (a, b, c, d) = make_manager(tmp_path, 2, pinned=[str(tmp_path / "index_0.json")])
+    manager.preload()
+    for path in (b, c, d):
+        manager.get(path)
+    assert a in manager and d in manager
+    assert len(manager) == 2
+
+
+def test_selection_is_kept_together(tmp_path, capsys):
+    manager, load, paths = make_manager(tmp_path, 2)
+    indexes = manager.get_many(paths[:3])
+    # None of them was evicted for another: the selection is over the budget instead.
+    assert all(path in manager for path in paths[:3])
+    assert len(set(map(id, indexes))) == 3
+    assert "over the" in capsys.readouterr().out
+    manager.get_many(paths[:3])
+    assert len(load.loads) == 3
+    manager.get(paths[3])
+    assert len(manager) == 2
+
+
+def test_size_is_estimated_again_once_a_retriever_is_attached(tmp_path, monkeypatch):
+    manager, _, (a, b, c, _) = make_manager(tmp_path, 3)
+    index = manager.get(a)
+    # A query builds a retriever, which holds far more than the budget.
+    index.index_struct._retriever = VectorRetriever(
+        np.zeros((1000, 64), dtype=np.float32), ["node"], get_nodes=None)
+    manager.get(b)
+    assert a not in manager and b in manager
+    estimates = []
+    monkeypatch.setattr(index_manager, "estimate_bytes",
+                        lambda index: estimates.append(index) or 0)
+    manager.get(c)
+    # Only the new index is estimated: b's retriever did not change.
+    assert len(estimates) == 1
+
+
+def test_concurrent_requests_load_once_and_drop_their_lock(tmp_path):
+    manager, load, (a, _, _, _) = make_manager(tmp_path, 2)
+    threads = [threading.Thread(target=manager.get, args=(a,)) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert load.loads == [a]
+    assert manager._loading == {}
@@ -0,0 +1,43 @@
+import pytest
+
+from index_server import IndexClient, IndexServer, serve
+
+
+class FailingServer(IndexServer):
+    """An IndexServer whose indexes load, but whose queries fail."""
+
+    def query(self, name_or_path, query, on_token=None, on_sources=None, **kwargs):
+        raise RuntimeError("the LLM is down")
+
+
+def start(indexes):
+    server = serve(0, indexes, preload=False, reload_interval=0)
+    return server, IndexClient(f"http://127.0.0.1:{server.server_port}", timeout=10)
+
+
+def test_stream_query_reports_an_index_that_does_not_load(tmp_path, capsys):
+    path = tmp_path / "broken.json"
+    path.write_text("not an index")
+    server, client = start(IndexServer({"broken": str(path)}))
+    try:
+        with pytest.raises(RuntimeError):
+            client.stream_query("broken", "anything")
+        with pytest.raises(KeyError):
+            client.stream_query("missing", "anything")
+        # The server is still answering.
+        assert client.healthy()
+    finally:
+        server.shutdown()
+    assert "could not load broken" in capsys.readouterr().out
+
+
+def test_stream_query_sends_an_error_line_when_the_query_fails(tmp_path, capsys):
+    indexes = FailingServer({"ok": str(tmp_path / "ok.json")})
+    indexes.entries["ok"].index = object()
+    server, client = start(indexes)
+    try:
+        with pytest.raises(RuntimeError, match="the LLM is down"):
+            client.stream_query("ok", "anything")
+    finally:
+        server.shutdown()
+    assert "query of ok failed" in capsys.readouterr().out
@@ -0,0 +1,84 @@
+import glob
+import json
+import os
+import shutil
+
+import numpy as np
+import pytest
+from gpt_index import GPTSimpleVectorIndex, GPTTreeIndex
+
+import index_store
+from retrieval import VectorRetriever
+
+INDEX_DIR = os.path.join(os.path.dirname(__file__), "..", "indexes")
+
+
+def vector_index_paths():
+    paths = []
+    for path in sorted(glob.glob(os.path.join(INDEX_DIR, "index_*.json"))):
+        with open(path) as f:
+            if "embedding_dict" in json.load(f)["index_struct"]:
+                paths.append(path)
+    return paths
+
+
+def copy_index(path, tmp_path):
+    copy = str(tmp_path / os.path.basename(path))
+    shutil.copy(path, copy)
+    return copy
+
+
+@pytest.mark.parametrize("path", vector_index_paths(), ids=os.path.basename)
+def test_round_trip(path, tmp_path):
+    path = copy_index(path, tmp_path)
+    index_store.convert(path)
+    assert index_store.has_store(path)
+    store = index_store.MmapVectorStore.from_index_path(path)
+    index_struct = GPTSimpleVectorIndex.load_from_disk(path).index_struct
+
+    assert store.text_ids == list(index_struct.embedding_dict)
+    nodes = index_struct.get_nodes(store.text_ids)
+    stored = store.get_nodes(range(store.count))
+    assert [node.get_text() for node in stored] == [node.get_text() for node in nodes]
+    assert [node.ref_doc_id for node in stored] == [node.ref_doc_id for node in nodes]
+    assert [node.extra_info for node in stored] == [node.extra_info for node in nodes]
+
+    from_json = VectorRetriever.from_index_struct(index_struct)
+    from_store = VectorRetriever.from_store(store)
+    rng = np.random.RandomState(0)
+    queries = np.asarray(from_json.embeddings) + 0.05 * rng.randn(*from_json.embeddings.shape)
+    k = min(3, store.count)
+    json_similarities, json_rows = from_json.top_k_batch(queries, k)
+    store_similarities, store_rows = from_store.top_k_batch(queries, k)
+    assert [[from_json.text_ids[row] for row in rows] for rows in json_rows] == \
+        [[from_store.text_ids[row] for row in rows] for rows in store_rows]
+    np.testing.assert_allclose(json_similarities, store_similarities, rtol=1e-5, atol=1e-6)
+
+
+def test_store_is_ignored_once_the_json_changes(tmp_path):
+    path = copy_index(vector_index_paths()[0], tmp_path)
+    index_store.convert(path)
+    with open(path, "a") as f:
+        f.write(" ")
+    assert index_store.store_exists(path)
+    assert not index_store.has_store(path)
+    index_store.convert(path)
+    assert index_store.has_store(path)
+
+
+def test_save_index_converts_the_store_again(tmp_path):
+    from data_loader import save_index
+
+    path = copy_index(vector_index_paths()[0], tmp_path)
+    index_store.convert(path)
+    index = GPTSimpleVectorIndex.load_from_disk(path)
+    index.index_struct.embedding_dict.popitem()
+    save_index(index, path)
+    assert index_store.has_store(path)
+    assert index_store.MmapVectorStore.from_index_path(path).count == \
+        len(index.index_struct.embedding_dict)
+
+    tree_path = copy_index(os.path.join(INDEX_DIR, "index_pdf.json"), tmp_path)
+    index_store.convert(path, index_store.get_store_prefix(tree_path))
+    save_index(GPTTreeIndex.load_from_disk(tree_path), tree_path)
+    assert not index_store.store_exists(tree_path)
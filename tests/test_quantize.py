@@ -0,0 +1,59 @@
+import numpy as np
+import pytest
+
+from quantize import QuantizedMatrix
+
+
+def unit_rows(count, dim, seed=0):
+    rows = np.random.RandomState(seed).randn(count, dim).astype(np.float32)
+    return rows / np.linalg.norm(rows, axis=1, keepdims=True)
+
+
+@pytest.mark.parametrize("dtype,bytes_per_value,tolerance", [("int8", 1, 0.02),
+                                                             ("float16", 2, 0.002)])
+def test_scores_approximate_cosine_similarities(dtype, bytes_per_value, tolerance):
+    # More rows than a scoring block, so that several blocks are scored.
+    embeddings = 3 * unit_rows(300, 32)
+    quantized = QuantizedMatrix.build(embeddings, list(range(300)), dtype)
+    assert quantized.dtype == dtype
+    assert quantized.codes.nbytes == 300 * 32 * bytes_per_value
+    queries = unit_rows(4, 32, seed=1)
+    expected = queries @ unit_rows(300, 32).T
+    np.testing.assert_allclose(quantized.scores(queries), expected, atol=tolerance)
+    np.testing.assert_allclose(quantized.dequantize([5, 7]), unit_rows(300, 32)[[5, 7]],
+                               atol=tolerance)
+
+
+def test_int8_rows_use_the_whole_range():
+    quantized = QuantizedMatrix.build(unit_rows(10, 16), list(range(10)), "int8")
+    assert (np.abs(quantized.codes).max(axis=1) == 127).all()
+
+
+def test_unknown_dtype_is_rejected():
+    with pytest.raises(ValueError):
+        QuantizedMatrix.build(unit_rows(2, 4), [0, 1], "int4")
+
+
+@pytest.mark.parametrize("dtype", ["int8", "float16"])
+def test_save_and_load_round_trip(tmp_path, dtype):
+    quantized = QuantizedMatrix.build(unit_rows(20, 8), [f"id{i}" for i in range(20)], dtype)
+    path = str(tmp_path / "index.quant.npz")
+    quantized.save(path)
+    loaded = QuantizedMatrix.load(path)
+    assert loaded.text_ids == quantized.text_ids
+    np.testing.assert_array_equal(loaded.codes, quantized.codes)
+    if dtype == "int8":
+        np.testing.assert_array_equal(loaded.scales, quantized.scales)
+    else:
+        assert loaded.scales is None
+
+
+@pytest.mark.parametrize("dtype", ["int8", "float16"])
+@pytest.mark.parametrize("embeddings", [[], np.zeros((0, 8), dtype=np.float32)])
+def test_empty_index(tmp_path, dtype, embeddings):
+    quantized = QuantizedMatrix.build(embeddings, [], dtype)
+    assert len(quantized) == 0
+    assert quantized.scores(np.ones((2, quantized.codes.shape[1]))).shape == (2, 0)
+    path = str(tmp_path / "index.quant.npz")
+    quantized.save(path)
+    assert len(QuantizedMatrix.load(path)) == 0
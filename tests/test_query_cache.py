@@ -0,0 +1,84 @@
+import os
+
+import pytest
+
+import query_cache
+from query_cache import QueryCache, normalize_query
+from test_retrieval import HashEmbedding
+
+KWARGS = {"mode": "default", "response_mode": "tree_summarize"}
+
+
+def answer(text):
+    return {"response": text, "source_nodes": [], "extra_info": None}
+
+
+@pytest.fixture
+def index_path(tmp_path):
+    path = tmp_path / "index_test.json"
+    path.write_text("{}")
+    return str(path)
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return QueryCache(str(tmp_path / "queries.sqlite"), similarity_threshold=0.9,
+                      embed_model=HashEmbedding())
+
+
+def test_normalize_query():
+    assert normalize_query("  What is Gap's   PROFIT?! ") == "what is gap's profit"
+
+
+def test_exact_hit_ignores_case_and_punctuation(cache, index_path):
+    assert cache.get(index_path, "What is Gap's profit?", KWARGS) is None
+    cache.put(index_path, "What is Gap's profit?", KWARGS, answer("a lot"))
+    body = cache.get(index_path, "what is gap's profit", KWARGS)
+    assert body["response"] == "a lot"
+    assert body["extra_info"]["cached"] == "exact"
+    assert cache.stats()["exact_hits"] == 1 and cache.stats()["misses"] == 1
+
+
+def test_semantic_hit_needs_a_similar_question(cache, index_path):
+    cache.put(index_path, "gap profit per share this quarter", KWARGS, answer("40 cents"))
+    body = cache.get(index_path, "this quarter gap profit per share", KWARGS)
+    assert body["extra_info"]["cached"] == "semantic"
+    assert body["extra_info"]["cached_query"] == "gap profit per share this quarter"
+    assert cache.get(index_path, "who wrote the jefferson bible", KWARGS) is None
+    assert cache.get(index_path, "this quarter gap profit per share", KWARGS,
+                     semantic=False) is None
+
+
+def test_answers_are_scoped_to_kwargs_and_index_version(cache, index_path):
+    cache.put(index_path, "question", KWARGS, answer("first"))
+    assert cache.get(index_path, "question", dict(KWARGS, retrieval="bm25")) is None
+    os.utime(index_path, (1, 1))
+    assert cache.get(index_path, "question", KWARGS) is None
+
+
+def test_expired_answers_are_not_returned(cache, index_path, monkeypatch):
+    now = 1000000.0
+    monkeypatch.setattr(query_cache.time, "time", lambda: now)
+    cache.put(index_path, "question", KWARGS, answer("old"))
+    now += cache.ttl + 1
+    assert cache.get(index_path, "question", KWARGS) is None
+    assert cache.get(index_path, "question?", KWARGS) is None
+    cache.put(index_path, "another question", KWARGS, answer("new"))
+    assert len(cache) == 1 and cache.stats()["expired"] == 1
+
+
+def test_least_recently_used_answers_are_evicted(tmp_path, index_path, monkeypatch):
+    cache = QueryCache(str(tmp_path / "queries.sqlite"), max_entries=2,
+                       embed_model=HashEmbedding())
+    now = 1000000.0
+    monkeypatch.setattr(query_cache.time, "time", lambda: now)
+    for question in ("one", "two"):
+        now += 1
+        cache.put(index_path, question, KWARGS, answer(question))
+    now += 1
+    assert cache.get(index_path, "one", KWARGS, semantic=False) is not None
+    now += 1
+    cache.put(index_path, "three", KWARGS, answer("three"))
+    assert cache.get(index_path, "two", KWARGS, semantic=False) is None
+    assert cache.get(index_path, "one", KWARGS, semantic=False) is not None
+    assert cache.stats()["evicted"] == 1
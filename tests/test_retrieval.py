@@ -0,0 +1,51 @@
+import hashlib
+from typing import List
+
+import numpy as np
+from gpt_index.embeddings.base import BaseEmbedding
+from gpt_index.readers.schema.base import Document
+
+from retrieval import FastVectorIndex, VectorRetriever, get_retriever
+
+
+class HashEmbedding(BaseEmbedding):
+    """Bag-of-words embeddings: texts that share words are similar."""
+
+    def _embed(self, text: str) -> List[float]:
+        vector = np.zeros(64)
+        for word in text.lower().split():
+            vector[hashlib.sha256(word.encode()).digest()[0] % 64] += 1
+        return vector.tolist()
+
+    def _get_query_embedding(self, query: str) -> List[float]:
+        return self._embed(query)
+
+    def _get_text_embedding(self, text: str) -> List[float]:
+        return self._embed(text)
+
+
+def test_top_k_batch_matches_brute_force():
+    rng = np.random.RandomState(0)
+    embeddings = rng.randn(50, 8).astype(np.float32)
+    retriever = VectorRetriever(embeddings, list(range(50)), get_nodes=None)
+    queries = rng.randn(3, 8)
+    similarities, rows = retriever.top_k_batch(queries, 5)
+    unit = embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+    for query, query_rows, query_similarities in zip(queries, rows, similarities):
+        expected = unit @ (query / np.linalg.norm(query))
+        assert list(query_rows) == list(np.argsort(-expected)[:5])
+        np.testing.assert_allclose(query_similarities, np.sort(expected)[::-1][:5], rtol=1e-5)
+
+
+def test_replaced_document_with_as_many_chunks_is_retrieved():
+    index = FastVectorIndex([Document("apples and pears", doc_id="a")],
+                            embed_model=HashEmbedding())
+    similarities, nodes = get_retriever(index.index_struct).retrieve(
+        index.embed_model.get_query_embedding("apples"), 1)
+    assert nodes[0].get_text() == "apples and pears"
+
+    index.delete("a")
+    index.insert(Document("rockets and moons", doc_id="b"))
+    similarities, nodes = get_retriever(index.index_struct).retrieve(
+        index.embed_model.get_query_embedding("rockets"), 1)
+    assert nodes[0].get_text() == "rockets and moons"
@@ -0,0 +1,277 @@
+"""Where the time of a question goes: spans, a JSONL sink and Prometheus metrics.
+
+A span records the wall time of one stage of answering a question, and what it handled:
+
+    load        index_catalog.load_index
+    cache       looking a question up in the query cache (query_cache.py), with the tier hit
+    query       one question to an index (streaming.stream_query, index_server, main.py), or
+                to several at once (federated.py)
+    embed       embedding texts (embedding_cache), with the number sent and tokens_in
+    retrieve    choosing the nodes of a vector index (retrieval.py), or of each index of a
+                federated query, with the doc_ids of the retrieved nodes and their
+                similarities
+    synthesize  writing the answer from the retrieved nodes
+    llm         one completion (llm_scheduler), with its prompt_type, tokens_in and tokens_out
+    agent       one reasoning step of the langchain agent (agent.py)
+    question    a question to the agent in the Streamlit app, with its steps and queries
+
+Spans nest: each records its trace (the id of the outermost span) and its parent. Token counts
+are llm_scheduler.estimate_tokens estimates, except the agent's, which the API reports.
+
+Tracing is off unless enabled, and span() then returns a shared no-op, so a stage costs one
+attribute check. Enable it with enable(), or with environment variables:
+
+    TRACE=1                     aggregate latency histograms and token counters
+    TRACE_JSONL=traces.jsonl    and append every finished span to a JSONL file
+    TRACE_METRICS_PORT=9108     and serve the histograms at http://localhost:9108/metrics
+
+`python index_server.py serve` always traces, and serves the same metrics at /metrics.
+"""
+import contextvars
+import json
+import os
+import random
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, List, Optional
+
+# Upper bounds of the latency histogram buckets, in seconds.
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+METRIC_PREFIX = "yacc"
+DEFAULT_METRICS_PORT = 9108
+
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+
+def _new_id() -> str:
+    return "%016x" % random.getrandbits(64)
+
+
+class Span:
+    """One traced stage; use as a context manager, or call finish().
+
+    set() adds attributes, e.g. tokens_out once the completion is known.
+    """
+
+    def __init__(self, tracer: "Tracer", name: str, attributes: dict) -> None:
+        parent = _current_span.get()
+        self.tracer = tracer
+        self.name = name
+        self.span_id = _new_id()
+        self.parent_id = parent.span_id if parent is not None else None
+        self.trace_id = parent.trace_id if parent is not None else self.span_id
+        self.attributes = attributes
+        self.start = time.time()
+        self.seconds = None
+        self._start = time.perf_counter()
+        self._token = _current_span.set(self)
+
+    def set(self, **attributes) -> None:
+        self.attributes.update(attributes)
+
+    def finish(self) -> None:
+        self.seconds = time.perf_counter() - self._start
+        try:
+            _current_span.reset(self._token)
+        except ValueError:
+            # Finished in another context than it started in, e.g. another thread.
+            pass
+        self.tracer.finish(self)
+
+    def to_dict(self) -> dict:
+        return dict(self.attributes, trace_id=self.trace_id, span_id=self.span_id,
+                    parent_id=self.parent_id, name=self.name, start=round(self.start, 6),
+                    seconds=round(self.seconds, 6))
+
+    def __enter__(self) -> "Span":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if exc_type is not None:
+            self.attributes["error"] = exc_type.__name__
+        self.finish()
+
+
+class _NoopSpan:
+    """What span() returns while tracing is off."""
+
+    def set(self, **attributes) -> None:
+        pass
+
+    def finish(self) -> None:
+        pass
+
+    def __enter__(self) -> "_NoopSpan":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+class Histograms:
+    """Latency histogram and token counters of each span name."""
+
+    def __init__(self, buckets=BUCKETS) -> None:
+        self.buckets = buckets
+        # Span name -> observations per bucket, the last one over every bound.
+        self.counts = {}
+        self.sums = Counter()
+        self.tokens = Counter()
+        self.lock = threading.Lock()
+
+    def observe(self, name: str, seconds: float, tokens_in: int = 0, tokens_out: int = 0):
+        bucket = next((i for i, bound in enumerate(self.buckets) if seconds <= bound),
+                      len(self.buckets))
+        with self.lock:
+            self.counts.setdefault(name, [0] * (len(self.buckets) + 1))[bucket] += 1
+            self.sums[name] += seconds
+            if tokens_in:
+                self.tokens[name, "in"] += tokens_in
+            if tokens_out:
+                self.tokens[name, "out"] += tokens_out
+
+    def prometheus_text(self) -> str:
+        """The histograms and counters in Prometheus' text exposition format."""
+        seconds = f"{METRIC_PREFIX}_span_seconds"
+        tokens = f"{METRIC_PREFIX}_span_tokens_total"
+        lines = [f"# HELP {seconds} Wall time of the traced stages of answering questions.",
+                 f"# TYPE {seconds} histogram"]
+        with self.lock:
+            for name, counts in sorted(self.counts.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets + ("+Inf",), counts):
+                    cumulative += count
+                    le = bound if isinstance(bound, str) else f"{bound:g}"
+                    lines.append(f'{seconds}_bucket{{span="{name}",le="{le}"}} {cumulative}')
+                lines.append(f'{seconds}_sum{{span="{name}"}} {self.sums[name]:.6f}')
+                lines.append(f'{seconds}_count{{span="{name}"}} {cumulative}')
+            lines += [f"# HELP {tokens} Tokens sent (in) and received (out) by traced stages.",
+                      f"# TYPE {tokens} counter"]
+            for (name, direction), count in sorted(self.tokens.items()):
+                lines.append(f'{tokens}{{span="{name}",direction="{direction}"}} {count}')
+        return "\n".join(lines) + "\n"
+
+
+class JsonlSink:
+    """Appends each finished span to a file, one JSON object per line."""
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        if os.path.dirname(path) and not os.path.exists(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        self._file = open(path, "a", buffering=1, encoding="utf-8")
+        self._lock = threading.Lock()
+
+    def __call__(self, span: dict) -> None:
+        line = json.dumps(span, default=str)
+        with self._lock:
+            self._file.write(line + "\n")
+
+
+class Tracer:
+    """Makes spans, aggregates them in histograms, and passes them on to sinks.
+
+    A sink is any callable taking the span as a dict, e.g. a JsonlSink or list.append.
+    """
+
+    def __init__(self, enabled: bool = False) -> None:
+        self.enabled = enabled
+        self.histograms = Histograms()
+        self.sinks: List[Callable[[dict], None]] = []
+
+    def span(self, name: str, **attributes):
+        if not self.enabled:
+            return NOOP_SPAN
+        return Span(self, name, attributes)
+
+    def finish(self, span: Span) -> None:
+        attributes = span.attributes
+        self.histograms.observe(span.name, span.seconds, attributes.get("tokens_in", 0),
+                                attributes.get("tokens_out", 0))
+        if self.sinks:
+            record = span.to_dict()
+            for sink in self.sinks:
+                sink(record)
+
+    def add_sink(self, sink: Callable[[dict], None]) -> None:
+        self.sinks.append(sink)
+
+    def remove_sink(self, sink: Callable[[dict], None]) -> None:
+        self.sinks.remove(sink)
+
+
+_shared_tracer: Optional[Tracer] = None
+_shared_lock = threading.Lock()
+
+
+def get_tracer() -> Tracer:
+    """The process-wide tracer, set up from TRACE, TRACE_JSONL and TRACE_METRICS_PORT."""
+    global _shared_tracer
+    if _shared_tracer is None:
+        with _shared_lock:
+            if _shared_tracer is None:
+                tracer = Tracer(enabled=bool(os.getenv("TRACE") or os.getenv("TRACE_JSONL")
+                                             or os.getenv("TRACE_METRICS_PORT")))
+                if os.getenv("TRACE_JSONL"):
+                    tracer.add_sink(JsonlSink(os.getenv("TRACE_JSONL")))
+                _shared_tracer = tracer
+                if os.getenv("TRACE_METRICS_PORT"):
+                    serve_metrics(int(os.getenv("TRACE_METRICS_PORT")))
+    return _shared_tracer
+
+
+def span(name: str, **attributes):
+    """A span of the shared tracer: `with tracing.span("retrieve") as s: ...; s.set(...)`."""
+    return get_tracer().span(name, **attributes)
+
+
+def enable(jsonl_path: Optional[str] = None) -> Tracer:
+    """Turn tracing on, also writing spans to jsonl_path if given."""
+    tracer = get_tracer()
+    tracer.enabled = True
+    if jsonl_path:
+        tracer.add_sink(JsonlSink(jsonl_path))
+    return tracer
+
+
+def format_spans(spans: List[dict]) -> str:
+    """Finished spans as an indented tree, in the order they started."""
+    depths = {}
+    lines = []
+    for record in sorted(spans, key=lambda s: s["start"]):
+        depth = depths[record["span_id"]] = depths.get(record["parent_id"], -1) + 1
+        details = " ".join(
+            f"{key}={value}" for key, value in record.items()
+            if key not in ("trace_id", "span_id", "parent_id", "name", "start", "seconds"))
+        lines.append(f"{'  ' * depth}{record['name']} {1000 * record['seconds']:.1f}ms "
+                     f"{details}".rstrip())
+    return "\n".join(lines)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        data = get_tracer().histograms.prometheus_text().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve_metrics(port: int = DEFAULT_METRICS_PORT) -> ThreadingHTTPServer:
+    """Serve the shared tracer's metrics at http://localhost:port/metrics, in a background
+    thread."""
+    server = ThreadingHTTPServer(("127.0.0.1", port), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server